@@ -1,12 +1,108 @@
 
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox
 import sqlite3
-from datetime import datetime, timedelta
-import hashlib
+from datetime import date
+from database import ConnectionManager
+from library_store import LibraryStore, LibraryError
+from search_cache import SearchCache
+from catalogue_cache import CatalogueCache
+
+class PagedTreeview:
+    """Keyset-paginated Treeview loader that keeps only a bounded window of rows in the widget"""
+    def __init__(self, tree, scrollbar, fetch_page, make_row, page_size=200, max_pages=4):
+        # fetch_page(after, limit, on_done) loads the records after the keyset cursor
+        # and passes them to on_done; make_row(record) returns (values, cursor)
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.make_row = make_row
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = []           # [start_cursor, item_ids, end_cursor] for each loaded page
+        self.evicted = []         # start cursors of pages dropped from the top
+        self.exhausted = False
+        self.loading = False
+        self.generation = 0       # bumped on reset so late pages from old filters are ignored
+        tree.configure(yscrollcommand=self.on_scroll)
+    
+    def reset(self):
+        self.generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self.pages = []
+        self.evicted = []
+        self.exhausted = False
+        self.loading = False
+        self.load_next(prefetch=True)
+    
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+        if float(last) > 0.9 and not self.exhausted:
+            self.load_next()
+        elif float(first) < 0.1 and self.evicted:
+            self.load_previous()
+    
+    def load_next(self, prefetch=False):
+        if self.exhausted or self.loading:
+            return
+        self.loading = True
+        generation = self.generation
+        start = self.pages[-1][2] if self.pages else None
+        
+        def loaded(records):
+            if generation != self.generation:
+                return
+            self.loading = False
+            if len(records) < self.page_size:
+                self.exhausted = True
+            if not records:
+                return
+            
+            items, cursor = [], start
+            for record in records:
+                values, cursor = self.make_row(record)
+                items.append(self.tree.insert("", tk.END, values=values))
+            self.pages.append([start, items, cursor])
+            
+            if len(self.pages) > self.max_pages:
+                # Drop the oldest page and keep the view on the same rows
+                dropped = self.pages.pop(0)
+                self.evicted.append(dropped[0])
+                self.tree.delete(*dropped[1])
+                self.tree.yview_scroll(-len(dropped[1]), "units")
+            
+            if prefetch:
+                self.load_next()  # one page beyond the visible rows
+        
+        self.fetch_page(start, self.page_size, loaded)
+    
+    def load_previous(self):
+        self.loading = True
+        generation = self.generation
+        start = self.evicted.pop()
+        
+        def loaded(records):
+            if generation != self.generation:
+                return
+            self.loading = False
+            items, cursor = [], start
+            for index, record in enumerate(records):
+                values, cursor = self.make_row(record)
+                items.append(self.tree.insert("", index, values=values))
+            self.pages.insert(0, [start, items, cursor])
+            self.tree.yview_scroll(len(items), "units")
+            
+            if len(self.pages) > self.max_pages:
+                dropped = self.pages.pop()
+                self.tree.delete(*dropped[1])
+                self.exhausted = False
+        
+        self.fetch_page(start, self.page_size, loaded)
 
 class LibraryGUI:
-    def __init__(self, root):
+    def __init__(self, root, db_name='library.db', server=None, token=None):
         self.root = root
         self.root.title("Library Management System")
         self.root.geometry("1200x750")
@@ -26,10 +122,18 @@ class LibraryGUI:
         self.root.configure(bg=self.bg_main)
         self.apply_styles()
         
-        self.db_name = 'library.db'
-        self.conn = None
-        self.cursor = None
+        self.db_name = db_name
+        self.server = server          # URL of an ILMS server; None opens db_name directly
+        self.token = token
+        self.db = None
+        self.store = None
+        self.executor = None
+        self.search_cache = SearchCache()
+        self.catalogue = CatalogueCache()
+        self.debounced = {}
         self.logged_in_user = None
+        self.screens = {}             # name -> frame of each screen built so far
+        self.current_screen = None    # (name, frame) on display
         
         self.init_database()
         self.show_login_screen()
@@ -79,13 +183,109 @@ class LibraryGUI:
                        font=("Segoe UI", 10), borderwidth=1, relief="solid")
 
     def init_database(self):
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS librarians (librarian_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, name TEXT NOT NULL, email TEXT)')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS books (book_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, author TEXT NOT NULL, isbn TEXT UNIQUE NOT NULL, publisher TEXT, publication_year INTEGER, total_copies INTEGER DEFAULT 1, available_copies INTEGER DEFAULT 1, category TEXT)')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS members (member_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT, phone TEXT, address TEXT, membership_date TEXT NOT NULL, status TEXT DEFAULT "active")')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS transactions (transaction_id INTEGER PRIMARY KEY AUTOINCREMENT, member_id INTEGER NOT NULL, book_id INTEGER NOT NULL, borrow_date TEXT NOT NULL, due_date TEXT NOT NULL, return_date TEXT, fine_amount REAL DEFAULT 0, status TEXT DEFAULT "borrowed", FOREIGN KEY(member_id) REFERENCES members(member_id), FOREIGN KEY(book_id) REFERENCES books(book_id))')
-        self.conn.commit()
+        if self.server:
+            from remote_store import RemoteStore
+            self.store = RemoteStore(self.server, self.token)
+            return
+        self.db = ConnectionManager(self.db_name)
+        self.store = LibraryStore(manager=self.db)
+    
+    def open_store(self):
+        """Open the store a worker thread uses: its own connection, or its own HTTP session in client mode"""
+        if self.server:
+            from remote_store import RemoteStore
+            return RemoteStore(self.server, self.token)
+        return LibraryStore(manager=self.db)
+    
+    def require_local_database(self, action):
+        """Return True if this desk opens library.db itself, otherwise explain that the action runs on the server"""
+        if self.db is None:
+            messagebox.showinfo("Not Available", f"{action} runs against the database file and is not available "
+                                                 f"when connected to {self.server}.\nRun it on the server machine.")
+            return False
+        return True
+    
+    def run_query(self, func, on_done=None, owner=None, key=None):
+        """Run func(store) on a database worker thread and hand the result to on_done on the Tk thread"""
+        def deliver(result):
+            if owner is not None and not owner.winfo_exists():
+                return
+            if on_done is not None:
+                on_done(result)
+        
+        if self.executor is None:
+            # The worker pool is started by the first background query rather than before the login screen
+            from query_executor import QueryExecutor
+            self.executor = QueryExecutor(self.open_store)
+        return self.executor.run_async(self.root, func, on_done=deliver, on_error=self.show_query_error, key=key)
+    
+    def search_catalogue(self, store, field, term):
+        """Search through the result cache and keep the books found in the catalogue cache for later lookups"""
+        version = self.catalogue.validate(store)
+        books = self.search_cache.search(store, field, term)
+        self.catalogue.put_many(books, version)
+        return books
+    
+    def debounce(self, key, func, delay=250):
+        """Call func once typing pauses for `delay` ms, dropping calls still waiting under the same key"""
+        pending = self.debounced.pop(key, None)
+        if pending:
+            self.root.after_cancel(pending)
+        
+        def fire():
+            self.debounced.pop(key, None)
+            func()
+        
+        self.debounced[key] = self.root.after(delay, fire)
+    
+    def sortable_headings(self, tree, sorts, order, refresh):
+        """Sort a paged listing in the database when one of its headings is clicked.
+        
+        `sorts` maps headings to SORT_KEYS names and `order` holds the current
+        "sort" and "descending"; a click updates it and calls refresh(), and a
+        second click on the same heading reverses the order. Returns the
+        function that redraws the ▲/▼ marker after `order` changes elsewhere.
+        """
+        def show_order():
+            for heading in tree["columns"]:
+                marker = ""
+                if order["sort"] is not None and sorts.get(heading) == order["sort"]:
+                    marker = " ▼" if order["descending"] else " ▲"
+                tree.heading(heading, text=heading + marker)
+        
+        def sort_by(heading):
+            if order["sort"] == sorts[heading]:
+                order["descending"] = not order["descending"]
+            else:
+                order["sort"], order["descending"] = sorts[heading], False
+            show_order()
+            refresh()
+        
+        for heading in sorts:
+            tree.heading(heading, command=lambda h=heading: sort_by(h))
+        show_order()
+        return show_order
+    
+    def export_window_data(self, table, filters):
+        """Export every row matching a window's current filters, not just the loaded page"""
+        if not self.require_local_database("Export"):
+            return
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(title="Export", defaultextension=".csv", filetypes=[
+            ("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Parquet", "*.parquet")])
+        if not path:
+            return
+        
+        from export import export_table
+        f = dict(filters)
+        self.run_query(lambda store: export_table(store, table, path, **f), 
+                       lambda result: messagebox.showinfo("Export Complete", f"Exported {result[0]:,} rows to\n{path}"))
+    
+    def show_query_error(self, error):
+        if isinstance(error, LibraryError):
+            messagebox.showerror("Error", str(error))
+        else:
+            messagebox.showerror("Database Error", f"The operation failed:\n{error}")
     
     def format_id(self, id_number, prefix="", digits=4):
         """Format ID with leading zeros (e.g., 0001, 0067)"""
@@ -95,12 +295,28 @@ class LibraryGUI:
         """Format member ID with 'mem' prefix (e.g., mem001, mem042)"""
         return f"mem{str(member_id).zfill(3)}"
 
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-
-    def clear_screen(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
+    def show_screen(self, name, build, cached=True):
+        """Show a full-window screen, building it with build(frame) only the first time it is shown.
+        
+        Cached screens are hidden rather than destroyed when another screen
+        is shown; the others are rebuilt on every visit.
+        """
+        current = self.current_screen
+        if current is not None:
+            if self.screens.get(current[0]) is current[1]:
+                current[1].pack_forget()
+            else:
+                current[1].destroy()
+        
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = ttk.Frame(self.root)
+            build(screen)
+            if cached:
+                self.screens[name] = screen
+        screen.pack(fill=tk.BOTH, expand=True)
+        self.current_screen = (name, screen)
+        return screen
 
     def setup_sub_window(self, title, size="900x650"):
         win = tk.Toplevel(self.root)
@@ -113,8 +329,10 @@ class LibraryGUI:
 
     # --- NAVIGATION SCREENS ---
     def show_login_screen(self):
-        self.clear_screen()
-        frame = ttk.Frame(self.root, padding="50")
+        self.show_screen("login", self.build_login_screen, cached=False)
+
+    def build_login_screen(self, screen):
+        frame = ttk.Frame(screen, padding="50")
         frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         
         ttk.Label(frame, text="ILMS", font=("Segoe UI", 36, "bold"), foreground=self.accent_primary).pack(pady=10)
@@ -129,21 +347,26 @@ class LibraryGUI:
         p_entry.pack(pady=(0, 25))
         
         def login():
-            self.cursor.execute('SELECT librarian_id, username FROM librarians WHERE username=? AND password_hash=?', 
-                               (u_entry.get(), self.hash_password(p_entry.get())))
-            result = self.cursor.fetchone()
-            if result:
-                self.logged_in_user = result[1]
-                self.show_main_menu()
-            else:
-                messagebox.showerror("Access Denied", "Invalid Credentials")
+            username, password = u_entry.get(), p_entry.get()
+            
+            def logged_in(result):
+                if result:
+                    self.logged_in_user = result[1]
+                    self.show_main_menu()
+                else:
+                    messagebox.showerror("Access Denied", "Invalid Credentials")
+            
+            # Authentication is a database query, so it goes through run_query like every other handler
+            self.run_query(lambda store: store.authenticate(username, password), logged_in, owner=frame)
 
         ttk.Button(frame, text="LOGIN", command=login, style="Accent.TButton").pack(pady=10, fill=tk.X, ipady=8)
         ttk.Button(frame, text="CREATE ACCOUNT", command=self.show_register_screen, style="Secondary.TButton").pack(fill=tk.X, ipady=6)
 
     def show_register_screen(self):
-        self.clear_screen()
-        frame = ttk.Frame(self.root, padding="50")
+        self.show_screen("register", self.build_register_screen, cached=False)
+
+    def build_register_screen(self, screen):
+        frame = ttk.Frame(screen, padding="50")
         frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         ttk.Label(frame, text="Create New Account", font=("Segoe UI", 24, "bold"), foreground=self.accent_primary).pack(pady=20)
         
@@ -156,23 +379,34 @@ class LibraryGUI:
             ents[f] = e
 
         def reg():
-            try:
-                self.cursor.execute('INSERT INTO librarians (username, password_hash, name) VALUES (?,?,?)',
-                                   (ents["Username"].get(), self.hash_password(ents["Password"].get()), ents["Full Name"].get()))
-                self.conn.commit()
-                messagebox.showinfo("Success", "Account created successfully!")
-                self.show_login_screen()
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Username already exists!")
+            username, password, name = ents["Username"].get(), ents["Password"].get(), ents["Full Name"].get()
+            
+            def create(store):
+                try:
+                    store.create_librarian(username, password, name)
+                    return True
+                except sqlite3.IntegrityError:
+                    return False
+            
+            def created(ok):
+                if ok:
+                    messagebox.showinfo("Success", "Account created successfully!")
+                    self.show_login_screen()
+                else:
+                    messagebox.showerror("Error", "Username already exists!")
+            
+            self.run_query(create, created, owner=frame)
 
         ttk.Button(frame, text="CREATE ACCOUNT", command=reg, style="Accent.TButton").pack(pady=15, fill=tk.X, ipady=8)
         ttk.Button(frame, text="BACK", command=self.show_login_screen, style="Secondary.TButton").pack(fill=tk.X, ipady=6)
 
     def show_main_menu(self):
-        self.clear_screen()
-        
+        self.show_screen("main", self.build_main_menu)
+        self.welcome_label.config(text=f"Welcome, {self.logged_in_user}" if self.logged_in_user else "Dashboard")
+
+    def build_main_menu(self, screen):
         # Main container
-        container = ttk.Frame(self.root)
+        container = ttk.Frame(screen)
         container.pack(fill=tk.BOTH, expand=True)
         
         # Top bar with header and logout
@@ -185,9 +419,8 @@ class LibraryGUI:
         
         ttk.Label(header_frame, text="Library Management", font=("Segoe UI", 28, "bold"), 
                  foreground=self.accent_primary).pack(anchor="w")
-        welcome_text = f"Welcome, {self.logged_in_user}" if self.logged_in_user else "Dashboard"
-        ttk.Label(header_frame, text=welcome_text, font=("Segoe UI", 11), 
-                 foreground=self.fg_muted).pack(anchor="w")
+        self.welcome_label = ttk.Label(header_frame, font=("Segoe UI", 11), foreground=self.fg_muted)
+        self.welcome_label.pack(anchor="w")
         
         # Logout button (right corner)
         logout_frame = ttk.Frame(top_bar)
@@ -195,7 +428,11 @@ class LibraryGUI:
         
         logout_btn = ttk.Button(logout_frame, text="🚪 Logout", command=self.logout, 
                                style="Danger.TButton")
-        logout_btn.pack(padx=5)
+        logout_btn.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(logout_frame, text="🩺 Diagnostics", command=self.diagnostics_window, 
+                  style="Secondary.TButton").pack(side=tk.RIGHT, padx=5)
+        ttk.Button(logout_frame, text="📈 Analytics", command=self.analytics_window, 
+                  style="Secondary.TButton").pack(side=tk.RIGHT, padx=5)
         
         # Main content area
         content = ttk.Frame(container)
@@ -218,10 +455,46 @@ class LibraryGUI:
         search_entry = ttk.Entry(search_inner, width=50)
         search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         
-        ttk.Button(search_inner, text="🔍 SEARCH", 
-                  command=lambda: self.search_book_window(search_combo.get(), search_entry.get()), 
+        open_search = lambda: self.search_book_window(search_combo.get(), search_entry.get())
+        ttk.Button(search_inner, text="🔍 SEARCH", command=open_search, 
                   style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         
+        # Live suggestions shown while typing
+        suggestions = tk.Listbox(search_section, height=6, bg=self.bg_tertiary, fg=self.fg_text, 
+                                 selectbackground=self.accent_secondary, relief="flat", 
+                                 highlightthickness=0, font=("Segoe UI", 10))
+        suggested = []
+        
+        def show_suggestions(books):
+            suggestions.delete(0, tk.END)
+            suggested[:] = books[:8]
+            for b in suggested:
+                suggestions.insert(tk.END, f"{self.format_id(b.book_id)}  {b.title} — {b.author}  "
+                                           f"({b.available_copies}/{b.total_copies} available)")
+            if suggested:
+                suggestions.pack(fill=tk.X, pady=(10, 0))
+            else:
+                suggestions.pack_forget()
+        
+        def live_search():
+            term, field = search_entry.get(), search_combo.get().lower()
+            if not term.strip():
+                show_suggestions([])
+                return
+            self.run_query(lambda store: self.search_catalogue(store, field, term), show_suggestions, 
+                           owner=search_entry, key="main.suggest")
+        
+        def open_suggestion(event):
+            selection = suggestions.curselection()
+            if selection:
+                self.search_book_window(search_combo.get(), suggested[selection[0]].title)
+        
+        search_entry.bind("<KeyRelease>", lambda e: self.debounce("main.suggest", live_search))
+        search_entry.bind("<Return>", lambda e: open_search())
+        search_combo.bind("<<ComboboxSelected>>", lambda e: live_search())
+        suggestions.bind("<Double-Button-1>", open_suggestion)
+        suggestions.bind("<Return>", open_suggestion)
+        
         # Grid for main menu cards
         cards_frame = ttk.Frame(content)
         cards_frame.pack(fill=tk.BOTH, expand=True)
@@ -299,14 +572,212 @@ class LibraryGUI:
         """Handle logout"""
         if messagebox.askyesno("Logout", "Are you sure you want to logout?"):
             self.logged_in_user = None
+            # The next librarian starts from freshly built screens
+            for screen in self.screens.values():
+                screen.destroy()
+            self.screens.clear()
+            self.current_screen = None
             self.show_login_screen()
 
+    # --- DIAGNOSTICS ---
+    def diagnostics_window(self):
+        win, main = self.setup_sub_window("Query Diagnostics", "1200x750")
+        
+        ttk.Label(main, text="🩺 Query Diagnostics", font=("Segoe UI", 20, "bold"), 
+                 foreground=self.accent_primary).pack(pady=(0, 20))
+        
+        profiler = self.db.profiler if self.db else None
+        if profiler is None:
+            ttk.Label(main, text="Query profiling is off.\nAdd a [profiling] section with enabled = true "
+                                 "to ilms.ini and restart to collect query timings.", 
+                     font=("Segoe UI", 11), foreground=self.fg_muted, justify=tk.CENTER).pack(pady=40)
+            return
+        
+        summary = ttk.Label(main, font=("Segoe UI", 10), foreground=self.fg_muted)
+        summary.pack(anchor="w", pady=(0, 10))
+        
+        # One row per query shape, most total time first
+        table_frame = ttk.Frame(main)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        
+        cols = ("Calls", "Total ms", "Mean ms", "p95 ms", "Max ms", "Rows", "Slow", "Query")
+        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=14)
+        for c in cols:
+            tree.heading(c, text=c)
+            tree.column(c, width=80, anchor=tk.E)
+        tree.column("Query", width=560, anchor=tk.W)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        # Full SQL, histogram and query plan of the selected shape
+        detail = tk.Text(main, height=12, bg=self.bg_tertiary, fg=self.fg_text, relief="flat", 
+                         font=("Consolas", 9), wrap=tk.WORD)
+        detail.pack(fill=tk.X, pady=(10, 0))
+        
+        shown = {}
+        
+        def show_detail(event=None):
+            selection = tree.selection()
+            detail.delete("1.0", tk.END)
+            if not selection:
+                return
+            q = shown[selection[0]]
+            histogram = "  ".join(f"{bucket} ms: {count}" for bucket, count in q["histogram"].items())
+            plan = "\n".join(q["plan"]) if q["plan"] else "(not slow yet; captured once a call exceeds the threshold)"
+            detail.insert(tk.END, f"{q['shape']}\n\nLatency: {histogram}\n"
+                                  f"p50 {q['p50_ms']} ms, p99 {q['p99_ms']} ms\n\nQuery plan:\n{plan}")
+        
+        def refresh():
+            queries = profiler.snapshot()
+            tree.delete(*tree.get_children())
+            shown.clear()
+            for q in queries:
+                item = tree.insert("", tk.END, values=(q["calls"], f"{q['total_ms']:.1f}", f"{q['mean_ms']:.2f}", 
+                                                       q["p95_ms"], f"{q['max_ms']:.1f}", q["rows"], q["slow"], 
+                                                       q["shape"]))
+                shown[item] = q
+            summary.config(text=f"{len(queries)} query shapes, {sum(q['calls'] for q in queries):,} calls since "
+                                f"{profiler.started:%H:%M:%S}; slow threshold {profiler.slow_query_ms:g} ms")
+            show_detail()
+        
+        def export():
+            from tkinter import filedialog
+            path = filedialog.asksaveasfilename(title="Export Query Profile", defaultextension=".json", 
+                                                filetypes=[("JSON", "*.json")])
+            if path:
+                profiler.dump(path)
+                messagebox.showinfo("Export Complete", f"Query profile written to\n{path}")
+        
+        tree.bind("<<TreeviewSelect>>", show_detail)
+        
+        button_frame = ttk.Frame(main)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(button_frame, text="REFRESH", command=refresh, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="RESET", command=lambda: (profiler.reset(), refresh()), 
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="EXPORT JSON", command=export, 
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+
+    def analytics_window(self):
+        win, main = self.setup_sub_window("Circulation Analytics", "1200x780")
+        
+        ttk.Label(main, text="📈 Circulation Analytics", font=("Segoe UI", 20, "bold"), 
+                 foreground=self.accent_primary).pack(pady=(0, 20))
+        
+        # Report options
+        filter_frame = ttk.LabelFrame(main, text="Report", padding="10")
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        today = date.today()
+        ttk.Label(filter_frame, text="From:").pack(side=tk.LEFT, padx=(0, 5))
+        start_entry = ttk.Entry(filter_frame, width=12)
+        # Default to the last twelve whole months, this one included
+        months_back = today.year * 12 + today.month - 12
+        start_entry.insert(0, date(months_back // 12, months_back % 12 + 1, 1).isoformat())
+        start_entry.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(filter_frame, text="To:").pack(side=tk.LEFT, padx=(15, 5))
+        end_entry = ttk.Entry(filter_frame, width=12)
+        end_entry.insert(0, today.isoformat())
+        end_entry.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(filter_frame, text="Trend by:").pack(side=tk.LEFT, padx=(15, 5))
+        by_combo = ttk.Combobox(filter_frame, values=["Day", "Week", "Month", "Year"], state="readonly", width=10)
+        by_combo.set("Month")
+        by_combo.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(filter_frame, text="Most borrowed:").pack(side=tk.LEFT, padx=(15, 5))
+        top_periods = {"This month": today.strftime("%Y-%m"), "This year": str(today.year), "All time": ""}
+        top_combo = ttk.Combobox(filter_frame, values=list(top_periods), state="readonly", width=12)
+        top_combo.set("This year")
+        top_combo.pack(side=tk.LEFT, padx=5)
+        
+        summary = ttk.Label(main, font=("Segoe UI", 10), foreground=self.fg_muted)
+        summary.pack(anchor="w", pady=(0, 10))
+        
+        def table(parent, cols, widths, height):
+            frame = ttk.Frame(parent)
+            tree = ttk.Treeview(frame, columns=cols, show='headings', height=height)
+            for c, width in zip(cols, widths):
+                tree.heading(c, text=c)
+                tree.column(c, width=width, anchor=tk.W if c in ("Title", "Category", "Period") else tk.E)
+            scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True)
+            return frame, tree
+        
+        upper = ttk.Frame(main)
+        upper.pack(fill=tk.BOTH, expand=True)
+        trend_group = ttk.LabelFrame(upper, text="Circulation Trend", padding="5")
+        trend_group.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
+        frame, trend_tree = table(trend_group, ("Period", "Loans", "Returns", "Overdue", "Fines"), 
+                                  (110, 80, 80, 80, 90), 12)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        top_group = ttk.LabelFrame(upper, text="Most Borrowed Titles", padding="5")
+        top_group.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0))
+        frame, top_tree = table(top_group, ("#", "Book ID", "Title", "Category", "Loans"), (40, 70, 280, 110, 70), 12)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        category_group = ttk.LabelFrame(main, text="Category Utilisation", padding="5")
+        category_group.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        frame, category_tree = table(category_group, ("Category", "Titles", "Copies", "On Loan Now", "Loans", 
+                                                      "Loans per Copy", "Overdue", "Fines"), 
+                                     (180, 80, 80, 100, 90, 110, 80, 100), 8)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        def show_reports(reports):
+            trend, top, categories = reports
+            trend_tree.delete(*trend_tree.get_children())
+            for r in trend:
+                trend_tree.insert("", tk.END, values=(r.period, f"{r.loans:,}", f"{r.returns:,}", f"{r.overdue:,}", 
+                                                      f"${r.fines:,.2f}"))
+            top_tree.delete(*top_tree.get_children())
+            for rank, t in enumerate(top, start=1):
+                top_tree.insert("", tk.END, values=(rank, self.format_id(t.book_id), t.title, t.category or "-", 
+                                                    f"{t.loans:,}"))
+            category_tree.delete(*category_tree.get_children())
+            for c in categories:
+                category_tree.insert("", tk.END, values=(c.category or "(uncategorised)", f"{c.titles:,}", 
+                                                         f"{c.total_copies:,}", f"{c.on_loan:,}", f"{c.loans:,}", 
+                                                         f"{c.loans_per_copy:.2f}", f"{c.overdue:,}", f"${c.fines:,.2f}"))
+            summary.config(text=f"{sum(r.loans for r in trend):,} loans, {sum(r.returns for r in trend):,} returns, "
+                                f"{sum(r.overdue for r in trend):,} became overdue, "
+                                f"${sum(r.fines for r in trend):,.2f} in fines charged over the period")
+        
+        def refresh():
+            try:
+                start = date.fromisoformat(start_entry.get().strip()) if start_entry.get().strip() else None
+                end = date.fromisoformat(end_entry.get().strip()) if end_entry.get().strip() else None
+            except ValueError:
+                messagebox.showerror("Error", "Please enter dates as YYYY-MM-DD!")
+                return
+            by, period = by_combo.get().lower(), top_periods[top_combo.get()]
+            
+            # All three reports read the rollup tables, so they come back together in a few milliseconds
+            self.run_query(lambda store: (store.circulation_trend(start, end, by), store.most_borrowed(period, 50), 
+                                          store.category_utilisation(start, end)), 
+                           show_reports, owner=win, key=f"{win}.analytics")
+        
+        by_combo.bind("<<ComboboxSelected>>", lambda e: refresh())
+        top_combo.bind("<<ComboboxSelected>>", lambda e: refresh())
+        ttk.Button(filter_frame, text="REFRESH", command=refresh, style="Accent.TButton").pack(side=tk.LEFT, padx=(15, 5))
+        
+        refresh()
+
     # --- BOOK MANAGEMENT ---
     def show_book_menu(self):
-        self.clear_screen()
-        
+        self.show_screen("books", self.build_book_menu)
+
+    def build_book_menu(self, screen):
         # Header with back button
-        header = ttk.Frame(self.root)
+        header = ttk.Frame(screen)
         header.pack(fill=tk.X, padx=30, pady=20)
         
         ttk.Label(header, text="📖 Book Management", font=("Segoe UI", 24, "bold"), 
@@ -316,7 +787,7 @@ class LibraryGUI:
                   style="Secondary.TButton").pack(side=tk.RIGHT)
         
         # Menu options
-        content = ttk.Frame(self.root)
+        content = ttk.Frame(screen)
         content.pack(fill=tk.BOTH, expand=True, padx=30, pady=10)
         
         # Create cards in a grid
@@ -327,7 +798,8 @@ class LibraryGUI:
             ("➕ Add New Book", "Add books to library", self.add_book_window),
             ("✏️ Update Book", "Modify book details", self.update_book_window),
             ("🗑️ Remove Book", "Delete books from system", self.remove_book_window),
-            ("📚 View All Books", "Browse complete inventory", self.view_all_books_window)
+            ("📚 View All Books", "Browse complete inventory", self.view_all_books_window),
+            ("📦 Bulk Import", "Import CSV, JSON Lines or MARC", self.bulk_import_window)
         ]
         
         for idx, (title, desc, cmd) in enumerate(options):
@@ -395,27 +867,51 @@ class LibraryGUI:
             try:
                 year = int(ents["year"].get()) if ents["year"].get() else None
                 copies = int(ents["copies"].get()) if ents["copies"].get() else 1
-                
-                self.cursor.execute('''INSERT INTO books 
-                    (title, author, isbn, publisher, publication_year, category, total_copies, available_copies) 
-                    VALUES (?,?,?,?,?,?,?,?)''',
-                    (ents["title"].get(), ents["author"].get(), ents["isbn"].get(), 
-                     ents["publisher"].get(), year, ents["category"].get(), copies, copies))
-                self.conn.commit()
-                book_id = self.cursor.lastrowid
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid numbers for year and copies!")
+                return
+            values = (ents["title"].get(), ents["author"].get(), ents["isbn"].get(),
+                      ents["publisher"].get(), year, ents["category"].get(), copies)
+            
+            def add(store):
+                try:
+                    return store.add_book(*values)
+                except sqlite3.IntegrityError:
+                    return None
+            
+            def added(book_id):
+                if book_id is None:
+                    messagebox.showerror("Error", "ISBN already exists!")
+                    return
                 formatted_id = self.format_id(book_id)
                 messagebox.showinfo("Success", f"Book added successfully!\nBook ID: {formatted_id}")
                 win.destroy()
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "ISBN already exists!")
-            except ValueError:
-                messagebox.showerror("Error", "Please enter valid numbers for year and copies!")
+            
+            self.run_query(add, added, owner=win)
 
         button_frame = ttk.Frame(main)
         button_frame.pack(pady=20, fill=tk.X)
         ttk.Button(button_frame, text="ADD BOOK", command=save, style="Accent.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
         ttk.Button(button_frame, text="CANCEL", command=win.destroy, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
 
+    def bulk_import_window(self):
+        if not self.require_local_database("Bulk import"):
+            return
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(title="Import Books", filetypes=[
+            ("Catalogue files", "*.csv *.jsonl *.ndjson *.mrc *.marc"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        from bulk_import import import_books
+        
+        def imported(report):
+            messagebox.showinfo("Import Complete", report.summary())
+        
+        messagebox.showinfo("Import Started", "The import is running in the background.\n"
+                                              "You will be notified when it finishes.")
+        self.run_query(lambda store: import_books(store, path), imported)
+
     def update_book_window(self):
         win, main = self.setup_sub_window("Update Book", "900x650")
         
@@ -460,44 +956,47 @@ class LibraryGUI:
         def load_book():
             try:
                 book_id = parse_id(id_entry.get())
-                self.cursor.execute('SELECT title, author, isbn, publisher, publication_year, category, total_copies FROM books WHERE book_id=?', (book_id,))
-                result = self.cursor.fetchone()
-                if result:
+            except ValueError:
+                messagebox.showerror("Error", "Please enter a valid book ID!")
+                return
+            
+            def show_book(book):
+                if book:
                     ents["title"].delete(0, tk.END)
-                    ents["title"].insert(0, result[0])
+                    ents["title"].insert(0, book.title)
                     ents["author"].delete(0, tk.END)
-                    ents["author"].insert(0, result[1])
+                    ents["author"].insert(0, book.author)
                     ents["isbn"].delete(0, tk.END)
-                    ents["isbn"].insert(0, result[2])
+                    ents["isbn"].insert(0, book.isbn)
                     ents["publisher"].delete(0, tk.END)
-                    ents["publisher"].insert(0, result[3] or "")
+                    ents["publisher"].insert(0, book.publisher or "")
                     ents["year"].delete(0, tk.END)
-                    ents["year"].insert(0, result[4] or "")
+                    ents["year"].insert(0, book.publication_year or "")
                     ents["category"].delete(0, tk.END)
-                    ents["category"].insert(0, result[5] or "")
+                    ents["category"].insert(0, book.category or "")
                     ents["copies"].delete(0, tk.END)
-                    ents["copies"].insert(0, result[6])
+                    ents["copies"].insert(0, book.total_copies)
                 else:
                     messagebox.showerror("Error", "Book not found!")
-            except ValueError:
-                messagebox.showerror("Error", "Please enter a valid book ID!")
+            
+            self.run_query(lambda store: self.catalogue.get(store, book_id), show_book, owner=win)
         
         def update():
             try:
                 book_id = parse_id(id_entry.get())
                 year = int(ents["year"].get()) if ents["year"].get() else None
                 copies = int(ents["copies"].get())
-                
-                self.cursor.execute('''UPDATE books SET 
-                    title=?, author=?, isbn=?, publisher=?, publication_year=?, category=?, total_copies=?
-                    WHERE book_id=?''',
-                    (ents["title"].get(), ents["author"].get(), ents["isbn"].get(),
-                     ents["publisher"].get(), year, ents["category"].get(), copies, book_id))
-                self.conn.commit()
-                messagebox.showinfo("Success", "Book updated successfully!")
-                win.destroy()
             except ValueError:
                 messagebox.showerror("Error", "Please enter valid numbers!")
+                return
+            values = (ents["title"].get(), ents["author"].get(), ents["isbn"].get(),
+                      ents["publisher"].get(), year, ents["category"].get(), copies)
+            
+            def updated(_):
+                messagebox.showinfo("Success", "Book updated successfully!")
+                win.destroy()
+            
+            self.run_query(lambda store: store.update_book(book_id, *values), updated, owner=win)
         
         ttk.Button(search_frame, text="LOAD", command=load_book, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         
@@ -535,13 +1034,21 @@ class LibraryGUI:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
         
-        def search():
+        def show_books(books):
             tree.delete(*tree.get_children())
-            query = f'%{search_entry.get()}%'
-            self.cursor.execute('SELECT book_id, title, author, isbn, total_copies FROM books WHERE title LIKE ? OR author LIKE ?', (query, query))
-            for r in self.cursor.fetchall():
-                formatted_id = self.format_id(r[0])
-                tree.insert("", tk.END, values=(formatted_id,) + r[1:], tags=(r[0],))
+            for b in books:
+                formatted_id = self.format_id(b.book_id)
+                tree.insert("", tk.END, values=(formatted_id, b.title, b.author, b.isbn, b.total_copies), tags=(b.book_id,))
+        
+        def find_books(store, term):
+            version = self.catalogue.validate(store)
+            books = store.list_books(term, fields=("title", "author"))
+            self.catalogue.put_many(books, version)
+            return books
+        
+        def search():
+            term = search_entry.get()
+            self.run_query(lambda store: find_books(store, term), show_books, owner=win, key=f"{win}.search")
         
         def remove():
             selected = tree.selection()
@@ -554,13 +1061,21 @@ class LibraryGUI:
             book_title = tree.item(selected[0])['values'][1]
             
             if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to remove '{book_title}'?"):
-                try:
-                    self.cursor.execute('DELETE FROM books WHERE book_id=?', (book_id,))
-                    self.conn.commit()
-                    messagebox.showinfo("Success", "Book removed successfully!")
-                    search()
-                except sqlite3.IntegrityError:
-                    messagebox.showerror("Error", "Cannot delete book with active transactions!")
+                def delete(store):
+                    try:
+                        store.delete_book(book_id)
+                        return True
+                    except sqlite3.IntegrityError:
+                        return False
+                
+                def deleted(ok):
+                    if ok:
+                        messagebox.showinfo("Success", "Book removed successfully!")
+                        search()
+                    else:
+                        messagebox.showerror("Error", "Cannot delete book with active transactions!")
+                
+                self.run_query(delete, deleted, owner=win)
         
         ttk.Button(search_frame, text="🔍 SEARCH", command=search, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         
@@ -572,7 +1087,7 @@ class LibraryGUI:
         search()
 
     def search_book_window(self, search_by="title", search_term=""):
-        win, main = self.setup_sub_window("Search Library", "1000x700")
+        win, main = self.setup_sub_window("Search Library", "1000x850")
         
         ttk.Label(main, text="🔍 Library Search", font=("Segoe UI", 20, "bold"), 
                  foreground=self.accent_primary).pack(pady=(0, 20))
@@ -595,33 +1110,95 @@ class LibraryGUI:
         table_frame.pack(fill=tk.BOTH, expand=True)
         
         cols = ("ID", "Title", "Author", "ISBN", "Publisher", "Year", "Category", "Available/Total")
-        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=20)
+        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=16)
         
         for c in cols:
             tree.heading(c, text=c)
             tree.column(c, width=120)
         
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
-
+        
+        order = {"sort": None, "descending": False}   # no sort: best matches first
+        query = {}
+        
+        def book_row(b):
+            copies_display = f"{b.available_copies}/{b.total_copies}"
+            values = (self.format_id(b.book_id), b.title, b.author, b.isbn, b.publisher, 
+                      b.publication_year, b.category, copies_display)
+            return values, self.store.page_cursor("books", query["sort"] or "book_id", b)
+        
+        def fetch_books(after, limit, on_done):
+            q = dict(query)
+            if q["sort"] is None:
+                # Ranked matches come from the search cache as a single page
+                if after is not None:
+                    on_done([])
+                    return
+                # A newer search supersedes one still running for this window
+                self.run_query(lambda store: self.search_catalogue(store, q["field"], q["term"]), on_done, 
+                               owner=win, key=f"{win}.search")
+            else:
+                self.run_query(lambda store: store.list_books(q["term"], fields=(q["field"],), after=after, limit=limit, 
+                                                              sort=q["sort"], descending=q["descending"]), 
+                               on_done, owner=win)
+        
+        pager = PagedTreeview(tree, scrollbar, fetch_books, book_row)
+        
+        # Titles borrowed together with the selected result
+        related_group = ttk.LabelFrame(main, text="Borrowed Together", padding="5")
+        related_group.pack(fill=tk.X, pady=(10, 0))
+        related_note = ttk.Label(related_group, text="Select a book to see what its borrowers also took out", 
+                                 font=("Segoe UI", 9), foreground=self.fg_muted)
+        related_note.pack(anchor="w", pady=(0, 5))
+        related_cols = ("ID", "Title", "Author", "Category", "Available", "Borrowed By")
+        related = ttk.Treeview(related_group, columns=related_cols, show='headings', height=5)
+        for c in related_cols:
+            related.heading(c, text=c)
+            related.column(c, width=300 if c == "Title" else 120)
+        related.pack(fill=tk.X)
+        
+        def show_related(title, books):
+            related.delete(*related.get_children())
+            for r in books:
+                related.insert("", tk.END, values=(self.format_id(r.book_id), r.title, r.author, r.category or "-", 
+                                                   r.available_copies, f"{r.score} members"))
+            related_note.config(text=f"Members who borrowed '{title}' also borrowed:" if books 
+                                else f"Nothing has been borrowed together with '{title}' yet")
+        
+        def select_book(event=None):
+            selection = tree.selection()
+            if not selection:
+                return
+            values = tree.item(selection[0], "values")
+            book_id, title = int(values[0]), values[1]
+            self.run_query(lambda store: store.similar_books(book_id), lambda books: show_related(title, books), 
+                           owner=win, key=f"{win}.related")
+        
+        tree.bind("<<TreeviewSelect>>", select_book)
+        
         def run_search():
-            tree.delete(*tree.get_children())
-            search_field = combo.get()
-            search_value = f'%{entry.get()}%'
-            
-            self.cursor.execute(f'''SELECT book_id, title, author, isbn, publisher, publication_year, category, 
-                                available_copies, total_copies FROM books WHERE {search_field} LIKE ?''', (search_value,))
-            
-            for r in self.cursor.fetchall():
-                copies_display = f"{r[7]}/{r[8]}"
-                formatted_id = self.format_id(r[0])
-                tree.insert("", tk.END, values=(formatted_id,) + r[1:-2] + (copies_display,))
+            query.update(term=entry.get(), field=combo.get().lower(), **order)
+            pager.reset()
+        
+        show_order = self.sortable_headings(tree, {"ID": "book_id", "Title": "title", "Author": "author", "ISBN": "isbn", 
+                                                   "Publisher": "publisher", "Year": "publication_year", 
+                                                   "Category": "category", "Available/Total": "available_copies"}, 
+                                            order, run_search)
+        
+        def clear():
+            entry.delete(0, tk.END)
+            order["sort"] = None
+            show_order()
+            run_search()
+        
+        # Search as you type
+        entry.bind("<KeyRelease>", lambda e: self.debounce(f"{win}.search", run_search))
+        combo.bind("<<ComboboxSelected>>", lambda e: run_search())
 
         ttk.Button(sf, text="🔍 SEARCH", command=run_search, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
-        ttk.Button(sf, text="CLEAR", command=lambda: (entry.delete(0, tk.END), run_search()), 
-                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(sf, text="CLEAR", command=clear, style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
         
         run_search()
 
@@ -668,7 +1245,6 @@ class LibraryGUI:
             tree.heading(c, text=c)
         
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
         
@@ -688,71 +1264,66 @@ class LibraryGUI:
         stats_labels['available'].pack(side=tk.LEFT, padx=20)
         stats_labels['issued'].pack(side=tk.LEFT, padx=20)
         
-        def refresh_books():
-            tree.delete(*tree.get_children())
-            
-            # Build query based on filters
-            search_term = f'%{search_entry.get()}%'
-            status_filter = status_combo.get()
-            
-            query = '''SELECT book_id, title, author, isbn, publisher, publication_year, category, 
-                       total_copies, available_copies FROM books 
-                       WHERE (title LIKE ? OR author LIKE ? OR isbn LIKE ?)'''
-            params = [search_term, search_term, search_term]
-            
-            if status_filter == "Available":
-                query += " AND available_copies > 0"
-            elif status_filter == "Out of Stock":
-                query += " AND available_copies = 0"
-            
-            query += " ORDER BY title"
-            
-            self.cursor.execute(query, params)
-            
-            total_books = 0
-            total_available = 0
-            total_issued = 0
-            
-            for r in self.cursor.fetchall():
-                formatted_id = self.format_id(r[0])
-                total_copies = r[7]
-                available_copies = r[8]
-                
-                # Determine status
-                if available_copies == 0:
-                    status = "❌ Out of Stock"
-                elif available_copies == total_copies:
-                    status = "✅ All Available"
-                else:
-                    status = f"⚠️ {total_copies - available_copies} Issued"
-                
-                tree.insert("", tk.END, values=(
-                    formatted_id, r[1], r[2], r[3], r[4] or "", r[5] or "", 
-                    r[6] or "", total_copies, available_copies, status
-                ))
-                
-                total_books += 1
-                total_available += available_copies
-                total_issued += (total_copies - available_copies)
+        def book_row(b):
+            # Determine status
+            if b.available_copies == 0:
+                status = "❌ Out of Stock"
+            elif b.available_copies == b.total_copies:
+                status = "✅ All Available"
+            else:
+                status = f"⚠️ {b.total_copies - b.available_copies} Issued"
             
-            # Update statistics
+            values = (self.format_id(b.book_id), b.title, b.author, b.isbn, b.publisher or "", 
+                      b.publication_year or "", b.category or "", b.total_copies, b.available_copies, status)
+            return values, self.store.page_cursor("books", filters["sort"], b)
+        
+        filters = {}
+        order = {"sort": "title", "descending": False}
+        
+        def fetch_books(after, limit, on_done):
+            f = dict(filters)
+            self.run_query(lambda store: store.list_books(after=after, limit=limit, **f), on_done, owner=win)
+        
+        pager = PagedTreeview(tree, scrollbar, fetch_books, book_row)
+        
+        def show_statistics(totals):
+            total_books, total_available, total_issued = totals
             stats_labels['total'].config(text=f"Total Books: {total_books}")
             stats_labels['available'].config(text=f"Available Copies: {total_available}")
             stats_labels['issued'].config(text=f"Currently Issued: {total_issued}")
         
+        def refresh_books():
+            # Apply the selected filters
+            filters["search"] = search_entry.get()
+            filters["status"] = {"Available": "available", "Out of Stock": "out_of_stock"}.get(status_combo.get())
+            filters.update(order)
+            pager.reset()
+            
+            search, status = filters["search"], filters["status"]
+            self.run_query(lambda store: store.book_totals(search, status), show_statistics, owner=win, 
+                           key=f"{win}.totals")
+        
+        self.sortable_headings(tree, {"ID": "book_id", "Title": "title", "Author": "author", "ISBN": "isbn", 
+                                      "Publisher": "publisher", "Year": "publication_year", "Category": "category", 
+                                      "Total": "total_copies", "Available": "available_copies"}, 
+                               order, refresh_books)
+        
         ttk.Button(filter_frame, text="🔍 SEARCH", command=refresh_books, 
                   style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         ttk.Button(filter_frame, text="REFRESH", command=refresh_books, 
                   style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="EXPORT", command=lambda: self.export_window_data("books", filters), 
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
         
         refresh_books()
 
     # --- MEMBER MANAGEMENT ---
     def show_member_menu(self):
-        self.clear_screen()
-        
+        self.show_screen("members", self.build_member_menu)
+
+    def build_member_menu(self, screen):
         # Header
-        header = ttk.Frame(self.root)
+        header = ttk.Frame(screen)
         header.pack(fill=tk.X, padx=30, pady=20)
         
         ttk.Label(header, text="👥 Member Management", font=("Segoe UI", 24, "bold"), 
@@ -762,7 +1333,7 @@ class LibraryGUI:
                   style="Secondary.TButton").pack(side=tk.RIGHT)
         
         # Content
-        content = ttk.Frame(self.root)
+        content = ttk.Frame(screen)
         content.pack(fill=tk.BOTH, expand=True, padx=30, pady=10)
         
         # Menu cards
@@ -832,14 +1403,14 @@ class LibraryGUI:
         group.columnconfigure(1, weight=1)
             
         def save():
-            self.cursor.execute('INSERT INTO members (name, email, phone, address, membership_date) VALUES (?,?,?,?,?)',
-                               (ents["name"].get(), ents["email"].get(), ents["phone"].get(), 
-                                ents["address"].get(), datetime.now().strftime('%Y-%m-%d')))
-            self.conn.commit()
-            member_id = self.cursor.lastrowid
-            formatted_id = self.format_member_id(member_id)
-            messagebox.showinfo("Success", f"Member registered successfully!\nMember ID: {formatted_id}")
-            win.destroy()
+            values = (ents["name"].get(), ents["email"].get(), ents["phone"].get(), ents["address"].get())
+            
+            def added(member_id):
+                formatted_id = self.format_member_id(member_id)
+                messagebox.showinfo("Success", f"Member registered successfully!\nMember ID: {formatted_id}")
+                win.destroy()
+            
+            self.run_query(lambda store: store.add_member(*values), added, owner=win)
         
         button_frame = ttk.Frame(main)
         button_frame.pack(pady=20, fill=tk.X)
@@ -852,6 +1423,14 @@ class LibraryGUI:
         ttk.Label(main, text="👥 Member Directory", font=("Segoe UI", 20, "bold"), 
                  foreground=self.accent_secondary).pack(pady=(0, 20))
         
+        # Search controls
+        filter_frame = ttk.LabelFrame(main, text="Find Member", padding="10")
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(filter_frame, text="Name, email, phone or ID (mem042):").pack(side=tk.LEFT, padx=5)
+        search_entry = ttk.Entry(filter_frame, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        
         # Table
         table_frame = ttk.Frame(main)
         table_frame.pack(fill=tk.BOTH, expand=True)
@@ -864,21 +1443,49 @@ class LibraryGUI:
             tree.column(c, width=150)
         
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
         
-        self.cursor.execute('SELECT member_id, name, email, phone, membership_date, status FROM members')
-        for r in self.cursor.fetchall():
-            formatted_id = self.format_member_id(r[0])
-            tree.insert("", tk.END, values=(formatted_id,) + r[1:])
+        filters = {}
+        order = {"sort": None, "descending": False}   # no sort: the column the search ranges over
+        
+        def member_row(m):
+            values = (self.format_member_id(m.member_id), m.name, m.email, m.phone, m.membership_date, m.status)
+            return values, self.store.page_cursor("members", filters["sort"], m)
+        
+        def fetch_members(after, limit, on_done):
+            f = dict(filters)
+            self.run_query(lambda store: store.list_members(after=after, limit=limit, **f), on_done, owner=win)
+        
+        pager = PagedTreeview(tree, scrollbar, fetch_members, member_row)
+        
+        def refresh_members():
+            filters["search"] = search_entry.get()
+            # Pages are keyed on the chosen column, or else whichever column the search form ranges over
+            filters["sort"] = order["sort"] or self.store.member_filter(filters["search"])[2]
+            filters["descending"] = order["descending"]
+            pager.reset()
+        
+        self.sortable_headings(tree, {"ID": "member_id", "Name": "name", "Email": "email", "Phone": "phone", 
+                                      "Joined": "membership_date", "Status": "status"}, order, refresh_members)
+        
+        # Search as you type
+        search_entry.bind("<KeyRelease>", lambda e: self.debounce(f"{win}.members", refresh_members))
+        
+        ttk.Button(filter_frame, text="🔍 SEARCH", command=refresh_members, 
+                  style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="CLEAR", command=lambda: (search_entry.delete(0, tk.END), refresh_members()), 
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        
+        refresh_members()
 
     # --- TRANSACTIONS ---
     def show_transaction_menu(self):
-        self.clear_screen()
-        
+        self.show_screen("transactions", self.build_transaction_menu)
+
+    def build_transaction_menu(self, screen):
         # Header
-        header = ttk.Frame(self.root)
+        header = ttk.Frame(screen)
         header.pack(fill=tk.X, padx=30, pady=20)
         
         ttk.Label(header, text="🔄 Transaction Management", font=("Segoe UI", 24, "bold"), 
@@ -888,7 +1495,7 @@ class LibraryGUI:
                   style="Secondary.TButton").pack(side=tk.RIGHT)
         
         # Content
-        content = ttk.Frame(self.root)
+        content = ttk.Frame(screen)
         content.pack(fill=tk.BOTH, expand=True, padx=30, pady=10)
         
         # Menu cards
@@ -898,7 +1505,10 @@ class LibraryGUI:
         options = [
             ("📤 Issue Book", "Lend book to member", self.borrow_book_window),
             ("📥 Return Book", "Process book return", self.return_book_window),
-            ("📊 Issued Books Status", "View currently issued books", self.view_issued_books_window)
+            ("📊 Issued Books Status", "View currently issued books", self.view_issued_books_window),
+            ("🧺 Batch Circulation", "Issue or return a stack of books", self.batch_circulation_window),
+            ("🔖 Holds Queue", "Reserve titles that are out of stock", self.holds_window),
+            ("📷 Scan Desk", "Check copies out and in by barcode", self.scan_desk_window)
         ]
         
         for idx, (title, desc, cmd) in enumerate(options):
@@ -934,7 +1544,7 @@ class LibraryGUI:
                     bg=self.bg_tertiary, fg=self.fg_muted).pack()
 
     def borrow_book_window(self):
-        win, main = self.setup_sub_window("Issue Book", "600x450")
+        win, main = self.setup_sub_window("Issue Book", "650x700")
         
         ttk.Label(main, text="📤 Issue Book to Member", font=("Segoe UI", 20, "bold"), 
                  foreground=self.accent_tertiary).pack(pady=(0, 20))
@@ -962,6 +1572,9 @@ class LibraryGUI:
         ttk.Label(group, text="Tip: Member ID as mem001, Book ID as 0001 or just 1", font=("Segoe UI", 8), 
                  foreground=self.fg_muted).grid(row=3, column=0, columnspan=2, pady=(5, 0))
         
+        book_preview = ttk.Label(group, text="", font=("Segoe UI", 9))
+        book_preview.grid(row=4, column=0, columnspan=2, pady=(10, 0))
+        
         group.columnconfigure(1, weight=1)
         
         def parse_id(id_str):
@@ -976,36 +1589,98 @@ class LibraryGUI:
         def process():
             try:
                 days = int(ents["duration"].get())
-                due = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
                 
                 # Parse IDs
                 member_id = parse_id(ents["member"].get())
                 book_id = parse_id(ents["book"].get())
-                
-                # Check if book is available
-                self.cursor.execute('SELECT available_copies, title FROM books WHERE book_id=?', (book_id,))
-                result = self.cursor.fetchone()
-                
-                if not result or result[0] <= 0:
-                    messagebox.showerror("Error", "Book not available or doesn't exist!")
-                    return
-                
-                # Verify member exists
-                self.cursor.execute('SELECT name FROM members WHERE member_id=?', (member_id,))
-                member = self.cursor.fetchone()
-                if not member:
-                    messagebox.showerror("Error", "Member not found!")
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid IDs and duration!")
+                return
+            
+            def issue(store):
+                try:
+                    return store.borrow_book(member_id, book_id, days)
+                except LibraryError:
+                    book = store.get_book(book_id)
+                    if book is None or book.available_copies > 0:
+                        raise
+                    # No copy left: report the queue so the desk can offer a hold instead
+                    return book, None, len(store.list_holds(book_id=book_id, status="waiting"))
+            
+            def held(hold):
+                messagebox.showinfo("Hold Placed", f"{hold.member_name} is number {hold.position} in the queue "
+                                                   f"for '{hold.title}'")
+                win.destroy()
+            
+            def issued(result):
+                book, member, due = result
+                if member is None:
+                    if messagebox.askyesno("Not Available", f"No copies of '{book.title}' are available "
+                                                            f"({due} members waiting).\n\n"
+                                                            f"Place a hold for this member?"):
+                        self.run_query(lambda store: store.place_hold(member_id, book_id), held, owner=win)
                     return
-                
-                self.cursor.execute('INSERT INTO transactions (member_id, book_id, borrow_date, due_date) VALUES (?,?,?,?)',
-                                   (member_id, book_id, datetime.now().strftime('%Y-%m-%d'), due))
-                self.cursor.execute('UPDATE books SET available_copies=available_copies-1 WHERE book_id=?', (book_id,))
-                self.conn.commit()
-                
-                messagebox.showinfo("Success", f"Book '{result[1]}' issued to {member[0]}\nDue date: {due}")
+                messagebox.showinfo("Success", f"Book '{book.title}' issued to {member.name}\nDue date: {due}")
                 win.destroy()
+            
+            self.run_query(issue, issued, owner=win)
+        
+        def show_preview(book):
+            if book is None:
+                book_preview.config(text="Book not found", foreground=self.accent_danger)
+            else:
+                book_preview.config(text=f"{book.title} by {book.author} — {book.available_copies} of {book.total_copies} available",
+                                    foreground=self.accent_tertiary if book.available_copies else self.accent_danger)
+        
+        def preview_book():
+            try:
+                book_id = parse_id(ents["book"].get())
             except ValueError:
-                messagebox.showerror("Error", "Please enter valid IDs and duration!")
+                book_preview.config(text="")
+                return
+            self.run_query(lambda store: self.catalogue.get(store, book_id), show_preview, 
+                           owner=win, key=f"{win}.preview")
+        
+        # Show the title as the Book ID is typed; repeat lookups come from the catalogue cache
+        ents["book"].bind("<KeyRelease>", lambda e: self.debounce(f"{win}.preview", preview_book, delay=150))
+        
+        # Suggestions from what other members borrowed together with this member's recent loans
+        suggest_group = ttk.LabelFrame(main, text="Suggested for this Member", padding="5")
+        suggest_group.pack(fill=tk.X, pady=(10, 0))
+        suggest_cols = ("ID", "Title", "Author", "Available")
+        suggestions = ttk.Treeview(suggest_group, columns=suggest_cols, show='headings', height=5)
+        for c in suggest_cols:
+            suggestions.heading(c, text=c)
+            suggestions.column(c, width=260 if c == "Title" else 90)
+        suggestions.pack(fill=tk.X)
+        ttk.Label(suggest_group, text="Double-click a suggestion to issue it", font=("Segoe UI", 8), 
+                 foreground=self.fg_muted).pack(anchor="w", pady=(5, 0))
+        
+        def show_suggestions(books):
+            suggestions.delete(*suggestions.get_children())
+            for r in books:
+                suggestions.insert("", tk.END, values=(self.format_id(r.book_id), r.title, r.author, r.available_copies))
+        
+        def suggest():
+            try:
+                member_id = parse_id(ents["member"].get())
+            except ValueError:
+                member_id = 0
+            if not member_id:
+                show_suggestions([])
+                return
+            self.run_query(lambda store: store.suggest_for_member(member_id), show_suggestions, 
+                           owner=win, key=f"{win}.suggest")
+        
+        def pick_suggestion(event):
+            selection = suggestions.selection()
+            if selection:
+                ents["book"].delete(0, tk.END)
+                ents["book"].insert(0, suggestions.item(selection[0], "values")[0])
+                preview_book()
+        
+        ents["member"].bind("<KeyRelease>", lambda e: self.debounce(f"{win}.suggest", suggest))
+        suggestions.bind("<Double-1>", pick_suggestion)
         
         button_frame = ttk.Frame(main)
         button_frame.pack(pady=20, fill=tk.X)
@@ -1039,41 +1714,389 @@ class LibraryGUI:
         def process():
             try:
                 transaction_id = parse_id(t_e.get())
-                
-                self.cursor.execute('SELECT book_id, due_date, status FROM transactions WHERE transaction_id=?', (transaction_id,))
-                res = self.cursor.fetchone()
-                
-                if res:
-                    if res[2] == "returned":
-                        messagebox.showwarning("Warning", "This book has already been returned!")
-                        return
-                    
-                    # Calculate fine if overdue
-                    due_date = datetime.strptime(res[1], '%Y-%m-%d')
-                    days_late = (datetime.now() - due_date).days
-                    fine = max(0, days_late * 1.0)  # $1 per day late
-                    
-                    self.cursor.execute('UPDATE transactions SET status="returned", return_date=?, fine_amount=? WHERE transaction_id=?', 
-                                       (datetime.now().strftime('%Y-%m-%d'), fine, transaction_id))
-                    self.cursor.execute('UPDATE books SET available_copies=available_copies+1 WHERE book_id=?', (res[0],))
-                    self.conn.commit()
-                    
-                    msg = "Book returned successfully!"
-                    if fine > 0:
-                        msg += f"\n\nLate fee: ${fine:.2f} ({days_late} days late)"
-                    
-                    messagebox.showinfo("Success", msg)
-                    win.destroy()
-                else:
-                    messagebox.showerror("Error", "Transaction not found!")
             except ValueError:
                 messagebox.showerror("Error", "Please enter a valid transaction ID!")
+                return
+            
+            def returned(result):
+                fine, days_late, hold = result
+                msg = "Book returned successfully!"
+                if fine > 0:
+                    msg += f"\n\nLate fee: ${fine:.2f} ({days_late} days late)"
+                if hold:
+                    msg += (f"\n\nPut this copy on the hold shelf: it is held for {hold.member_name} "
+                            f"until {hold.expires_on}.")
+                
+                messagebox.showinfo("Success", msg)
+                win.destroy()
+            
+            self.run_query(lambda store: store.return_book(transaction_id), returned, owner=win)
         
         button_frame = ttk.Frame(main)
         button_frame.pack(pady=20, fill=tk.X)
         ttk.Button(button_frame, text="PROCESS RETURN", command=process, style="Accent.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
         ttk.Button(button_frame, text="CANCEL", command=win.destroy, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
 
+    def batch_circulation_window(self):
+        win, main = self.setup_sub_window("Batch Circulation", "900x700")
+        
+        ttk.Label(main, text="🧺 Batch Circulation", font=("Segoe UI", 20, "bold"), 
+                 foreground=self.accent_tertiary).pack(pady=(0, 20))
+        
+        group = ttk.LabelFrame(main, text="Batch Details", padding="15")
+        group.pack(fill=tk.X)
+        
+        mode = tk.StringVar(value="issue")
+        mode_frame = ttk.Frame(group)
+        mode_frame.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        ttk.Radiobutton(mode_frame, text="Issue books", variable=mode, value="issue").pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Radiobutton(mode_frame, text="Return loans", variable=mode, value="return").pack(side=tk.LEFT)
+        
+        ttk.Label(group, text="Member ID", font=("Segoe UI", 10)).grid(row=1, column=0, sticky="w", pady=5, padx=(0, 10))
+        member_e = ttk.Entry(group, width=35)
+        member_e.grid(row=1, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Loan Duration (days)", font=("Segoe UI", 10)).grid(row=2, column=0, sticky="w", pady=5, padx=(0, 10))
+        duration_e = ttk.Entry(group, width=35)
+        duration_e.insert(0, "14")
+        duration_e.grid(row=2, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Scanned IDs", font=("Segoe UI", 10)).grid(row=3, column=0, sticky="nw", pady=5, padx=(0, 10))
+        ids_text = tk.Text(group, height=5, bg=self.bg_tertiary, fg=self.fg_text, insertbackground=self.fg_text,
+                           relief="flat", font=("Segoe UI", 10))
+        ids_text.grid(row=3, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Tip: one Book ID (issue) or Transaction ID (return) per line; "
+                              "the Member ID is optional for returns", font=("Segoe UI", 8), 
+                 foreground=self.fg_muted).grid(row=4, column=0, columnspan=2, pady=(5, 0))
+        group.columnconfigure(1, weight=1)
+        
+        # Per-item results
+        table_frame = ttk.Frame(main)
+        table_frame.pack(fill=tk.BOTH, expand=True, pady=(15, 0))
+        
+        cols = ("ID", "Title", "Result")
+        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=10)
+        for c, width in zip(cols, (100, 350, 300)):
+            tree.heading(c, text=c)
+            tree.column(c, width=width)
+        tree.tag_configure("failed", foreground=self.accent_danger)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        summary = ttk.Label(main, text="", font=("Segoe UI", 10))
+        summary.pack(pady=(10, 0))
+        
+        def parse_id(id_str):
+            """Extract numeric ID from formatted or plain ID"""
+            id_str = id_str.strip()
+            if id_str.lower().startswith('mem'):
+                id_str = id_str[3:]
+            return int(id_str.lstrip('0') or 0)
+        
+        def show_results(results):
+            tree.delete(*tree.get_children())
+            for r in results:
+                tree.insert("", tk.END, values=(self.format_id(r.id), r.title or "-", r.message),
+                            tags=() if r.ok else ("failed",))
+            done = sum(1 for r in results if r.ok)
+            summary.config(text=f"{done} of {len(results)} items processed, {len(results) - done} refused")
+            if done:
+                ids_text.delete("1.0", tk.END)
+        
+        def process():
+            try:
+                ids = [parse_id(i) for i in ids_text.get("1.0", tk.END).replace(",", " ").split()]
+                member_str = member_e.get().strip()
+                member_id = parse_id(member_str) if member_str else None
+                days = int(duration_e.get())
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid IDs and duration!")
+                return
+            if not ids:
+                messagebox.showwarning("Warning", "Please scan at least one ID!")
+                return
+            
+            if mode.get() == "issue":
+                if member_id is None:
+                    messagebox.showerror("Error", "Please enter the borrowing member's ID!")
+                    return
+                self.run_query(lambda store: store.borrow_books(member_id, ids, days)[2], show_results, owner=win)
+            else:
+                self.run_query(lambda store: store.return_loans(ids, member_id), show_results, owner=win)
+        
+        button_frame = ttk.Frame(main)
+        button_frame.pack(pady=15, fill=tk.X)
+        ttk.Button(button_frame, text="PROCESS BATCH", command=process, style="Accent.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="CLOSE", command=win.destroy, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+
+    def scan_desk_window(self):
+        win, main = self.setup_sub_window("Scan Desk", "1000x720")
+        
+        ttk.Label(main, text="📷 Scan Desk", font=("Segoe UI", 20, "bold"), 
+                 foreground=self.accent_tertiary).pack(pady=(0, 20))
+        
+        group = ttk.LabelFrame(main, text="Scanning", padding="15")
+        group.pack(fill=tk.X)
+        
+        mode = tk.StringVar(value="out")
+        mode_frame = ttk.Frame(group)
+        mode_frame.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        ttk.Radiobutton(mode_frame, text="Check out", variable=mode, value="out").pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Radiobutton(mode_frame, text="Check in", variable=mode, value="in").pack(side=tk.LEFT)
+        
+        ttk.Label(group, text="Member ID", font=("Segoe UI", 10)).grid(row=1, column=0, sticky="w", pady=5, padx=(0, 10))
+        member_e = ttk.Entry(group, width=35)
+        member_e.grid(row=1, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Loan Duration (days)", font=("Segoe UI", 10)).grid(row=2, column=0, sticky="w", pady=5, padx=(0, 10))
+        duration_e = ttk.Entry(group, width=35)
+        duration_e.insert(0, "14")
+        duration_e.grid(row=2, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Barcode", font=("Segoe UI", 10, "bold")).grid(row=3, column=0, sticky="w", pady=5, padx=(0, 10))
+        barcode_e = ttk.Entry(group, width=35, font=("Segoe UI", 14))
+        barcode_e.grid(row=3, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Tip: scan copies one after another; each scan is processed in the background "
+                              "while the next one is read", font=("Segoe UI", 8), 
+                 foreground=self.fg_muted).grid(row=4, column=0, columnspan=2, pady=(5, 0))
+        group.columnconfigure(1, weight=1)
+        
+        # Scan log, newest first
+        table_frame = ttk.Frame(main)
+        table_frame.pack(fill=tk.BOTH, expand=True, pady=(15, 0))
+        
+        cols = ("Barcode", "Title", "Copy", "Result")
+        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=12)
+        for c, width in zip(cols, (130, 330, 60, 380)):
+            tree.heading(c, text=c)
+            tree.column(c, width=width)
+        tree.tag_configure("failed", foreground=self.accent_danger)
+        tree.tag_configure("pending", foreground=self.fg_muted)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        summary = ttk.Label(main, text="", font=("Segoe UI", 10))
+        summary.pack(pady=(10, 0))
+        counts = {"done": 0, "refused": 0}
+        
+        def parse_member(id_str):
+            """Extract numeric member ID from formatted or plain ID"""
+            id_str = id_str.strip()
+            if id_str.lower().startswith('mem'):
+                id_str = id_str[3:]
+            return int(id_str.lstrip('0') or 0)
+        
+        def check_out(store, member_id, barcode, days):
+            scan, member, due = store.borrow_item(member_id, barcode, days)
+            return scan, f"Issued to {member.name}, due {due}"
+        
+        def check_in(store, barcode):
+            scan, fine, days_late, hold = store.return_item(barcode)
+            message = f"Returned by {scan.member_name}"
+            if fine > 0:
+                message += f"; late fee ${fine:.2f} ({days_late} days late)"
+            if hold:
+                message += f"; HOLD SHELF for {hold.member_name} until {hold.expires_on}"
+            return scan, message
+        
+        def finish(row, barcode, work):
+            # Refusals are logged in the row rather than in a dialog, so scanning is never interrupted
+            def run(store):
+                try:
+                    return work(store)
+                except LibraryError as e:
+                    return None, str(e)
+            
+            def done(result):
+                scan, message = result
+                counts["done" if scan else "refused"] += 1
+                if not scan:
+                    win.bell()
+                if not tree.exists(row):
+                    return
+                tree.item(row, values=(barcode, scan.title if scan else "-", scan.copy_number if scan else "-", message),
+                          tags=() if scan else ("failed",))
+                summary.config(text=f"{counts['done']} scans processed, {counts['refused']} refused")
+            
+            self.run_query(run, done, owner=win)
+        
+        def scanned(event=None):
+            barcode = barcode_e.get().strip()
+            barcode_e.delete(0, tk.END)
+            if not barcode:
+                return
+            
+            row = tree.insert("", 0, values=(barcode, "", "", "Processing..."), tags=("pending",))
+            # Keep the log short so the widget stays fast through a long session
+            for old in tree.get_children()[200:]:
+                tree.delete(old)
+            
+            if mode.get() == "in":
+                finish(row, barcode, lambda store: check_in(store, barcode))
+                return
+            try:
+                member_id = parse_member(member_e.get())
+                days = int(duration_e.get())
+            except ValueError:
+                member_id = None
+            if not member_id:
+                counts["refused"] += 1
+                win.bell()
+                tree.item(row, values=(barcode, "-", "-", "Enter the borrowing member's ID and loan duration first"),
+                          tags=("failed",))
+                return
+            finish(row, barcode, lambda store: check_out(store, member_id, barcode, days))
+        
+        # Scanners type the barcode and press Enter
+        barcode_e.bind("<Return>", scanned)
+        barcode_e.focus_set()
+        
+        button_frame = ttk.Frame(main)
+        button_frame.pack(pady=15, fill=tk.X)
+        ttk.Button(button_frame, text="PROCESS", command=scanned, style="Accent.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="CLOSE", command=win.destroy, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+
+    def holds_window(self):
+        win, main = self.setup_sub_window("Holds Queue", "1100x720")
+        
+        ttk.Label(main, text="🔖 Holds Queue", font=("Segoe UI", 20, "bold"), 
+                 foreground=self.accent_tertiary).pack(pady=(0, 20))
+        
+        group = ttk.LabelFrame(main, text="Hold Details", padding="15")
+        group.pack(fill=tk.X)
+        
+        ttk.Label(group, text="Member ID", font=("Segoe UI", 10)).grid(row=0, column=0, sticky="w", pady=5, padx=(0, 10))
+        member_e = ttk.Entry(group, width=25)
+        member_e.grid(row=0, column=1, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Book ID", font=("Segoe UI", 10)).grid(row=0, column=2, sticky="w", pady=5, padx=(20, 10))
+        book_e = ttk.Entry(group, width=25)
+        book_e.grid(row=0, column=3, sticky="ew", pady=5)
+        
+        ttk.Label(group, text="Priority", font=("Segoe UI", 10)).grid(row=1, column=0, sticky="w", pady=5, padx=(0, 10))
+        priority_combo = ttk.Combobox(group, values=["Normal", "High"], state="readonly", width=15)
+        priority_combo.set("Normal")
+        priority_combo.grid(row=1, column=1, sticky="w", pady=5)
+        
+        ttk.Label(group, text="Tip: enter a Member ID and/or Book ID to show their open holds; "
+                              "High priority holds are served before Normal ones", font=("Segoe UI", 8), 
+                 foreground=self.fg_muted).grid(row=2, column=0, columnspan=4, pady=(5, 0))
+        group.columnconfigure(1, weight=1)
+        group.columnconfigure(3, weight=1)
+        
+        # Holds table
+        table_frame = ttk.Frame(main)
+        table_frame.pack(fill=tk.BOTH, expand=True, pady=(15, 0))
+        
+        cols = ("Hold", "Book ID", "Title", "Member", "Priority", "Requested", "Status", "Queue / Pickup By")
+        tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=12)
+        for c, width in zip(cols, (70, 80, 250, 160, 80, 140, 80, 130)):
+            tree.heading(c, text=c)
+            tree.column(c, width=width)
+        tree.tag_configure("ready", foreground=self.accent_tertiary)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        summary = ttk.Label(main, text="", font=("Segoe UI", 10))
+        summary.pack(pady=(10, 0))
+        
+        def parse_id(id_str):
+            """Extract numeric ID from formatted or plain ID"""
+            id_str = id_str.strip()
+            if id_str.lower().startswith('mem'):
+                id_str = id_str[3:]
+            return int(id_str.lstrip('0') or 0) if id_str else None
+        
+        def show_holds(holds):
+            tree.delete(*tree.get_children())
+            for h in holds:
+                place = f"#{h.position}" if h.status == "waiting" else h.expires_on
+                tree.insert("", tk.END, values=(self.format_id(h.hold_id), self.format_id(h.book_id), h.title,
+                                                f"{self.format_member_id(h.member_id)} {h.member_name}",
+                                                "High" if h.priority else "Normal", h.requested_at,
+                                                h.status.title(), place),
+                            tags=(h.hold_id, h.status))
+            ready = sum(1 for h in holds if h.status == "ready")
+            summary.config(text=f"{len(holds)} open holds, {ready} on the hold shelf")
+        
+        def read_ids():
+            try:
+                return parse_id(member_e.get()), parse_id(book_e.get())
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid IDs!")
+                raise
+        
+        def show():
+            try:
+                member_id, book_id = read_ids()
+            except ValueError:
+                return
+            if member_id is None and book_id is None:
+                show_shelf()
+                return
+            self.run_query(lambda store: store.list_holds(book_id, member_id), show_holds, 
+                           owner=win, key=f"{win}.holds")
+        
+        def show_shelf():
+            # Copies waiting for collection, soonest deadline first
+            self.run_query(lambda store: store.list_holds(status="ready", limit=500), show_holds, 
+                           owner=win, key=f"{win}.holds")
+        
+        def place():
+            try:
+                member_id, book_id = read_ids()
+            except ValueError:
+                return
+            if member_id is None or book_id is None:
+                messagebox.showerror("Error", "Please enter both the Member ID and the Book ID!")
+                return
+            priority = 1 if priority_combo.get() == "High" else 0
+            
+            def placed(hold):
+                messagebox.showinfo("Hold Placed", f"{hold.member_name} is number {hold.position} in the queue "
+                                                   f"for '{hold.title}'")
+                show()
+            
+            self.run_query(lambda store: store.place_hold(member_id, book_id, priority), placed, owner=win)
+        
+        def cancel():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning("Warning", "Please select a hold to cancel!")
+                return
+            hold_id = tree.item(selected[0])['tags'][0]
+            if not messagebox.askyesno("Cancel Hold", f"Cancel hold {self.format_id(hold_id)}?"):
+                return
+            
+            def cancelled(passed_to):
+                if passed_to:
+                    messagebox.showinfo("Hold Cancelled", f"The copy on the hold shelf is now held for "
+                                                          f"{passed_to.member_name} until {passed_to.expires_on}.")
+                show()
+            
+            self.run_query(lambda store: store.cancel_hold(hold_id), cancelled, owner=win)
+        
+        button_frame = ttk.Frame(main)
+        button_frame.pack(pady=15, fill=tk.X)
+        ttk.Button(button_frame, text="PLACE HOLD", command=place, style="Accent.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="🔍 SHOW HOLDS", command=show, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="HOLD SHELF", command=show_shelf, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="CANCEL SELECTED", command=cancel, style="Danger.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        ttk.Button(button_frame, text="CLOSE", command=win.destroy, style="Secondary.TButton").pack(side=tk.LEFT, padx=5, ipady=8, fill=tk.X, expand=True)
+        
+        show_shelf()
+
     def view_issued_books_window(self):
         win, main = self.setup_sub_window("Issued Books Status", "1200x750")
         
@@ -1119,7 +2142,6 @@ class LibraryGUI:
             tree.heading(c, text=c)
         
         scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
         
@@ -1142,95 +2164,82 @@ class LibraryGUI:
         stats_labels['overdue'].pack(side=tk.LEFT, padx=15)
         stats_labels['fines'].pack(side=tk.LEFT, padx=15)
         
-        def refresh_data():
-            tree.delete(*tree.get_children())
+        def loan_row(r):
+            trans_id = self.format_id(r.transaction_id)
+            member_id = self.format_member_id(r.member_id)
+            book_id = self.format_id(r.book_id)
             
-            status_filter = status_combo.get()
-            search_term = f'%{search_entry.get()}%'
+            issue_date = r.borrow_date
+            due_date = r.due_date
+            return_date = r.return_date if r.return_date else "Not Returned"
+            fine = r.fine_amount if r.fine_amount else 0.0
             
-            # Build query
-            query = '''SELECT t.transaction_id, t.member_id, m.name, t.book_id, b.title,
-                       t.borrow_date, t.due_date, t.return_date, t.status, t.fine_amount
-                       FROM transactions t
-                       JOIN members m ON t.member_id = m.member_id
-                       JOIN books b ON t.book_id = b.book_id
-                       WHERE (m.name LIKE ? OR b.title LIKE ?)'''
-            
-            params = [search_term, search_term]
-            
-            if status_filter == "Active (Not Returned)":
-                query += " AND t.status = 'borrowed'"
-            elif status_filter == "Overdue":
-                query += " AND t.status = 'borrowed' AND date(t.due_date) < date('now')"
-            elif status_filter == "Returned":
-                query += " AND t.status = 'returned'"
-            
-            query += " ORDER BY t.borrow_date DESC"
-            
-            self.cursor.execute(query, params)
+            days_display = f"{r.days_out} days"
+            if r.return_date:
+                status_display = "✔️ Returned"
+            elif r.days_late > 0:
+                status_display = f"⚠️ OVERDUE ({r.days_late}d)"
+            else:
+                status_display = "✅ Active"
             
-            total_trans = 0
-            active_count = 0
-            overdue_count = 0
-            total_fines = 0.0
+            fine_display = f"${fine:.2f}" if fine > 0 else "-"
             
-            for r in self.cursor.fetchall():
-                trans_id = self.format_id(r[0])
-                member_id = self.format_member_id(r[1])
-                book_id = self.format_id(r[3])
-                
-                issue_date = r[5]
-                due_date = r[6]
-                return_date = r[7] if r[7] else "Not Returned"
-                status = r[8]
-                fine = r[9] if r[9] else 0.0
-                
-                # Calculate days
-                if return_date == "Not Returned":
-                    days_out = (datetime.now() - datetime.strptime(issue_date, '%Y-%m-%d')).days
-                    days_display = f"{days_out} days"
-                    
-                    # Check if overdue
-                    due_datetime = datetime.strptime(due_date, '%Y-%m-%d')
-                    if datetime.now() > due_datetime:
-                        days_overdue = (datetime.now() - due_datetime).days
-                        status_display = f"⚠️ OVERDUE ({days_overdue}d)"
-                        overdue_count += 1
-                    else:
-                        status_display = "✅ Active"
-                        active_count += 1
-                else:
-                    issue_dt = datetime.strptime(issue_date, '%Y-%m-%d')
-                    return_dt = datetime.strptime(return_date, '%Y-%m-%d')
-                    days_out = (return_dt - issue_dt).days
-                    days_display = f"{days_out} days"
-                    status_display = "✔️ Returned"
-                
-                fine_display = f"${fine:.2f}" if fine > 0 else "-"
-                
-                tree.insert("", tk.END, values=(
-                    trans_id, member_id, r[2], book_id, r[4], 
-                    issue_date, due_date, return_date, days_display, 
-                    status_display, fine_display
-                ))
-                
-                total_trans += 1
-                total_fines += fine
-            
-            # Update statistics
+            values = (trans_id, member_id, r.member_name, book_id, r.title, 
+                      issue_date, due_date, return_date, days_display, 
+                      status_display, fine_display)
+            return values, self.store.page_cursor("loans", filters["sort"], r)
+        
+        filters = {}
+        order = {"sort": "borrow_date", "descending": True}
+        
+        def fetch_loans(after, limit, on_done):
+            f = dict(filters)
+            self.run_query(lambda store: store.list_loans(after=after, limit=limit, **f), on_done, owner=win)
+        
+        pager = PagedTreeview(tree, scrollbar, fetch_loans, loan_row)
+        
+        def show_statistics(totals):
+            total_trans, active_count, overdue_count, total_fines = totals
             stats_labels['total'].config(text=f"Total Transactions: {total_trans}")
             stats_labels['active'].config(text=f"Active: {active_count}")
             stats_labels['overdue'].config(text=f"Overdue: {overdue_count}")
             stats_labels['fines'].config(text=f"Total Fines: ${total_fines:.2f}")
         
+        def refresh_data():
+            filters["search"] = search_entry.get()
+            filters["status"] = {"Active (Not Returned)": "active", "Overdue": "overdue", 
+                                 "Returned": "returned"}.get(status_combo.get())
+            filters.update(order)
+            pager.reset()
+            
+            search, status = filters["search"], filters["status"]
+            self.run_query(lambda store: store.loan_totals(search, status), show_statistics, owner=win, 
+                           key=f"{win}.totals")
+        
+        # Days is worked out per row and has no index to sort by
+        self.sortable_headings(tree, {"Trans ID": "transaction_id", "Member ID": "member_id", 
+                                      "Member Name": "member_name", "Book ID": "book_id", "Book Title": "title", 
+                                      "Issue Date": "borrow_date", "Due Date": "due_date", 
+                                      "Return Date": "return_date", "Status": "status", "Fine": "fine_amount"}, 
+                               order, refresh_data)
+        
         ttk.Button(filter_frame, text="🔍 FILTER", command=refresh_data, 
                   style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         ttk.Button(filter_frame, text="REFRESH", command=refresh_data, 
                   style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="EXPORT", command=lambda: self.export_window_data("transactions", filters), 
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=5)
         
         refresh_data()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Integrated Library Management System")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--server", help="use an ILMS server instead of the database, e.g. http://branch-hq:8750")
+    parser.add_argument("--token", help="API token of the server")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = LibraryGUI(root)
+    app = LibraryGUI(root, args.db, args.server, args.token)
     root.mainloop()
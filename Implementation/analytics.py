@@ -0,0 +1,112 @@
+"""
+Circulation reports for ILMS.
+
+Reports are read from the rollups of migration 11 rather than from the
+transactions table. circulation_daily holds loans, returns, newly overdue
+loans and fines charged per day and category. title_loans holds each
+title's loans per month, per year and for all time. Triggers keep both
+current as loans are issued and returned, and as the nightly overdue job
+records overdue loans, so a report over years of history reads a few
+thousand rollup rows. The rebuild command recomputes the rollups from
+the transactions, e.g. after rows were edited with the triggers dropped.
+
+Usage:
+    python analytics.py trend --db library.db --from 2026-01-01 --by week
+    python analytics.py top --period 2026 --limit 20
+    python analytics.py categories --from 2026-01-01 --csv categories.csv
+    python analytics.py rebuild
+"""
+import argparse
+import csv
+import time
+from datetime import date
+
+from library_store import LibraryStore, TREND_PERIODS
+
+
+def rebuild_rollups(store):
+    """Recompute circulation_daily and title_loans from the transactions in one transaction.
+
+    Loans and overdue events count under the category recorded on the loan when it was issued.
+    """
+    with store.write_transaction() as cursor:
+        cursor.execute('DELETE FROM circulation_daily')
+        cursor.execute('DELETE FROM title_loans')
+        cursor.execute('''INSERT INTO circulation_daily (day, category, loans, returns, overdue, fines)
+            SELECT day, category, SUM(loans), SUM(returns), SUM(overdue), SUM(fines) FROM (
+                SELECT borrow_date AS day, COALESCE(category, '') AS category, 1 AS loans, 0 AS returns,
+                       0 AS overdue, 0 AS fines
+                FROM transactions
+                UNION ALL
+                SELECT return_date, COALESCE(category, ''), 0, 1, 0, COALESCE(fine_amount, 0)
+                FROM transactions WHERE return_date IS NOT NULL
+                UNION ALL
+                SELECT e.detected_on, COALESCE(t.category, ''), 0, 0, 1, 0
+                FROM overdue_events e LEFT JOIN transactions t ON t.transaction_id = e.transaction_id)
+            GROUP BY day, category''')
+        cursor.execute('''INSERT INTO title_loans (period, book_id, loans)
+            SELECT substr(borrow_date, 1, 7), book_id, COUNT(*) FROM transactions GROUP BY 1, 2''')
+        for period, source in (("substr(period, 1, 4)", 7), ("''", 4)):
+            cursor.execute(f'''INSERT INTO title_loans (period, book_id, loans)
+                SELECT {period}, book_id, SUM(loans) FROM title_loans WHERE length(period) = {source} GROUP BY 1, 2''')
+        cursor.execute('SELECT COUNT(*) FROM circulation_daily')
+        return cursor.fetchone()[0]
+
+
+def report_rows(store, report, args):
+    """Run one report and return (header, rows)"""
+    if report == "trend":
+        rows = store.circulation_trend(args.start, args.end, args.by, args.category)
+        return ["period", "loans", "returns", "overdue", "fines"], rows
+    if report == "top":
+        rows = store.most_borrowed(args.period, args.limit)
+        return ["book_id", "title", "author", "category", "loans"], rows
+    rows = store.category_utilisation(args.start, args.end)
+    return ["category", "titles", "total_copies", "on_loan", "loans", "returns", "overdue", "fines",
+            "loans_per_copy"], rows
+
+
+def print_table(header, rows):
+    cells = [[str(v if v is not None else "") for v in row] for row in rows]
+    widths = [max([len(h)] + [len(row[i]) for row in cells]) for i, h in enumerate(header)]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Circulation reports from the daily rollups")
+    parser.add_argument("report", choices=["trend", "top", "categories", "rebuild"])
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first day of the report")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last day of the report")
+    parser.add_argument("--by", choices=list(TREND_PERIODS), default="month", help="trend: period per row (default: month)")
+    parser.add_argument("--category", help="trend: only this category")
+    parser.add_argument("--period", default="", help="top: a month (2026-10), a year (2026) or all time (default)")
+    parser.add_argument("--limit", type=int, default=20, help="top: number of titles (default: 20)")
+    parser.add_argument("--csv", help="write the report to this CSV file instead of printing it")
+    args = parser.parse_args()
+
+    store = LibraryStore(args.db)
+    try:
+        started = time.perf_counter()
+        if args.report == "rebuild":
+            days = rebuild_rollups(store)
+            print(f"Rebuilt {days:,} daily rollup rows in {time.perf_counter() - started:.1f}s")
+            return
+        header, rows = report_rows(store, args.report, args)
+    finally:
+        store.close()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        print(f"Wrote {len(rows):,} rows to {args.csv}")
+    else:
+        print_table(header, rows)
+
+
+if __name__ == "__main__":
+    main()
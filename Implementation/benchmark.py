@@ -0,0 +1,448 @@
+"""
+Benchmark suite for ILMS.
+
+Runs timed scenarios against a library database, usually one built by
+datagen.py, and reports p50/p95/p99 latencies in milliseconds. Each
+scenario is a function that prepares its inputs and returns an operation;
+the operation is timed on its own, one call per sample, after a few
+warm-up calls. Inputs are drawn from a seeded random generator so two
+runs against the same database issue the same queries.
+
+Results can be saved as a baseline and later runs compared against it: a
+scenario whose p95 grew by more than the tolerance is reported as a
+regression and the exit status is 1, so the suite can gate a change.
+
+The borrow_return, scan_circulation and concurrent_circulation scenarios
+issue and return real loans, adding transaction rows to the database;
+run them against a generated copy. concurrent_circulation runs DESKS
+desks at once, each on its own connection, and also reports loans per
+second and how long desks waited for the write lock.
+Scenarios that need a display (navigation, and the window part of
+startup) are skipped or reduced when Tk cannot open one.
+
+Usage:
+    python datagen.py bench.db --books 1000000 --members 500000 --transactions 20000000
+    python benchmark.py bench.db --save-baseline baseline.json
+    python benchmark.py bench.db --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from datagen import TITLE_WORDS, FIRST_NAMES, LAST_NAMES, generate_library
+from library_store import LibraryStore, LibraryError, SORT_KEYS
+
+WARMUP = 3
+ITERATIONS = 200
+STARTUP_ITERATIONS = 10
+TOLERANCE = 0.25
+NOISE_FLOOR_MS = 1.0   # smaller p95 increases are treated as noise
+DESKS = 4   # concurrent_circulation: desks issuing and returning at the same time
+
+# Starts the application up to a painted login screen; without a display only the imports and store are timed
+STARTUP_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[2])
+import ILMS
+try:
+    root = ILMS.tk.Tk()
+except ILMS.tk.TclError:
+    from library_store import LibraryStore
+    LibraryStore(sys.argv[1]).close()
+else:
+    ILMS.LibraryGUI(root, sys.argv[1])
+    root.update()
+    root.destroy()
+'''
+
+
+def prefixes(words, rng, count):
+    """Return search terms made of word prefixes, as a desk types them"""
+    return [rng.choice(words).lower()[:rng.randint(2, 6)] for _ in range(count)]
+
+
+# --- SCENARIOS ---
+def startup(store, rng):
+    """Cold start in a new interpreter: import the GUI module, check the schema and show the login screen"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, "-c", STARTUP_SCRIPT, store.db_name, here]
+    return lambda: subprocess.run(command, check=True)
+
+
+def navigation(store, rng):
+    """Switch between the dashboard and the book, member and transaction screens once each"""
+    import tkinter as tk
+    from ILMS import LibraryGUI
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    app = LibraryGUI(root, store.db_name)
+    app.logged_in_user = "benchmark"
+    screens = [app.show_main_menu, app.show_book_menu, app.show_member_menu, app.show_transaction_menu]
+
+    def op():
+        for show in screens:
+            show()
+            root.update_idletasks()
+    return op
+
+
+def catalogue_search(store, rng):
+    """Full-text catalogue search by title or author prefix, first 500 results"""
+    terms = [("title", t) for t in prefixes(TITLE_WORDS, rng, 50)] + \
+            [("author", t) for t in prefixes(LAST_NAMES, rng, 50)]
+    return lambda: store.search_books(*reversed(rng.choice(terms)), limit=500)
+
+
+def inventory_listing(store, rng):
+    """First page of the inventory window with a random status filter and search text"""
+    terms = [""] * 10 + prefixes(TITLE_WORDS, rng, 10)
+    return lambda: store.list_books(rng.choice(terms), rng.choice([None, "available", "out_of_stock"]), limit=200)
+
+
+def inventory_scroll(store, rng):
+    """A page from the middle of the unfiltered inventory, fetched by keyset"""
+    starts = [(" ".join(rng.sample(TITLE_WORDS, 2)), 0) for _ in range(50)]
+    return lambda: store.list_books(after=rng.choice(starts), limit=200)
+
+
+def inventory_sorted(store, rng):
+    """A page of the inventory sorted by a random column and direction, starting from a random title"""
+    top = store.conn.execute('SELECT COALESCE(MAX(book_id), 0) FROM books').fetchone()[0]
+    starts = [b for b in (store.get_book(rng.randint(1, top)) for _ in range(50)) if b] if top else []
+    if not starts:
+        raise LibraryError("inventory_sorted needs at least one book")
+
+    def op():
+        sort, descending = rng.choice(list(SORT_KEYS["books"])), rng.random() < 0.5
+        after = store.page_cursor("books", sort, rng.choice(starts))
+        return store.list_books(after=after, limit=200, sort=sort, descending=descending)
+    return op
+
+
+def issued_filtering(store, rng):
+    """First page of the issued-books window with a random status filter and member/title search"""
+    terms = [""] * 10 + prefixes(FIRST_NAMES + TITLE_WORDS, rng, 10)
+    return lambda: store.list_loans(rng.choice(terms), rng.choice([None, "active", "overdue", "returned"]), limit=200)
+
+
+def issued_totals(store, rng):
+    """Summary panel of the issued-books window for a random status filter"""
+    return lambda: store.loan_totals("", rng.choice([None, "active", "overdue", "returned"]))
+
+
+def issued_sorted(store, rng):
+    """First and second page of the issued-books window sorted by a random column, direction and status"""
+    def op():
+        sort, descending = rng.choice(list(SORT_KEYS["loans"])), rng.random() < 0.5
+        status = rng.choice([None, "active", "overdue", "returned"])
+        page = store.list_loans("", status, limit=200, sort=sort, descending=descending)
+        if page:
+            store.list_loans("", status, store.page_cursor("loans", sort, page[-1]), 200, sort, descending)
+    return op
+
+
+def member_search(store, rng):
+    """Member directory search by name, email, phone prefix or formatted ID"""
+    top = store.conn.execute('SELECT COALESCE(MAX(member_id), 1) FROM members').fetchone()[0]
+    terms = prefixes(FIRST_NAMES, rng, 25) + [f"mem{rng.randint(1, top):03d}" for _ in range(25)] + \
+            [f"07{rng.randrange(100):02d}" for _ in range(25)] + \
+            [f"{name.lower()}." for name in rng.sample(FIRST_NAMES, 10)]
+    return lambda: store.list_members(rng.choice(terms), limit=200)
+
+
+def borrow_return(store, rng):
+    """Issue an available book to a member and return it, each in its own write transaction"""
+    top_book, top_member = store.conn.execute(
+        'SELECT (SELECT COALESCE(MAX(book_id), 0) FROM books), (SELECT COALESCE(MAX(member_id), 0) FROM members)').fetchone()
+    candidates = [rng.randint(1, top_book) for _ in range(2000)] if top_book else []
+    available = [r[0] for r in store.fetch_by_ids(
+        'SELECT book_id FROM books WHERE available_copies > 0 AND book_id IN ({})', candidates)]
+    members = [r[0] for r in store.fetch_by_ids(
+        'SELECT member_id FROM members WHERE member_id IN ({})', [rng.randint(1, top_member) for _ in range(200)])]
+    if not available or not members:
+        raise LibraryError("borrow_return needs at least one member and one available book")
+
+    def op():
+        store.borrow_book(rng.choice(members), rng.choice(available))
+        store.return_book(store.cursor.execute('SELECT MAX(transaction_id) FROM transactions').fetchone()[0])
+    return op
+
+
+def scan_circulation(store, rng):
+    """Check a copy out by its barcode and check it back in, as a desk scanner does"""
+    top_item, top_member = store.conn.execute(
+        'SELECT (SELECT COALESCE(MAX(item_id), 0) FROM items), (SELECT COALESCE(MAX(member_id), 0) FROM members)').fetchone()
+    candidates = [rng.randint(1, top_item) for _ in range(2000)] if top_item else []
+    barcodes = [r[0] for r in store.fetch_by_ids(
+        "SELECT barcode FROM items WHERE status = 'available' AND item_id IN ({})", candidates)]
+    members = [r[0] for r in store.fetch_by_ids(
+        'SELECT member_id FROM members WHERE member_id IN ({})', [rng.randint(1, top_member) for _ in range(200)])]
+    if not barcodes or not members:
+        raise LibraryError("scan_circulation needs at least one member and one available copy")
+
+    def op():
+        barcode = rng.choice(barcodes)
+        store.borrow_item(rng.choice(members), barcode)
+        store.return_item(barcode)
+    return op
+
+
+class DeskStore(LibraryStore):
+    """A store that records how long each write transaction waited for the database write lock"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock_waits = []   # milliseconds
+
+    @contextmanager
+    def write_transaction(self):
+        started = time.perf_counter()
+        with super().write_transaction() as cursor:
+            self.lock_waits.append((time.perf_counter() - started) * 1000)
+            yield cursor
+
+
+def concurrent_circulation(store, rng):
+    """DESKS desks each issue a book and return it at the same moment, every desk on its own connection"""
+    top_book, top_member = store.conn.execute(
+        'SELECT (SELECT COALESCE(MAX(book_id), 0) FROM books), (SELECT COALESCE(MAX(member_id), 0) FROM members)').fetchone()
+    candidates = [rng.randint(1, top_book) for _ in range(2000)] if top_book else []
+    available = sorted({r[0] for r in store.fetch_by_ids(
+        'SELECT book_id FROM books WHERE available_copies > 0 AND book_id IN ({})', candidates)})
+    members = sorted({r[0] for r in store.fetch_by_ids(
+        'SELECT member_id FROM members WHERE member_id IN ({})', [rng.randint(1, top_member) for _ in range(200)])})
+    if len(available) < DESKS or len(members) < DESKS:
+        raise LibraryError(f"concurrent_circulation needs at least {DESKS} members and {DESKS} available books")
+
+    # Each desk lends from its own share of the books, so desks contend for the write lock, not for copies
+    shelves = [available[n::DESKS] for n in range(DESKS)]
+    pool = ThreadPoolExecutor(max_workers=DESKS, thread_name_prefix="desk")
+    local = threading.local()
+    desks = []
+    start = threading.Barrier(DESKS)
+    counts = {"loans": 0, "busy": 0, "started": time.perf_counter()}
+
+    def desk_store():
+        if getattr(local, "store", None) is None:
+            local.store = DeskStore(manager=store.manager)   # one connection per desk thread
+            desks.append(local.store)
+        return local.store
+
+    def desk(member_id, book_id):
+        clerk = desk_store()
+        start.wait()
+        try:
+            clerk.borrow_book(member_id, book_id)
+            clerk.cursor.execute("""SELECT MAX(transaction_id) FROM transactions
+                                    WHERE member_id=? AND book_id=? AND status='borrowed'""", (member_id, book_id))
+            clerk.return_book(clerk.cursor.fetchone()[0])
+            return True
+        except sqlite3.OperationalError:
+            return False   # busy_timeout ran out waiting for the write lock
+
+    def op():
+        picks = zip(rng.sample(members, DESKS), (rng.choice(shelf) for shelf in shelves))
+        done = [f.result() for f in [pool.submit(desk, *pick) for pick in picks]]
+        counts["loans"] += sum(done)
+        counts["busy"] += len(done) - sum(done)
+
+    def reset():
+        for clerk in desks:
+            clerk.lock_waits.clear()
+        counts.update(loans=0, busy=0, started=time.perf_counter())
+
+    def finish():
+        seconds = time.perf_counter() - counts["started"]
+        waits = sorted(w for clerk in desks for w in clerk.lock_waits)
+
+        def close():
+            start.wait()
+            local.store.close()
+        for f in [pool.submit(close) for _ in range(DESKS)]:
+            f.result()
+        pool.shutdown()
+        return {"desks": DESKS, "loans_per_second": counts["loans"] / seconds if seconds else 0.0,
+                "busy": counts["busy"], "lock_wait_p50": percentile(waits, 50) if waits else 0.0,
+                "lock_wait_p95": percentile(waits, 95) if waits else 0.0, "lock_wait_max": waits[-1] if waits else 0.0}
+
+    op.reset, op.finish = reset, finish
+    return op
+
+
+def recommendations(store, rng):
+    """Titles borrowed together with a book, or suggestions for a member, as the search and issue windows show"""
+    top_book, top_member = store.conn.execute(
+        'SELECT (SELECT COALESCE(MAX(book_id), 1) FROM books), (SELECT COALESCE(MAX(member_id), 1) FROM members)').fetchone()
+
+    def op():
+        if rng.random() < 0.5:
+            store.similar_books(rng.randint(1, top_book))
+        else:
+            store.suggest_for_member(rng.randint(1, top_member))
+    return op
+
+
+SCENARIOS = {
+    "startup": startup,
+    "navigation": navigation,
+    "catalogue_search": catalogue_search,
+    "inventory_listing": inventory_listing,
+    "inventory_scroll": inventory_scroll,
+    "inventory_sorted": inventory_sorted,
+    "issued_filtering": issued_filtering,
+    "issued_totals": issued_totals,
+    "issued_sorted": issued_sorted,
+    "member_search": member_search,
+    "borrow_return": borrow_return,
+    "scan_circulation": scan_circulation,
+    "concurrent_circulation": concurrent_circulation,
+    "recommendations": recommendations,
+}
+
+
+# --- RUNNER ---
+def percentile(samples, pct):
+    """Nearest-rank percentile of already sorted samples"""
+    index = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def time_scenario(store, name, iterations, seed, warmup=WARMUP):
+    """Run one scenario and return its latency summary in milliseconds, or None if it cannot run here"""
+    rng = random.Random(f"{seed}:{name}")
+    op = SCENARIOS[name](store, rng)
+    if op is None:
+        return None
+    if name == "startup":
+        iterations, warmup = min(iterations, STARTUP_ITERATIONS), 1
+
+    for _ in range(warmup):
+        op()
+    if hasattr(op, "reset"):
+        op.reset()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        op()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    summary = {"n": len(samples), "mean": sum(samples) / len(samples),
+               "p50": percentile(samples, 50), "p95": percentile(samples, 95), "p99": percentile(samples, 99)}
+    # Scenarios that measure more than latency, e.g. throughput, add their own figures
+    if hasattr(op, "finish"):
+        summary.update(op.finish())
+    return summary
+
+
+def dataset_size(store):
+    stats = store.library_stats()
+    members = store.conn.execute('SELECT COUNT(*) FROM members').fetchone()[0]
+    return {"books": stats["titles"], "members": members, "transactions": stats["loans"]}
+
+
+def run_benchmarks(store, names=None, iterations=ITERATIONS, seed=42, progress=None):
+    """Run the named scenarios (default: all) and return the results dict saved as a baseline.
+
+    `progress(name, summary)` is called after each scenario.
+    """
+    results = {"dataset": dataset_size(store), "python": platform.python_version(),
+               "sqlite": sqlite3.sqlite_version, "iterations": iterations, "seed": seed, "scenarios": {}}
+    for name in names or SCENARIOS:
+        summary = time_scenario(store, name, iterations, seed)
+        if summary is not None:
+            results["scenarios"][name] = summary
+        if progress:
+            progress(name, summary)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return (report lines, names of regressed scenarios) comparing p95 against a baseline"""
+    lines, regressions = [], []
+    # borrow_return and scan_circulation add a few loans on every run, so only a change of over 1% counts as a different dataset
+    before, after = baseline.get("dataset", {}), results["dataset"]
+    if (before.get("books"), before.get("members")) != (after["books"], after["members"]) or \
+            abs(after["transactions"] - before.get("transactions", 0)) > 0.01 * after["transactions"]:
+        lines.append(f"warning: baseline dataset {baseline.get('dataset')} differs from {results['dataset']}")
+
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            lines.append(f"{name:<24} no baseline")
+            continue
+        change = current["p95"] / previous["p95"] - 1 if previous["p95"] else 0.0
+        regressed = change > tolerance and current["p95"] - previous["p95"] > NOISE_FLOOR_MS
+        if regressed:
+            regressions.append(name)
+        lines.append(f"{name:<24} p95 {previous['p95']:9.2f} -> {current['p95']:9.2f} ms ({change:+.0%})"
+                     + ("  REGRESSION" if regressed else ""))
+    return lines, regressions
+
+
+def format_summary(name, summary):
+    if summary is None:
+        return f"{name:<24} skipped (no display)"
+    line = (f"{name:<24} n={summary['n']:<5} p50 {summary['p50']:9.2f}  p95 {summary['p95']:9.2f}  "
+            f"p99 {summary['p99']:9.2f} ms")
+    if "loans_per_second" in summary:
+        line += (f"\n{'':<24} {summary['desks']} desks: {summary['loans_per_second']:,.0f} loans/s, "
+                 f"lock wait p50 {summary['lock_wait_p50']:.2f}  p95 {summary['lock_wait_p95']:.2f}  "
+                 f"max {summary['lock_wait_max']:.2f} ms, {summary['busy']} timed out")
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ILMS scenarios against a library database")
+    parser.add_argument("db", help="library database to benchmark")
+    parser.add_argument("--scenarios", help=f"comma-separated scenarios (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="timed calls per scenario")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the scenario inputs (default: 42)")
+    parser.add_argument("--baseline", help="compare against the results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed p95 growth (default: 0.25)")
+    parser.add_argument("--save-baseline", help="write these results to this JSON file")
+    parser.add_argument("--generate", nargs=3, type=int, metavar=("BOOKS", "MEMBERS", "TRANSACTIONS"),
+                        help="first generate the database with datagen if it does not exist")
+    args = parser.parse_args()
+
+    names = args.scenarios.split(",") if args.scenarios else None
+    unknown = set(names or []) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.generate and not os.path.exists(args.db):
+        print(generate_library(args.db, *args.generate, seed=args.seed).summary())
+
+    store = LibraryStore(args.db)
+    try:
+        results = run_benchmarks(store, names, args.iterations, args.seed,
+                                 progress=lambda name, summary: print(format_summary(name, summary)))
+    finally:
+        store.close()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print()
+        print("\n".join(lines))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
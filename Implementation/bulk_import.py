@@ -0,0 +1,309 @@
+"""
+Bulk catalogue import for ILMS.
+
+Streams books from CSV, JSON Lines or MARC21 (ISO 2709) files, validates
+ISBNs, and writes them with batched executemany upserts: a new ISBN adds
+a title, an ISBN that is already catalogued adds its copies to the
+existing record. Every new copy is catalogued as an item with its own
+barcode, and new copies of a title already on file go to members
+waiting on holds before they reach the shelf. Files are read record by
+record, so memory use does not grow with file size.
+
+Usage:
+    python bulk_import.py acquisitions.csv --db library.db --rejects rejects.csv
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import time
+
+from library_store import LibraryStore
+
+BATCH_SIZE = 10000
+MAX_REJECT_SAMPLES = 100
+
+# The last parameter is the highest book_id before the batch: new copies of older titles
+# are kept off available_copies here and released through the holds queue instead
+UPSERT_SQL = '''INSERT INTO books
+    (title, author, isbn, publisher, publication_year, category, total_copies, available_copies)
+    VALUES (?,?,?,?,?,?,?,?)
+    ON CONFLICT(isbn) DO UPDATE SET
+        total_copies = total_copies + excluded.total_copies,
+        available_copies = available_copies + CASE WHEN book_id > ? THEN excluded.available_copies ELSE 0 END'''
+
+# Accepted spellings of each column in CSV headers and JSON keys
+FIELD_ALIASES = {
+    "title": ("title", "book_title"),
+    "author": ("author", "authors", "creator"),
+    "isbn": ("isbn", "isbn13", "isbn_13", "isbn10", "isbn_10"),
+    "publisher": ("publisher",),
+    "publication_year": ("publication_year", "year", "published", "pub_year"),
+    "category": ("category", "subject", "genre"),
+    "copies": ("copies", "total_copies", "quantity", "qty"),
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.copies_added = 0
+        self.holds_ready = 0
+        self.rejected = 0
+        self.reject_reasons = {}
+        self.reject_samples = []   # (record number, reason) for the first rejected rows
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def reject(self, number, reason):
+        self.rejected += 1
+        self.reject_reasons[reason] = self.reject_reasons.get(reason, 0) + 1
+        if len(self.reject_samples) < MAX_REJECT_SAMPLES:
+            self.reject_samples.append((number, reason))
+
+    def summary(self):
+        lines = [f"Read {self.read} records in {self.seconds:.1f}s ({self.rows_per_second:,.0f} records/s)",
+                 f"New titles: {self.inserted}",
+                 f"Records that added copies to an existing ISBN: {self.copies_added}",
+                 f"Holds made ready by the new copies: {self.holds_ready}",
+                 f"Rejected: {self.rejected}"]
+        for reason, count in sorted(self.reject_reasons.items(), key=lambda r: -r[1]):
+            lines.append(f"  {reason}: {count}")
+        return "\n".join(lines)
+
+
+# --- VALIDATION ---
+def normalize_isbn(raw):
+    """Return the ISBN as bare digits (and a trailing X) if its check digit is valid, otherwise None"""
+    isbn = re.sub(r'[\s-]', '', str(raw or '')).upper()
+    if re.fullmatch(r'\d{9}[\dX]', isbn):
+        total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(isbn))
+        return isbn if total % 11 == 0 else None
+    if re.fullmatch(r'\d{13}', isbn):
+        total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(isbn))
+        return isbn if total % 10 == 0 else None
+    return None
+
+
+def clean_record(record):
+    """Validate one raw record and return the upsert parameters, or raise ValueError with the reason"""
+    title = (record.get("title") or "").strip()
+    author = (record.get("author") or "").strip()
+    if not title:
+        raise ValueError("missing title")
+    if not author:
+        raise ValueError("missing author")
+
+    isbn = normalize_isbn(record.get("isbn"))
+    if isbn is None:
+        raise ValueError("invalid ISBN")
+
+    year = str(record.get("publication_year") or "").strip()
+    match = re.search(r'\d{4}', year)
+    if year and not match:
+        raise ValueError("invalid publication year")
+
+    copies = str(record.get("copies") or "").strip() or "1"
+    if not copies.isdigit() or int(copies) < 1:
+        raise ValueError("invalid copies")
+
+    publisher = (record.get("publisher") or "").strip() or None
+    category = (record.get("category") or "").strip() or None
+    return (title, author, isbn, publisher, int(match.group()) if match else None, category,
+            int(copies), int(copies))
+
+
+# --- READERS ---
+def canonical_fields(keys):
+    """Map the file's column names onto ILMS field names"""
+    mapping = {}
+    for key in keys:
+        name = key.strip().lower().replace(" ", "_")
+        for field, aliases in FIELD_ALIASES.items():
+            if name in aliases and field not in mapping.values():
+                mapping[key] = field
+    return mapping
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        mapping = canonical_fields(reader.fieldnames or [])
+        for row in reader:
+            yield {field: row.get(key) for key, field in mapping.items()}
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                yield {}
+                continue
+            mapping = canonical_fields(obj.keys())
+            yield {field: obj[key] for key, field in mapping.items()}
+
+
+def read_marc(path, chunk_size=1 << 20):
+    """Stream MARC21 (ISO 2709) records as ILMS field dicts"""
+    buffer = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buffer += chunk
+            *records, buffer = buffer.split(b'\x1d')
+            for raw in records:
+                if raw.strip():
+                    yield parse_marc_record(raw)
+    if buffer.strip():
+        yield parse_marc_record(buffer)
+
+
+def parse_marc_record(raw):
+    try:
+        leader = raw[:24].decode('ascii')
+        base = int(leader[12:17])
+    except (UnicodeDecodeError, ValueError):
+        return {}
+    encoding = 'utf-8' if leader[9] == 'a' else 'latin-1'
+
+    fields = {}
+    directory = raw[24:base - 1]
+    for i in range(0, len(directory) - 11, 12):
+        entry = directory[i:i + 12].decode('ascii', 'replace')
+        tag, length, start = entry[:3], int(entry[3:7] or 0), int(entry[7:12] or 0)
+        data = raw[base + start:base + start + length].rstrip(b'\x1e').decode(encoding, 'replace')
+        if tag < '010':
+            continue
+        subfields = {}
+        for part in data[2:].split('\x1f')[1:]:
+            if part:
+                subfields.setdefault(part[0], part[1:].strip())
+        fields.setdefault(tag, subfields)
+
+    def first(*candidates):
+        for tag, code in candidates:
+            value = fields.get(tag, {}).get(code)
+            if value:
+                return value.strip(' /:;,.')
+        return None
+
+    title = first(('245', 'a'))
+    subtitle = first(('245', 'b'))
+    isbn = first(('020', 'a'))
+    return {
+        "title": f"{title}: {subtitle}" if title and subtitle else title,
+        "author": first(('100', 'a'), ('110', 'a'), ('111', 'a'), ('700', 'a')),
+        "isbn": isbn.split()[0] if isbn else None,
+        "publisher": first(('264', 'b'), ('260', 'b')),
+        "publication_year": first(('264', 'c'), ('260', 'c')),
+        "category": first(('650', 'a'), ('655', 'a')),
+    }
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "marc": read_marc}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".mrc": "marc", ".marc": "marc"}
+
+
+# --- IMPORT ---
+def import_books(store, path, fmt=None, batch_size=BATCH_SIZE, rejects_path=None, progress=None):
+    """Import every valid record in the file and return an ImportReport.
+
+    Each batch is written in one transaction. `progress(report)` is called
+    after every committed batch.
+    """
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported import format for {path}; use csv, jsonl or marc")
+
+    report = ImportReport()
+    started = time.perf_counter()
+    conn = store.conn
+    last_id = conn.execute('SELECT COALESCE(MAX(book_id), 0) FROM books').fetchone()[0]
+
+    rejects_file = open(rejects_path, 'w', newline='', encoding='utf-8') if rejects_path else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["record", "reason", "title", "author", "isbn"])
+
+    def flush(batch):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            batch_last_id = conn.execute('SELECT COALESCE(MAX(book_id), 0) FROM books').fetchone()[0]
+            last_item_id = conn.execute('SELECT COALESCE(MAX(item_id), 0) FROM items').fetchone()[0]
+            conn.executemany(UPSERT_SQL, (row + (batch_last_id,) for row in batch))
+            # Catalogue the new copies as items so they can be scanned at the desk
+            store.add_items([r[0] for r in store.fetch_by_ids('SELECT book_id FROM books WHERE isbn IN ({})',
+                                                               list({row[2] for row in batch}))])
+            # New copies of titles catalogued before this batch fill their waiting holds first
+            copies = {}
+            for book_id, item_id in conn.execute('SELECT book_id, item_id FROM items WHERE item_id > ? AND book_id <= ? '
+                                                 'ORDER BY item_id', (last_item_id, batch_last_id)):
+                copies.setdefault(book_id, []).append(item_id)
+            report.holds_ready += len(store.release_copies(copies))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        report.seconds = time.perf_counter() - started
+        if progress:
+            progress(report)
+
+    try:
+        batch = []
+        for number, record in enumerate(READERS[fmt](path), start=1):
+            report.read += 1
+            try:
+                batch.append(clean_record(record))
+            except ValueError as e:
+                report.reject(number, str(e))
+                if rejects:
+                    rejects.writerow([number, str(e), record.get("title"), record.get("author"), record.get("isbn")])
+                continue
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    report.inserted = conn.execute('SELECT COUNT(*) FROM books WHERE book_id > ?', (last_id,)).fetchone()[0]
+    report.copies_added = report.read - report.rejected - report.inserted
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import books into the ILMS catalogue")
+    parser.add_argument("file", help="CSV, JSON Lines or MARC21 file")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--format", choices=sorted(READERS), help="file format (default: from the extension)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="records per transaction")
+    parser.add_argument("--rejects", help="write rejected records and reasons to this CSV file")
+    args = parser.parse_args()
+
+    store = LibraryStore(args.db)
+    try:
+        report = import_books(store, args.file, args.format, args.batch_size, args.rejects,
+                              progress=lambda r: print(f"\r{r.read:,} records ({r.rows_per_second:,.0f}/s)", end=""))
+    finally:
+        store.close()
+    print()
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Process-wide cache of catalogue records.
+
+Books are kept as Book namedtuples (tuples, so no per-record __dict__) in
+a bounded LRU keyed by book_id, with a secondary ISBN index. Records are
+loaded lazily on first lookup or seeded from search results.
+
+Staleness is detected from the catalogue_state counter that triggers bump
+on every change to books. Reading it on every lookup would cost a query,
+so each thread first checks PRAGMA data_version (changes when another
+connection commits) and its connection's total_changes (changes when the
+thread itself writes); only when one of those moved is the counter read.
+Stores without a local connection (RemoteStore) read the counter on
+every validation.
+"""
+import threading
+from collections import OrderedDict
+
+
+class CatalogueCache:
+    def __init__(self, capacity=20000):
+        self.capacity = capacity
+        self.books = OrderedDict()   # book_id -> Book
+        self.by_isbn = {}            # isbn -> book_id
+        self.version = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def current_version(self, store):
+        """Return the catalogue version seen by this store's connection, reading the counter only after a change"""
+        conn = store.conn
+        if conn is None:
+            return store.catalogue_version()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        state = getattr(self.local, "state", None)
+        if state and state[0] is conn and state[1] == data_version and state[2] == conn.total_changes:
+            return state[3]
+
+        version = store.catalogue_version()
+        self.local.state = (conn, data_version, conn.total_changes, version)
+        return version
+
+    def validate(self, store):
+        """Drop every record if the catalogue changed and return the version to tag new records with.
+
+        Returns None if this connection still reads an older snapshot than
+        the cache holds; such reads bypass the cache.
+        """
+        version = self.current_version(store)
+        with self.lock:
+            if self.version is None or version > self.version:
+                self.books.clear()
+                self.by_isbn.clear()
+                self.version = version
+            return version if version == self.version else None
+
+    def get(self, store, book_id):
+        """Return the Book with this id, or None"""
+        version = self.validate(store)
+        if version is None:
+            return store.get_book(book_id)
+
+        with self.lock:
+            book = self.books.get(book_id)
+            if book is not None:
+                self.books.move_to_end(book_id)
+                self.hits += 1
+                return book
+
+        self.misses += 1
+        book = store.get_book(book_id)
+        if book is not None:
+            self.put_many([book], version)
+        return book
+
+    def get_by_isbn(self, store, isbn):
+        """Return the Book with this ISBN, or None"""
+        version = self.validate(store)
+        if version is None:
+            return store.get_book_by_isbn(isbn)
+
+        with self.lock:
+            book_id = self.by_isbn.get(isbn)
+            if book_id is not None:
+                self.books.move_to_end(book_id)
+                self.hits += 1
+                return self.books[book_id]
+
+        self.misses += 1
+        book = store.get_book_by_isbn(isbn)
+        if book is not None:
+            self.put_many([book], version)
+        return book
+
+    def put_many(self, books, version):
+        """Add Books read after validate() returned `version`, e.g. search results, to the cache"""
+        with self.lock:
+            if version is None or version != self.version:
+                return
+            for book in books:
+                old = self.books.pop(book.book_id, None)
+                if old is not None:
+                    self.by_isbn.pop(old.isbn, None)
+                self.books[book.book_id] = book
+                self.by_isbn[book.isbn] = book.book_id
+            while len(self.books) > self.capacity:
+                _, evicted = self.books.popitem(last=False)
+                self.by_isbn.pop(evicted.isbn, None)
+
+    def clear(self):
+        with self.lock:
+            self.books.clear()
+            self.by_isbn.clear()
+            self.version = None
@@ -0,0 +1,113 @@
+"""
+SQLite connection management for ILMS.
+
+ConnectionManager opens connections with the tuned PRAGMAs from a
+DatabaseConfig and hands each thread its own connection, so readers on
+one thread are never serialized behind a shared cursor on another.
+
+The defaults put the database in WAL mode, where readers keep reading
+while one writer commits. Settings can be overridden in an optional
+ilms.ini next to the application:
+
+    [database]
+    journal_mode = wal
+    synchronous = normal
+    cache_size_mb = 64
+    mmap_size_mb = 256
+    temp_store = memory
+    busy_timeout_ms = 5000
+
+WAL relies on shared memory, so every process must run on the machine
+that holds library.db. When desks open the file over a network share,
+set journal_mode = delete: they can then share the file, but readers
+wait for a writer to finish.
+
+If query profiling is enabled in ilms.ini (see query_profiler), every
+connection reports its statements to the process-wide QueryProfiler.
+"""
+import configparser
+import os
+import sqlite3
+import threading
+
+from query_profiler import ProfiledConnection, default_profiler
+
+
+class DatabaseConfig:
+    def __init__(self, journal_mode="wal", synchronous="normal", cache_size_mb=64, mmap_size_mb=256,
+                 temp_store="memory", busy_timeout_ms=5000):
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_mb = cache_size_mb
+        self.mmap_size_mb = mmap_size_mb
+        self.temp_store = temp_store
+        self.busy_timeout_ms = busy_timeout_ms
+
+    @classmethod
+    def load(cls, path="ilms.ini"):
+        """Read the [database] section of an ini file, falling back to the defaults"""
+        config = cls()
+        if not os.path.exists(path):
+            return config
+
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if parser.has_section("database"):
+            section = parser["database"]
+            config.journal_mode = section.get("journal_mode", config.journal_mode)
+            config.synchronous = section.get("synchronous", config.synchronous)
+            config.cache_size_mb = section.getint("cache_size_mb", config.cache_size_mb)
+            config.mmap_size_mb = section.getint("mmap_size_mb", config.mmap_size_mb)
+            config.temp_store = section.get("temp_store", config.temp_store)
+            config.busy_timeout_ms = section.getint("busy_timeout_ms", config.busy_timeout_ms)
+        return config
+
+    def pragmas(self):
+        return [
+            f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}",
+            f"PRAGMA journal_mode = {self.journal_mode}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA cache_size = {-1024 * int(self.cache_size_mb)}",
+            f"PRAGMA mmap_size = {1024 * 1024 * int(self.mmap_size_mb)}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+
+
+class ConnectionManager:
+    def __init__(self, db_name="library.db", config=None, profiler=None):
+        self.db_name = db_name
+        self.config = config or DatabaseConfig.load()
+        self.profiler = profiler or default_profiler()
+        self.local = threading.local()
+        self.fts_enabled = None   # set by the first LibraryStore once the schema is migrated
+
+    def connect(self):
+        """Open a new connection with the configured PRAGMAs applied"""
+        if self.profiler is None:
+            conn = sqlite3.connect(self.db_name, timeout=self.config.busy_timeout_ms / 1000)
+        else:
+            conn = sqlite3.connect(self.db_name, timeout=self.config.busy_timeout_ms / 1000, factory=ProfiledConnection)
+            conn.profiler = self.profiler
+        for pragma in self.config.pragmas():
+            conn.execute(pragma)
+        return conn
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self.local.conn = conn
+        return conn
+
+    def release(self):
+        """Close this thread's connection"""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            try:
+                # Refresh the planner statistics of tables that have grown since the last ANALYZE
+                conn.execute("PRAGMA optimize")
+            except sqlite3.OperationalError:
+                pass   # busy; the next connection to close will do it
+            conn.close()
+            self.local.conn = None
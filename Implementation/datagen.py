@@ -0,0 +1,212 @@
+"""
+Deterministic synthetic library generator for ILMS.
+
+Builds a library.db of any size (e.g. 1M books, 500k members, 20M
+transactions) for benchmarking. The same seed, sizes and end date always
+produce the same rows. Borrowing is skewed towards popular titles and
+active members, loans are spread over the history in date order, and the
+loans still open near the end date never exceed a title's copies, so
+available_copies and the statistics counters stay consistent.
+
+Rows are loaded into the version 1 tables before the remaining
+migrations run, so the secondary indexes, the search index and the
+counters are built once over the finished tables instead of row by row.
+
+Usage:
+    python datagen.py bench.db --books 1000000 --members 500000 --transactions 20000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from migrations import MIGRATIONS, migrate
+
+BATCH_SIZE = 50000
+LOAN_DAYS = 14
+
+FIRST_NAMES = ["Amara", "Ben", "Chen", "Dilani", "Elena", "Farid", "Grace", "Hiroshi", "Isuru", "Jonas",
+               "Kavya", "Liam", "Maya", "Nimal", "Olga", "Priya", "Quinn", "Ravi", "Sofia", "Tariq",
+               "Uma", "Victor", "Wei", "Ximena", "Yusuf", "Zara"]
+LAST_NAMES = ["Abeysekera", "Brown", "Costa", "Dias", "Evans", "Fernando", "Garcia", "Hughes", "Ito", "Jayasuriya",
+              "Kim", "Lopez", "Mendis", "Nakamura", "Okafor", "Perera", "Quint", "Rossi", "Silva", "Tanaka",
+              "Ueda", "Vance", "Wickrama", "Xu", "Young", "Zhang"]
+TITLE_WORDS = ["Silent", "River", "Empire", "Garden", "Shadow", "Winter", "Machine", "Ocean", "History", "Light",
+               "Forest", "Code", "Journey", "Island", "Memory", "Storm", "Quantum", "Kingdom", "Letters", "Night",
+               "Science", "Mountain", "Secret", "Algorithm", "Harbor", "Fire", "Stone", "Dream", "City", "Atlas",
+               "Economics", "Data", "Poems", "Voyage", "Tales", "Systems", "Moon", "Theory", "Song", "Design"]
+CATEGORIES = ["Fiction", "Science", "History", "Technology", "Children", "Biography", "Poetry", "Reference",
+              "Business", "Travel", "Art", "Philosophy"]
+PUBLISHERS = ["Penguin", "HarperCollins", "Oxford University Press", "Springer", "O'Reilly", "Vintage",
+              "Sarasavi", "Macmillan", "Wiley", "Cambridge University Press"]
+
+
+class GenerationReport:
+    def __init__(self):
+        self.books = 0
+        self.members = 0
+        self.transactions = 0
+        self.open_loans = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        return (f"Generated {self.books:,} books, {self.members:,} members and {self.transactions:,} transactions "
+                f"({self.open_loans:,} open) in {self.seconds:.1f}s")
+
+
+def isbn13(number):
+    """Return a valid ISBN-13 that is unique for each number below 10**9"""
+    digits = f"978{number:09d}"
+    check = (10 - sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(digits)) % 10) % 10
+    return f"{digits}{check}"
+
+
+def skewed(rng, n):
+    """Pick an id in 1..n with low ids far more likely, like title popularity or member activity"""
+    return int(n * rng.random() ** 3) + 1
+
+
+def generate_books(rng, count):
+    for book_id in range(1, count + 1):
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4)))
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        copies = rng.randint(1, 5)
+        yield (book_id, title, author, isbn13(book_id), rng.choice(PUBLISHERS), rng.randint(1950, 2025),
+               rng.choice(CATEGORIES), copies, copies)
+
+
+def generate_members(rng, count, start, end):
+    span = max(1, (end - start).days)
+    for member_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        joined = start + timedelta(days=rng.randrange(span))
+        yield (member_id, f"{first} {last}", f"{first}.{last}{member_id}@example.org".lower(),
+               f"07{rng.randrange(10 ** 8):08d}", f"{rng.randint(1, 999)} {rng.choice(TITLE_WORDS)} Road",
+               joined.isoformat(), "active" if rng.random() < 0.95 else "inactive")
+
+
+def generate_transactions(rng, count, books, members, copies, outstanding, end, years, fine_rate):
+    """Yield loans in borrow-date order; loans in the last 30 days stay open while copies remain.
+
+    Open loans are counted per book in `outstanding`.
+    """
+    days = max(1, int(years * 365))
+    start = end - timedelta(days=days)
+    dates = [(start + timedelta(days=d)).isoformat() for d in range(days + 31)]
+
+    for transaction_id in range(1, count + 1):
+        day = transaction_id * days // count
+        book_id, member_id = skewed(rng, books), skewed(rng, members)
+        due = day + LOAN_DAYS
+
+        if days - day < 30 and rng.random() < 0.6 and outstanding[book_id] < copies[book_id]:
+            outstanding[book_id] += 1
+            yield (transaction_id, member_id, book_id, dates[day], dates[due], None, 0.0, "borrowed")
+            continue
+
+        returned = min(day + rng.randint(1, LOAN_DAYS + 10), days)
+        fine = max(0, returned - due) * fine_rate
+        yield (transaction_id, member_id, book_id, dates[day], dates[due], dates[returned], fine, "returned")
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_library(path, books=10000, members=5000, transactions=200000, seed=42, end=None, years=5,
+                     fine_rate=1.0, progress=None):
+    """Create a new library database at `path` and return a GenerationReport.
+
+    `progress(table, rows)` is called after every committed batch.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists; generate into a new file")
+
+    end = end or date.today()
+    rng = random.Random(seed)
+    report = GenerationReport()
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(path)
+    try:
+        # Bulk load without a rollback journal; the file is thrown away if generation fails
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        MIGRATIONS[0](conn.cursor())
+        conn.execute('PRAGMA user_version = 1')
+
+        copies = bytearray(books + 1)
+        for batch in batched(generate_books(rng, books)):
+            conn.executemany('''INSERT INTO books (book_id, title, author, isbn, publisher, publication_year, category,
+                                total_copies, available_copies) VALUES (?,?,?,?,?,?,?,?,?)''', batch)
+            conn.commit()
+            for row in batch:
+                copies[row[0]] = row[7]
+            report.books += len(batch)
+            if progress:
+                progress("books", report.books)
+
+        joined_from = end - timedelta(days=int(years * 365))
+        for batch in batched(generate_members(rng, members, joined_from, end)):
+            conn.executemany('''INSERT INTO members (member_id, name, email, phone, address, membership_date, status)
+                                VALUES (?,?,?,?,?,?,?)''', batch)
+            conn.commit()
+            report.members += len(batch)
+            if progress:
+                progress("members", report.members)
+
+        outstanding = bytearray(books + 1)
+        loans = generate_transactions(rng, transactions, books, members, copies, outstanding, end, years, fine_rate)
+        for batch in batched(loans):
+            conn.executemany('''INSERT INTO transactions (transaction_id, member_id, book_id, borrow_date, due_date,
+                                return_date, fine_amount, status) VALUES (?,?,?,?,?,?,?,?)''', batch)
+            conn.commit()
+            report.transactions += len(batch)
+            report.open_loans += sum(1 for row in batch if row[7] == "borrowed")
+            if progress:
+                progress("transactions", report.transactions)
+
+        conn.executemany('UPDATE books SET available_copies = available_copies - ? WHERE book_id = ?',
+                         ((count, book_id) for book_id, count in enumerate(outstanding) if count))
+        conn.commit()
+
+        # Indexes, the search index and the counters are built over the loaded tables
+        migrate(conn)
+    except BaseException:
+        conn.close()
+        os.remove(path)
+        raise
+    conn.close()
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database for benchmarking")
+    parser.add_argument("db", help="database file to create (must not exist)")
+    parser.add_argument("--books", type=int, default=10000, help="number of titles (default: 10000)")
+    parser.add_argument("--members", type=int, default=5000, help="number of members (default: 5000)")
+    parser.add_argument("--transactions", type=int, default=200000, help="number of loans (default: 200000)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default: 42)")
+    parser.add_argument("--end", type=date.fromisoformat, help="date of the newest loan (default: today)")
+    parser.add_argument("--years", type=float, default=5, help="years of loan history (default: 5)")
+    args = parser.parse_args()
+
+    report = generate_library(args.db, args.books, args.members, args.transactions, args.seed, args.end, args.years,
+                              progress=lambda table, rows: print(f"\r{table}: {rows:,}".ljust(40), end=""))
+    print()
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Streaming export of ILMS data.
+
+Writes books, members or transactions to CSV, JSON Lines or Parquet
+(Parquet needs pyarrow). Rows are read from the cursor in fixed-size
+chunks and written straight out, so memory stays constant however large
+the table is. Books and transactions accept the same search/status
+filters as the inventory and issued-books windows, members the same
+search as the member directory, and every table can be written in any
+of the windows' sort orders (library_store.SORT_KEYS).
+
+Usage:
+    python export.py transactions loans.jsonl --status overdue
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+from library_store import LibraryStore, BOOK_COLUMNS, MEMBER_COLUMNS, LOAN_COLUMNS
+
+CHUNK_SIZE = 5000
+
+# Column names and value types ('int', 'str' or 'float') of each export
+EXPORT_COLUMNS = {
+    "books": [("book_id", "int"), ("title", "str"), ("author", "str"), ("isbn", "str"),
+              ("publisher", "str"), ("publication_year", "int"), ("category", "str"),
+              ("total_copies", "int"), ("available_copies", "int")],
+    "members": [("member_id", "int"), ("name", "str"), ("email", "str"), ("phone", "str"),
+                ("address", "str"), ("membership_date", "str"), ("status", "str")],
+    "transactions": [("transaction_id", "int"), ("member_id", "int"), ("member_name", "str"),
+                     ("book_id", "int"), ("title", "str"), ("borrow_date", "str"), ("due_date", "str"),
+                     ("return_date", "str"), ("status", "str"), ("fine_amount", "float")],
+}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+
+def export_query(store, table, search="", status=None, sort=None, descending=False):
+    """Return the SELECT and params that stream one table with the window filters and order applied"""
+    if table == "books":
+        where, params = store.book_filter(search, status)
+        order = store.keyset("books", sort or "book_id", descending)[0]
+        return f'SELECT {BOOK_COLUMNS} FROM books WHERE {where} ORDER BY {order}', params
+    if table == "members":
+        where, params, column = store.member_filter(search)
+        order = store.keyset("members", sort or column, descending)[0]
+        return f'SELECT {MEMBER_COLUMNS} FROM members WHERE {where} ORDER BY {order}', params
+    if table == "transactions":
+        where, params = store.loan_filter(search, status)
+        sort = sort or "transaction_id"
+        order = store.keyset("loans", sort, descending)[0]
+        return f'''SELECT {LOAN_COLUMNS}
+                   FROM {store.loan_tables(sort, descending, status)}
+                   WHERE {where}
+                   ORDER BY {order}''', params
+    raise ValueError(f"Unknown table {table!r}; choose books, members or transactions")
+
+
+# --- WRITERS ---
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+        types = {"int": pa.int64(), "str": pa.string(), "float": pa.float64()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        arrays = [self.pa.array([row[i] for row in rows], type=field.type)
+                  for i, field in enumerate(self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonLinesWriter, "parquet": ParquetWriter}
+
+
+def export_table(store, table, path, fmt=None, search="", status=None, sort=None, descending=False,
+                 chunk_size=CHUNK_SIZE):
+    """Stream one table to a file and return (rows written, seconds taken)"""
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format for {path}; use csv, jsonl or parquet")
+
+    started = time.perf_counter()
+    query, params = export_query(store, table, search, status, sort, descending)
+    writer = WRITERS[fmt](path, EXPORT_COLUMNS[table])
+    count = 0
+    try:
+        cursor = store.conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.write(rows)
+            count += len(rows)
+    finally:
+        writer.close()
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export ILMS data to CSV, JSON Lines or Parquet")
+    parser.add_argument("table", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("file", help="output file; the format is taken from the extension")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--format", choices=sorted(WRITERS))
+    parser.add_argument("--search", default="", help="search text, as in the inventory/member/issued-books windows")
+    parser.add_argument("--status", help="books: available, out_of_stock; transactions: active, overdue, returned")
+    parser.add_argument("--sort", help="column to order by, e.g. author or due_date (default: the id)")
+    parser.add_argument("--descending", action="store_true", help="reverse the order")
+    args = parser.parse_args()
+
+    store = LibraryStore(args.db)
+    try:
+        count, seconds = export_table(store, args.table, args.file, args.format, args.search, args.status,
+                                      args.sort, args.descending)
+    finally:
+        store.close()
+    print(f"Exported {count:,} {args.table} rows to {args.file} in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Late-fee policy and batch fine computation for ILMS.
+
+Fines are computed in SQL with julianday() arithmetic, so a return, a
+batch of returns or every open loan in the library is assessed by a single
+statement instead of one strptime() per row in Python. The policy is read
+from optional sections of ilms.ini:
+
+    [fines]
+    rate = 1.0
+    grace_days = 0
+    cap = 25.0
+
+    [fine_rates]
+    Reference = 2.0
+    Children = 0.25
+
+Usage:
+    python fines.py --db library.db
+"""
+import configparser
+import os
+import time
+from datetime import date
+
+
+def sql_literal(value):
+    """Quote a config value for embedding in SQL"""
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(float(value))
+
+
+class FinePolicy:
+    def __init__(self, rate=1.0, grace_days=0, cap=None, category_rates=None):
+        self.rate = rate
+        self.grace_days = grace_days
+        self.cap = cap
+        self.category_rates = category_rates or {}   # category -> rate per day
+
+    @classmethod
+    def load(cls, path="ilms.ini"):
+        """Read the [fines] and [fine_rates] sections of an ini file, falling back to $1 per day"""
+        policy = cls()
+        if not os.path.exists(path):
+            return policy
+
+        parser = configparser.ConfigParser()
+        parser.optionxform = str   # category names are case-sensitive
+        parser.read(path)
+        if parser.has_section("fines"):
+            section = parser["fines"]
+            policy.rate = section.getfloat("rate", policy.rate)
+            policy.grace_days = section.getint("grace_days", policy.grace_days)
+            policy.cap = section.getfloat("cap", policy.cap)
+        if parser.has_section("fine_rates"):
+            policy.category_rates = {category: float(rate) for category, rate in parser["fine_rates"].items()}
+        return policy
+
+    def fine(self, days_late, category=None):
+        """Fine for one loan, for callers that already have the day count"""
+        chargeable = max(0, days_late - self.grace_days)
+        fine = round(chargeable * self.category_rates.get(category, self.rate), 2)
+        return min(fine, self.cap) if self.cap is not None else fine
+
+    # --- SQL ---
+    def overdue_sql(self, due_column, on=None):
+        """SQL condition for a loan being overdue on `on` (default today): from the day after it falls due,
+        when days_late_sql() reaches 1. Every overdue filter, counter and job uses this one rule."""
+        on = (on or date.today()).isoformat()
+        return f"{due_column} < '{on}'"
+
+    def days_late_sql(self, due_column, on=None):
+        """SQL expression for the days between the due date and `on` (default today); negative if not yet due"""
+        on = (on or date.today()).isoformat()
+        return f"CAST(julianday('{on}') - julianday({due_column}) AS INTEGER)"
+
+    def fine_sql(self, due_column, category_column, on=None):
+        """SQL expression for the fine of a loan with the given due date and book category"""
+        chargeable = f"MAX(0, {self.days_late_sql(due_column, on)} - {int(self.grace_days)})"
+        rate = sql_literal(self.rate)
+        if self.category_rates:
+            cases = " ".join(f"WHEN {sql_literal(category)} THEN {sql_literal(r)}"
+                             for category, r in self.category_rates.items())
+            rate = f"(CASE {category_column} {cases} ELSE {rate} END)"
+        fine = f"ROUND({chargeable} * {rate}, 2)"
+        return f"MIN({fine}, {sql_literal(self.cap)})" if self.cap is not None else fine
+
+
+def recompute_open_fines(conn, policy, on=None):
+    """Set fine_amount on every open loan to the fine accrued as of `on`; returns the number of loans changed"""
+    fine = policy.fine_sql("transactions.due_date", "b.category", on)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.execute(f'''UPDATE transactions SET fine_amount = {fine}
+                                  FROM books b
+                                  WHERE b.book_id = transactions.book_id
+                                  AND transactions.status = 'borrowed'
+                                  AND transactions.fine_amount IS NOT {fine}''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Recompute accrued fines on all open loans")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--on", type=date.fromisoformat, help="assess fines as of this date (default: today)")
+    args = parser.parse_args()
+
+    from library_store import LibraryStore
+    store = LibraryStore(args.db)
+    try:
+        started = time.perf_counter()
+        changed = recompute_open_fines(store.conn, store.fine_policy, args.on)
+    finally:
+        store.close()
+    print(f"Updated fines on {changed:,} open loans in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1029 @@
+"""
+Headless data access layer for the Integrated Library Management System.
+
+All SQL used by the application lives here so the same queries can be run
+from the Tkinter GUI, batch scripts, a service or a benchmark harness
+without importing tkinter.
+"""
+import re
+import unicodedata
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from database import ConnectionManager
+from fines import FinePolicy
+from migrations import migrate, BORROWED_TOGETHER_WINDOW
+
+# --- ROW TYPES ---
+Book = namedtuple('Book', 'book_id title author isbn publisher publication_year category total_copies available_copies')
+Member = namedtuple('Member', 'member_id name email phone address membership_date status')
+Loan = namedtuple('Loan', 'transaction_id member_id member_name book_id title borrow_date due_date return_date status fine_amount days_out days_late')
+BatchResult = namedtuple('BatchResult', 'id ok title message')
+Hold = namedtuple('Hold', 'hold_id book_id title member_id member_name priority requested_at status ready_date expires_on position')
+Item = namedtuple('Item', 'item_id book_id copy_number barcode status')
+# What a scanned barcode resolves to: the copy, its title and its open loan (transaction_id None when on the shelf)
+Scan = namedtuple('Scan', 'item_id book_id copy_number barcode status title author transaction_id member_id member_name due_date')
+TrendRow = namedtuple('TrendRow', 'period loans returns overdue fines')
+CategoryUsage = namedtuple('CategoryUsage', 'category titles total_copies on_loan loans returns overdue fines loans_per_copy')
+TitleLoans = namedtuple('TitleLoans', 'book_id title author category loans')
+Recommendation = namedtuple('Recommendation', 'book_id title author category available_copies score')
+
+BOOK_COLUMNS = 'book_id, title, author, isbn, publisher, publication_year, category, total_copies, available_copies'
+MEMBER_COLUMNS = 'member_id, name, email, phone, address, membership_date, status'
+LOAN_COLUMNS = '''t.transaction_id, t.member_id, m.name, t.book_id, b.title,
+                  t.borrow_date, t.due_date, t.return_date, t.status, t.fine_amount'''
+# A waiting hold's position is one more than the holds ahead of it in its book's queue
+HOLD_COLUMNS = '''h.hold_id, h.book_id, b.title, h.member_id, m.name, h.priority, h.requested_at, h.status,
+                  h.ready_date, h.expires_on,
+                  CASE WHEN h.status = 'waiting' THEN 1 + (SELECT COUNT(*) FROM holds q
+                      WHERE q.book_id = h.book_id AND q.status = 'waiting'
+                      AND (q.priority > h.priority OR (q.priority = h.priority
+                           AND (q.requested_at, q.hold_id) < (h.requested_at, h.hold_id)))) END'''
+ITEM_COLUMNS = 'item_id, book_id, copy_number, barcode, status'
+# One probe of idx_items_barcode, then the book by rowid and the open loan through idx_transactions_item_open
+SCAN_QUERY = '''SELECT i.item_id, i.book_id, i.copy_number, i.barcode, i.status, b.title, b.author,
+                     t.transaction_id, t.member_id, m.name, t.due_date
+                FROM items i JOIN books b ON b.book_id = i.book_id
+                LEFT JOIN transactions t ON t.item_id = i.item_id AND t.status = 'borrowed'
+                LEFT JOIN members m ON m.member_id = t.member_id
+                WHERE i.barcode = ?'''
+# A loan keeps its title's category as of the day it is issued; the rollups count it there
+LOAN_INSERT = '''INSERT INTO transactions (member_id, borrow_date, due_date, item_id, book_id, category)
+                 SELECT ?, ?, ?, ?, book_id, COALESCE(category, '') FROM books WHERE book_id = ?'''
+
+SEARCH_FIELDS = ("title", "author", "isbn", "category")
+MAX_SQL_PARAMS = 900
+HOLD_PICKUP_DAYS = 7   # days a copy set aside for a hold waits on the hold shelf
+SUGGESTION_NEIGHBOURS = 25   # borrowed-together titles read per recent loan when suggesting for a member
+
+# One column of a sort key: the row field, the SQL it is ordered by and the value that stands in for NULL
+SortColumn = namedtuple('SortColumn', 'field sql default')
+
+
+def sort_key(*columns):
+    """Build a sort key from (field, SQL[, NULL stand-in]) pairs; the last column must be unique"""
+    return tuple(SortColumn(c[0], c[1], c[2] if len(c) > 2 else None) for c in columns)
+
+
+BOOK_ID = ("book_id", "book_id")
+MEMBER_ID = ("member_id", "member_id")
+TRANSACTION_ID = ("transaction_id", "t.transaction_id")
+
+# Orders the paged listings can be sorted in. Every key is the column list of an
+# index (migrations 3, 7 and 8), with nullable columns indexed through COALESCE, so
+# a sorted page is a range scan from the keyset cursor whichever column is chosen.
+SORT_KEYS = {
+    "books": {
+        "book_id": sort_key(BOOK_ID),
+        "title": sort_key(("title", "title"), BOOK_ID),
+        "author": sort_key(("author", "author"), BOOK_ID),
+        "isbn": sort_key(("isbn", "isbn"), BOOK_ID),
+        "publisher": sort_key(("publisher", "COALESCE(publisher, '')", ""), BOOK_ID),
+        "publication_year": sort_key(("publication_year", "COALESCE(publication_year, 0)", 0), BOOK_ID),
+        "category": sort_key(("category", "COALESCE(category, '')", ""), BOOK_ID),
+        "total_copies": sort_key(("total_copies", "total_copies"), BOOK_ID),
+        "available_copies": sort_key(("available_copies", "available_copies"), BOOK_ID),
+    },
+    "members": {
+        "member_id": sort_key(MEMBER_ID),
+        "name": sort_key(("name", "name COLLATE NOCASE"), MEMBER_ID),
+        "email": sort_key(("email", "COALESCE(email, '') COLLATE NOCASE", ""), MEMBER_ID),
+        "phone": sort_key(("phone", "COALESCE(phone, '')", ""), MEMBER_ID),
+        "membership_date": sort_key(("membership_date", "membership_date"), MEMBER_ID),
+        "status": sort_key(("status", "COALESCE(status, '')", ""), MEMBER_ID),
+    },
+    # Member and book orders walk each member's or book's loans through (member_id|book_id, status)
+    "loans": {
+        "transaction_id": sort_key(TRANSACTION_ID),
+        "member_id": sort_key(("member_id", "t.member_id"), ("status", "t.status"), TRANSACTION_ID),
+        "member_name": sort_key(("member_name", "m.name COLLATE NOCASE"), ("member_id", "t.member_id"),
+                                ("status", "t.status"), TRANSACTION_ID),
+        "book_id": sort_key(("book_id", "t.book_id"), ("status", "t.status"), TRANSACTION_ID),
+        "title": sort_key(("title", "b.title"), ("book_id", "t.book_id"), ("status", "t.status"), TRANSACTION_ID),
+        "borrow_date": sort_key(("borrow_date", "t.borrow_date"), TRANSACTION_ID),
+        "due_date": sort_key(("due_date", "t.due_date"), TRANSACTION_ID),
+        "return_date": sort_key(("return_date", "COALESCE(t.return_date, '')", ""), TRANSACTION_ID),
+        "status": sort_key(("status", "t.status"), ("due_date", "t.due_date"), TRANSACTION_ID),
+        "fine_amount": sort_key(("fine_amount", "COALESCE(t.fine_amount, 0)", 0.0), TRANSACTION_ID),
+    },
+}
+
+
+# How circulation_trend() groups the daily rollup
+TREND_PERIODS = {
+    "day": "day",
+    "week": "strftime('%Y-W%W', day)",
+    "month": "substr(day, 1, 7)",
+    "year": "substr(day, 1, 4)",
+}
+
+
+def prefix_range(prefix):
+    """Return [low, high) bounds that select every string starting with the prefix through an index"""
+    return [prefix, prefix + "\U0010ffff"]
+
+
+class LibraryError(Exception):
+    """Raised when a library operation cannot be completed"""
+
+
+class LibraryStore:
+    def __init__(self, db_name='library.db', manager=None, fine_policy=None):
+        # Stores created on the same thread from one manager share that thread's connection
+        self.manager = manager or ConnectionManager(db_name)
+        self.db_name = self.manager.db_name
+        self.fine_policy = fine_policy or FinePolicy.load()
+        self.conn = None
+        self.cursor = None
+        self.fts_enabled = False
+        self.init_database()
+
+    def close(self):
+        if self.conn:
+            self.manager.release()
+            self.conn = None
+
+    def interrupt(self):
+        """Abort the query running on this store's connection from another thread"""
+        self.conn.interrupt()
+
+    def clear_interrupt(self):
+        """Finish any statement an interrupted call left open so the next call starts clean"""
+        # SQLite keeps interrupting new statements until none of the old ones are active
+        if self.conn.in_transaction:
+            self.conn.rollback()
+        self.cursor.close()
+        self.cursor = self.conn.cursor()
+
+    # --- SCHEMA ---
+    def init_database(self):
+        self.conn = self.manager.connection()
+        self.cursor = self.conn.cursor()
+        # Only the first store on a manager checks the schema; worker-thread stores reuse its result
+        if self.manager.fts_enabled is None:
+            migrate(self.conn)
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='books_fts'")
+            self.manager.fts_enabled = self.cursor.fetchone() is not None
+        self.fts_enabled = self.manager.fts_enabled
+
+    # --- PAGING ---
+    def keyset(self, listing, sort, descending=False, after=None):
+        """Return (ORDER BY, extra WHERE, params) for one page of a listing in a SORT_KEYS order.
+
+        `after` is the page_cursor() of the last row already shown. The
+        first sort column is also bounded on its own so the range starts
+        on the index even when the key spans a join.
+        """
+        columns = SORT_KEYS[listing].get(sort)
+        if columns is None:
+            raise ValueError(f"Cannot sort {listing} by {sort!r}")
+        direction = " DESC" if descending else ""
+        order = ", ".join(c.sql + direction for c in columns)
+        if after is None:
+            return order, "", []
+
+        op = "<" if descending else ">"
+        if len(columns) == 1:
+            return order, f" AND {columns[0].sql} {op} ?", [after[0]]
+        key = ", ".join(c.sql for c in columns)
+        marks = ", ".join("?" * len(columns))
+        return order, f" AND {columns[0].sql} {op}= ? AND ({key}) {op} ({marks})", [after[0]] + list(after)
+
+    def page_cursor(self, listing, sort, row):
+        """Return the keyset cursor of a row for the given order, to pass as `after` for the next page"""
+        return tuple(c.default if getattr(row, c.field) is None else getattr(row, c.field)
+                     for c in SORT_KEYS[listing][sort])
+
+    def build_match_query(self, term, fields):
+        """Turn free text into an FTS5 query where every word is a prefix match on the given columns"""
+        tokens = re.findall(r'[^\W_]+', term.lower())
+        if not tokens:
+            return None
+        columns = " ".join(fields)
+        return " AND ".join(f'{{{columns}}} : "{token}"*' for token in tokens)
+
+    def text_matches(self, value, term):
+        """Check in Python whether a column value matches a search term the way the database would"""
+        if value is None:
+            return False
+        if not self.fts_enabled:
+            return term.lower() in str(value).lower()
+
+        # Mirror the unicode61 tokenizer: case-folded, diacritics removed, every query word a token prefix
+        folded = unicodedata.normalize('NFKD', str(value).lower())
+        words = re.findall(r'[^\W_]+', ''.join(c for c in folded if not unicodedata.combining(c)))
+        return all(any(w.startswith(token) for w in words) for token in re.findall(r'[^\W_]+', term.lower()))
+
+    def book_search_clause(self, term, fields=("title", "author", "isbn")):
+        """Return a WHERE fragment and its params matching books against a search term"""
+        if self.fts_enabled:
+            match = self.build_match_query(term, fields)
+            if match is None:
+                return "1", []
+            return "book_id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)", [match]
+
+        like = f'%{term}%'
+        return "(" + " OR ".join(f"{f} LIKE ?" for f in fields) + ")", [like] * len(fields)
+
+    # --- LIBRARIANS ---
+    @staticmethod
+    def hash_password(password):
+        import hashlib
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def authenticate(self, username, password):
+        """Return (librarian_id, username) for valid credentials, otherwise None"""
+        self.cursor.execute('SELECT librarian_id, username FROM librarians WHERE username=? AND password_hash=?',
+                            (username, self.hash_password(password)))
+        return self.cursor.fetchone()
+
+    def create_librarian(self, username, password, name):
+        """Register a librarian account; raises sqlite3.IntegrityError if the username is taken"""
+        self.cursor.execute('INSERT INTO librarians (username, password_hash, name) VALUES (?,?,?)',
+                            (username, self.hash_password(password), name))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    # --- BOOKS ---
+    def add_book(self, title, author, isbn, publisher=None, publication_year=None, category=None, copies=1):
+        """Insert a book and return its book_id; raises sqlite3.IntegrityError on a duplicate ISBN"""
+        self.cursor.execute('''INSERT INTO books
+            (title, author, isbn, publisher, publication_year, category, total_copies, available_copies)
+            VALUES (?,?,?,?,?,?,?,?)''',
+            (title, author, isbn, publisher, publication_year, category, copies, copies))
+        book_id = self.cursor.lastrowid
+        self.add_items([book_id])
+        self.conn.commit()
+        return book_id
+
+    def get_book(self, book_id):
+        """Return the Book with this id, or None"""
+        self.cursor.execute(f'SELECT {BOOK_COLUMNS} FROM books WHERE book_id=?', (book_id,))
+        row = self.cursor.fetchone()
+        return Book._make(row) if row else None
+
+    def get_book_by_isbn(self, isbn):
+        """Return the Book with this ISBN, or None"""
+        self.cursor.execute(f'SELECT {BOOK_COLUMNS} FROM books WHERE isbn=?', (isbn,))
+        row = self.cursor.fetchone()
+        return Book._make(row) if row else None
+
+    def update_book(self, book_id, title, author, isbn, publisher, publication_year, category, total_copies):
+        """Update a book's details; a change of total_copies adds or withdraws copies, raising LibraryError
+        if there are not enough copies on the shelf to withdraw"""
+        with self.write_transaction():
+            self.cursor.execute('SELECT total_copies, available_copies FROM books WHERE book_id=?', (book_id,))
+            row = self.cursor.fetchone()
+            if not row:
+                raise LibraryError("Book not found!")
+            old_total, available = row
+            removed = old_total - total_copies
+            if removed > available:
+                raise LibraryError(f"Only {available} copies are on the shelf; "
+                                   f"return the others before lowering the total to {total_copies}!")
+
+            self.cursor.execute('''UPDATE books SET
+                title=?, author=?, isbn=?, publisher=?, publication_year=?, category=?, total_copies=?,
+                available_copies=available_copies-?
+                WHERE book_id=?''',
+                (title, author, isbn, publisher, publication_year, category, total_copies, max(removed, 0), book_id))
+            if removed > 0:
+                # The last copies on the shelf are withdrawn; their barcodes stay with the loan history
+                self.cursor.execute('''UPDATE items SET status='withdrawn' WHERE item_id IN (
+                    SELECT item_id FROM items WHERE book_id=? AND status='available'
+                    ORDER BY copy_number DESC LIMIT ?)''', (book_id, removed))
+            elif removed < 0:
+                # New copies go to members waiting on holds before they reach the shelf
+                self.cursor.execute('SELECT COALESCE(MAX(item_id), 0) FROM items')
+                last_item_id = self.cursor.fetchone()[0]
+                self.add_items([book_id])
+                self.cursor.execute('SELECT item_id FROM items WHERE book_id=? AND item_id > ? ORDER BY item_id',
+                                    (book_id, last_item_id))
+                self.release_copies({book_id: [r[0] for r in self.cursor.fetchall()]})
+
+    def delete_book(self, book_id):
+        self.cursor.execute('DELETE FROM books WHERE book_id=?', (book_id,))
+        self.conn.commit()
+
+    def book_filter(self, search="", status=None, fields=("title", "author", "isbn")):
+        """Return a WHERE clause and params for the inventory search text and 'available'/'out_of_stock' status"""
+        where, params = self.book_search_clause(search, fields)
+
+        if status == "available":
+            where += " AND available_copies > 0"
+        elif status == "out_of_stock":
+            where += " AND available_copies = 0"
+        return where, params
+
+    def list_books(self, search="", status=None, fields=("title", "author", "isbn"), after=None, limit=None,
+                   sort="title", descending=False):
+        """Return Books matching the filters in a SORT_KEYS["books"] order, by title by default.
+
+        Pass the page_cursor() of the last row already shown, e.g. its
+        (title, book_id), as `after` to fetch the next page without
+        re-reading earlier rows.
+        """
+        where, params = self.book_filter(search, status, fields)
+        order, keyset, keyset_params = self.keyset("books", sort, descending, after)
+
+        query = f'SELECT {BOOK_COLUMNS} FROM books WHERE {where}{keyset} ORDER BY {order}'
+        params = params + keyset_params
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        self.cursor.execute(query, params)
+        return [Book._make(r) for r in self.cursor.fetchall()]
+
+    def book_totals(self, search="", status=None):
+        """Return (titles, available copies, issued copies) for the books matching the filters"""
+        if not search.strip() and status is None:
+            stats = self.library_stats()
+            return stats["titles"], stats["available_copies"], stats["total_copies"] - stats["available_copies"]
+
+        where, params = self.book_filter(search, status)
+        self.cursor.execute(f'''SELECT COUNT(*), COALESCE(SUM(available_copies), 0),
+                                COALESCE(SUM(total_copies - available_copies), 0)
+                                FROM books WHERE {where}''', params)
+        return self.cursor.fetchone()
+
+    def catalogue_version(self):
+        """Return the counter that changes whenever any row of books is inserted, updated or deleted"""
+        self.cursor.execute('SELECT version FROM catalogue_state WHERE id = 1')
+        return self.cursor.fetchone()[0]
+
+    def search_books(self, term, field="title", limit=None):
+        """Return Books whose field matches the term, best full-text matches first"""
+        if field not in SEARCH_FIELDS:
+            field = "title"
+
+        match = self.build_match_query(term, (field,)) if self.fts_enabled else None
+        if match:
+            self.cursor.execute(f'''SELECT {', '.join('b.' + c for c in BOOK_COLUMNS.split(', '))}
+                                FROM books_fts JOIN books b ON b.book_id = books_fts.rowid
+                                WHERE books_fts MATCH ? ORDER BY books_fts.rank
+                                LIMIT ?''', (match, -1 if limit is None else limit))
+        else:
+            self.cursor.execute(f'SELECT {BOOK_COLUMNS} FROM books WHERE {field} LIKE ? LIMIT ?', 
+                                (f'%{term}%', -1 if limit is None else limit))
+        return [Book._make(r) for r in self.cursor.fetchall()]
+
+    # --- MEMBERS ---
+    def add_member(self, name, email, phone, address):
+        """Register a member joining today and return the member_id"""
+        self.cursor.execute('INSERT INTO members (name, email, phone, address, membership_date) VALUES (?,?,?,?,?)',
+                            (name, email, phone, address, datetime.now().strftime('%Y-%m-%d')))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def get_member(self, member_id):
+        """Return the Member with this id, or None"""
+        self.cursor.execute(f'SELECT {MEMBER_COLUMNS} FROM members WHERE member_id=?', (member_id,))
+        row = self.cursor.fetchone()
+        return Member._make(row) if row else None
+
+    def member_filter(self, search=""):
+        """Return (WHERE clause, params, sort column) for a member directory search.
+
+        "mem042" finds a member ID, text with an @ an email prefix, digits
+        a phone prefix, and anything else a name prefix. Every form is a
+        range scan on one index; pages are keyed on the sort column.
+        """
+        term = search.strip()
+        if not term:
+            return "1", [], "name"
+
+        match = re.fullmatch(r'(?i)mem0*(\d+)', term)
+        if match:
+            return "member_id = ?", [int(match.group(1))], "member_id"
+        if "@" in term:
+            return ("COALESCE(email, '') COLLATE NOCASE >= ? AND COALESCE(email, '') COLLATE NOCASE < ?",
+                    prefix_range(term), "email")
+        if re.fullmatch(r'[\d\s()+-]+', term):
+            return "COALESCE(phone, '') >= ? AND COALESCE(phone, '') < ?", prefix_range(term), "phone"
+        return "name COLLATE NOCASE >= ? AND name COLLATE NOCASE < ?", prefix_range(term), "name"
+
+    def list_members(self, search="", after=None, limit=None, sort=None, descending=False):
+        """Return Members matching the directory search in a SORT_KEYS["members"] order.
+
+        Without a sort the rows come in the order of the column the search
+        ranges over. Pass the page_cursor() of the last row already shown
+        as `after` to fetch the next page.
+        """
+        where, params, column = self.member_filter(search)
+        order, keyset, keyset_params = self.keyset("members", sort or column, descending, after)
+
+        query = f'SELECT {MEMBER_COLUMNS} FROM members WHERE {where}{keyset} ORDER BY {order}'
+        params = params + keyset_params
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        self.cursor.execute(query, params)
+        return [Member._make(r) for r in self.cursor.fetchall()]
+
+    # --- STATISTICS ---
+    def library_stats(self):
+        """Return the trigger-maintained library-wide counters as a dict"""
+        self.cursor.execute('SELECT titles, total_copies, available_copies, loans, open_loans, fines FROM library_stats WHERE id = 1')
+        names = ("titles", "total_copies", "available_copies", "loans", "open_loans", "fines")
+        return dict(zip(names, self.cursor.fetchone()))
+
+    def category_stats(self):
+        """Return (category, titles, total copies, available copies) per category; uncategorised books are under ''"""
+        self.cursor.execute('SELECT category, titles, total_copies, available_copies FROM category_stats ORDER BY category')
+        return self.cursor.fetchall()
+
+    def member_stats(self, member_id):
+        """Return (loans, open loans, fines) for one member"""
+        self.cursor.execute('SELECT loans, open_loans, fines FROM member_stats WHERE member_id=?', (member_id,))
+        return self.cursor.fetchone() or (0, 0, 0.0)
+
+    def overdue_count(self):
+        """Count open loans past their due date; the only statistic that changes with the clock"""
+        self.cursor.execute(f"""SELECT COUNT(*) FROM transactions
+                                WHERE status = 'borrowed' AND {self.fine_policy.overdue_sql("due_date")}""")
+        return self.cursor.fetchone()[0]
+
+    # --- ANALYTICS ---
+    # Reports read the rollups of migration 11, which grow with days and titles, not with loans
+    def rollup_filter(self, start=None, end=None, category=None):
+        """Return a WHERE clause and params for circulation_daily rows between two ISO dates (inclusive)"""
+        where, params = ["1"], []
+        if start:
+            where.append("day >= ?")
+            params.append(str(start))
+        if end:
+            where.append("day <= ?")
+            params.append(str(end))
+        if category is not None:
+            where.append("category = ?")
+            params.append(category)
+        return " AND ".join(where), params
+
+    def circulation_trend(self, start=None, end=None, by="month", category=None):
+        """Return a TrendRow of loans, returns, overdue loans and fines per day, week, month or year"""
+        if by not in TREND_PERIODS:
+            raise ValueError(f"Unknown trend period {by!r}")
+        where, params = self.rollup_filter(start, end, category)
+        self.cursor.execute(f'''SELECT {TREND_PERIODS[by]}, SUM(loans), SUM(returns), SUM(overdue), SUM(fines)
+                                FROM circulation_daily WHERE {where} GROUP BY 1 ORDER BY 1''', params)
+        return [TrendRow._make(r) for r in self.cursor.fetchall()]
+
+    def category_utilisation(self, start=None, end=None):
+        """Return a CategoryUsage per category: stock, copies on loan now and circulation over the dates"""
+        where, params = self.rollup_filter(start, end)
+        self.cursor.execute(f'''SELECT c.category, c.titles, c.total_copies, c.total_copies - c.available_copies,
+                                COALESCE(r.loans, 0), COALESCE(r.returns, 0), COALESCE(r.overdue, 0), COALESCE(r.fines, 0),
+                                ROUND(COALESCE(r.loans, 0) * 1.0 / MAX(c.total_copies, 1), 2)
+                                FROM category_stats c LEFT JOIN (
+                                    SELECT category, SUM(loans) AS loans, SUM(returns) AS returns,
+                                           SUM(overdue) AS overdue, SUM(fines) AS fines
+                                    FROM circulation_daily WHERE {where} GROUP BY category) r ON r.category = c.category
+                                ORDER BY 9 DESC, c.category''', params)
+        return [CategoryUsage._make(r) for r in self.cursor.fetchall()]
+
+    def most_borrowed(self, period="", limit=20):
+        """Return the TitleLoans most borrowed in a month ('2026-10'), a year ('2026') or all time ('')"""
+        if not re.fullmatch(r'(\d{4}(-\d{2})?)?', period or ""):
+            raise ValueError(f"Unknown period {period!r}; use YYYY-MM, YYYY or '' for all time")
+        self.cursor.execute('''SELECT t.book_id, b.title, b.author, b.category, t.loans
+                               FROM title_loans t JOIN books b ON b.book_id = t.book_id
+                               WHERE t.period = ? ORDER BY t.loans DESC, t.book_id LIMIT ?''',
+                            (period or "", int(limit)))
+        return [TitleLoans._make(r) for r in self.cursor.fetchall()]
+
+    # --- RECOMMENDATIONS ---
+    # book_pairs (migration 12) counts the members who borrowed each pair of titles close together
+    def similar_books(self, book_id, limit=10):
+        """Return Recommendations for the titles most often borrowed together with a book; score is the member count"""
+        self.cursor.execute('''SELECT b.book_id, b.title, b.author, b.category, b.available_copies, p.together
+                               FROM book_pairs p JOIN books b ON b.book_id = p.book_b
+                               WHERE p.book_a = ? ORDER BY p.together DESC, p.book_b LIMIT ?''',
+                            (book_id, int(limit)))
+        return [Recommendation._make(r) for r in self.cursor.fetchall()]
+
+    def suggest_for_member(self, member_id, limit=10):
+        """Return Recommendations for a member from the titles borrowed together with their recent loans.
+
+        Each title in the member's last BORROWED_TOGETHER_WINDOW loans
+        contributes its SUGGESTION_NEIGHBOURS strongest pairs, so the work
+        is bounded however long the member's history is. Titles the
+        member has borrowed before are left out.
+        """
+        self.cursor.execute(f'''SELECT DISTINCT book_id FROM (SELECT book_id FROM transactions WHERE member_id = ?
+                                ORDER BY transaction_id DESC LIMIT {BORROWED_TOGETHER_WINDOW})''', (member_id,))
+        scores = {}
+        for (seed,) in self.cursor.fetchall():
+            self.cursor.execute('''SELECT book_b, together FROM book_pairs WHERE book_a = ?
+                                   ORDER BY together DESC, book_b LIMIT ?''', (seed, SUGGESTION_NEIGHBOURS))
+            for book_id, together in self.cursor.fetchall():
+                scores[book_id] = scores.get(book_id, 0) + together
+        for (book_id,) in self.fetch_by_ids(
+                f'SELECT DISTINCT book_id FROM transactions WHERE member_id = {int(member_id)} AND book_id IN ({{}})',
+                list(scores)):
+            del scores[book_id]
+
+        rows = self.fetch_by_ids('''SELECT book_id, title, author, category, available_copies, 0
+                                    FROM books WHERE book_id IN ({})''', list(scores))
+        suggestions = [Recommendation._make(r)._replace(score=scores[r[0]]) for r in rows]
+        suggestions.sort(key=lambda r: (-r.score, r.book_id))
+        return suggestions[:limit]
+
+    # --- TRANSACTIONS ---
+    @contextmanager
+    def write_transaction(self):
+        """Hold the database write lock from the first read so check-then-write sequences cannot race"""
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.cursor
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def borrow_book(self, member_id, book_id, days=14):
+        """Issue a book to a member; returns (book, member, due_date) or raises LibraryError"""
+        due = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
+
+        with self.write_transaction():
+            # A copy set aside for the member's hold was never put back on the shelf count
+            shelf = self.fulfil_holds(member_id, book_id)
+            if not shelf:
+                # Claim a copy only if one is left; a concurrent desk cannot take the same copy
+                self.cursor.execute('UPDATE books SET available_copies=available_copies-1 WHERE book_id=? AND available_copies > 0',
+                                    (book_id,))
+                if self.cursor.rowcount != 1:
+                    raise LibraryError("Book not available or doesn't exist!")
+
+            member = self.get_member(member_id)
+            if not member:
+                raise LibraryError("Member not found!")
+
+            # The hold shelf copy, or the first copy on the shelf, is the one that goes out
+            item_id = shelf[1] if shelf else self.take_item(book_id)
+            self.cursor.execute(LOAN_INSERT, (member_id, datetime.now().strftime('%Y-%m-%d'), due, item_id, book_id))
+            if item_id:
+                self.cursor.execute("UPDATE items SET status='on_loan' WHERE item_id=?", (item_id,))
+            book = self.get_book(book_id)
+        return book, member, due
+
+    def return_book(self, transaction_id):
+        """Close a loan and charge the late fee; returns (fine, days_late, hold) or raises LibraryError.
+
+        If members are waiting for the title the copy goes to the first of
+        them and `hold` is their Hold, now ready for pickup; otherwise None.
+        """
+        policy = self.fine_policy
+        with self.write_transaction():
+            self.cursor.execute(f'''SELECT t.book_id, t.item_id, {policy.fine_sql("t.due_date", "b.category")},
+                                {policy.days_late_sql("t.due_date")}
+                                FROM transactions t JOIN books b ON t.book_id = b.book_id
+                                WHERE t.transaction_id=?''', (transaction_id,))
+            res = self.cursor.fetchone()
+            if not res:
+                raise LibraryError("Transaction not found!")
+
+            book_id, item_id, fine, days_late = res
+            self.cursor.execute("""UPDATE transactions SET status='returned', return_date=?, fine_amount=?
+                                WHERE transaction_id=? AND status='borrowed'""",
+                                (datetime.now().strftime('%Y-%m-%d'), fine, transaction_id))
+            if self.cursor.rowcount != 1:
+                raise LibraryError("This book has already been returned!")
+            ready = self.release_copies({book_id: [item_id]})
+            hold = self.get_hold(ready[0]) if ready else None
+        return fine, days_late, hold
+
+    def fetch_by_ids(self, query, ids):
+        """Run a query containing `IN ({})` for any number of ids, in chunks that fit SQLite's parameter limit"""
+        rows = []
+        for i in range(0, len(ids), MAX_SQL_PARAMS):
+            chunk = ids[i:i + MAX_SQL_PARAMS]
+            self.cursor.execute(query.format(",".join("?" * len(chunk))), chunk)
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def borrow_books(self, member_id, book_ids, days=14):
+        """Issue a list of scanned books to one member in a single transaction.
+
+        Returns (member, due_date, results) with one BatchResult per scanned
+        id; a book scanned twice needs two available copies. A copy on the
+        hold shelf for this member is issued before any free copy.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        due = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
+
+        with self.write_transaction():
+            member = self.get_member(member_id)
+            if not member:
+                raise LibraryError("Member not found!")
+
+            # Validate every scanned book, and find the copies held for this member, with one lookup each
+            found = {r[0]: r for r in self.fetch_by_ids(
+                'SELECT book_id, title, available_copies FROM books WHERE book_id IN ({})', list(set(book_ids)))}
+            remaining = {book_id: r[2] for book_id, r in found.items()}
+            held = {r[1]: (r[0], r[2]) for r in self.fetch_by_ids(
+                f"""SELECT hold_id, book_id, item_id FROM holds
+                    WHERE member_id = {int(member_id)} AND status = 'ready' AND book_id IN ({{}})""", list(found))}
+
+            results, issued, fulfilled = [], [], []
+            for book_id in book_ids:
+                row = found.get(book_id)
+                if not row:
+                    results.append(BatchResult(book_id, False, None, "Book not found"))
+                elif book_id in held:
+                    hold_id, item_id = held.pop(book_id)
+                    fulfilled.append(hold_id)
+                    issued.append((book_id, item_id))
+                    results.append(BatchResult(book_id, True, row[1], f"Due {due} (from the hold shelf)"))
+                elif remaining[book_id] <= 0:
+                    results.append(BatchResult(book_id, False, row[1], "No copies available"))
+                else:
+                    remaining[book_id] -= 1
+                    issued.append((book_id, self.take_item(book_id)))
+                    results.append(BatchResult(book_id, True, row[1], f"Due {due}"))
+
+            self.cursor.executemany(LOAN_INSERT, [(member_id, today, due, item_id, book_id) for book_id, item_id in issued])
+            self.cursor.executemany("UPDATE items SET status='on_loan' WHERE item_id=?",
+                                    [(item_id,) for _, item_id in issued if item_id])
+            issued = {book_id for book_id, _ in issued}
+            self.cursor.executemany('UPDATE books SET available_copies=? WHERE book_id=?',
+                                    [(remaining[book_id], book_id) for book_id in issued])
+            # Issued books meet the member's holds, whether the copy came off the hold shelf or not
+            self.cursor.executemany("UPDATE holds SET status='fulfilled', closed_date=? WHERE hold_id=?",
+                                    [(today, hold_id) for hold_id in fulfilled])
+            self.cursor.executemany("""UPDATE holds SET status='fulfilled', closed_date=?
+                                       WHERE member_id=? AND book_id=? AND status='waiting'""",
+                                    [(today, member_id, book_id) for book_id in issued])
+        return member, due, results
+
+    def return_loans(self, transaction_ids, member_id=None):
+        """Close a list of scanned loans in a single transaction and charge late fees.
+
+        If member_id is given, loans belonging to other members are refused.
+        Returned copies go to waiting holds first. Returns one BatchResult
+        per scanned id.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        policy = self.fine_policy
+
+        with self.write_transaction():
+            # Validate every loan and assess its fine with one lookup
+            found = {r[0]: r for r in self.fetch_by_ids(
+                f'''SELECT t.transaction_id, t.book_id, t.member_id, t.status, b.title,
+                          {policy.fine_sql("t.due_date", "b.category")}, {policy.days_late_sql("t.due_date")}, t.item_id
+                   FROM transactions t JOIN books b ON t.book_id = b.book_id
+                   WHERE t.transaction_id IN ({{}})''', list(set(transaction_ids)))}
+
+            results, closed, returned_copies = [], [], {}
+            for transaction_id in transaction_ids:
+                row = found.get(transaction_id)
+                if not row:
+                    results.append(BatchResult(transaction_id, False, None, "Transaction not found"))
+                elif member_id is not None and row[2] != member_id:
+                    results.append(BatchResult(transaction_id, False, row[4], "Borrowed by another member"))
+                elif row[3] == "returned" or transaction_id in returned_copies:
+                    results.append(BatchResult(transaction_id, False, row[4], "Already returned"))
+                else:
+                    fine, days_late = row[5], row[6]
+                    closed.append((today, fine, transaction_id))
+                    returned_copies[transaction_id] = row[1]
+                    message = f"Late fee ${fine:.2f} ({days_late} days late)" if fine > 0 else "Returned"
+                    results.append(BatchResult(transaction_id, True, row[4], message))
+
+            self.cursor.executemany("UPDATE transactions SET status='returned', return_date=?, fine_amount=? WHERE transaction_id=?",
+                                    closed)
+            copies = {}
+            for transaction_id, book_id in returned_copies.items():
+                copies.setdefault(book_id, []).append(found[transaction_id][7])
+            ready = self.release_copies(copies)
+            if ready:
+                # Tell the desk which returned copies go to the hold shelf, one per ready hold
+                waiting = {}
+                for hold in self.fetch_by_ids(f"""SELECT {HOLD_COLUMNS} FROM holds h
+                                                  JOIN books b ON h.book_id = b.book_id
+                                                  JOIN members m ON h.member_id = m.member_id
+                                                  WHERE h.hold_id IN ({{}})""", ready):
+                    waiting.setdefault(hold[1], []).append(Hold._make(hold))
+                for i, result in enumerate(results):
+                    holds = waiting.get(returned_copies.get(result.id)) if result.ok else None
+                    if holds:
+                        hold = holds.pop(0)
+                        results[i] = result._replace(message=f"{result.message}; hold ready for {hold.member_name}")
+        return results
+
+    def loan_filter(self, search="", status=None):
+        """Return a WHERE clause and params for loans by member name/book title and 'active'/'overdue'/'returned'"""
+        search_term = f'%{search}%'
+        where = "(m.name LIKE ? OR b.title LIKE ?)"
+        params = [search_term, search_term]
+
+        if status == "active":
+            where += " AND t.status = 'borrowed'"
+        elif status == "overdue":
+            where += f" AND t.status = 'borrowed' AND {self.fine_policy.overdue_sql('t.due_date')}"
+        elif status == "returned":
+            where += " AND t.status = 'returned'"
+        return where, params
+
+    def loan_tables(self, sort="borrow_date", descending=True, status=None):
+        """Return the FROM clause joining loans to their member and book for a SORT_KEYS["loans"] order"""
+        # The table whose index the order walks drives the join (CROSS JOIN fixes the order),
+        # otherwise the planner may start from another table and sort every matching row
+        if sort == "member_name":
+            return '''members m CROSS JOIN transactions t ON t.member_id = m.member_id
+                      CROSS JOIN books b ON t.book_id = b.book_id'''
+        if sort == "title":
+            return '''books b CROSS JOIN transactions t ON t.book_id = b.book_id
+                      CROSS JOIN members m ON t.member_id = m.member_id'''
+
+        # Open loans are few (at most one per copy), so reading them all and sorting beats
+        # walking a sort index past the whole loan history to find them, unless the walk
+        # starts from the newest loans, which is where the open ones are
+        newest_first = descending and sort in ("borrow_date", "transaction_id")
+        open_loans = status in ("active", "overdue") and not newest_first
+        indexed = " INDEXED BY idx_transactions_status_due" if open_loans else ""
+        return f'''transactions t{indexed}
+                   CROSS JOIN members m ON t.member_id = m.member_id
+                   CROSS JOIN books b ON t.book_id = b.book_id'''
+
+    def list_loans(self, search="", status=None, after=None, limit=None, sort="borrow_date", descending=True):
+        """Return Loans matching the filters in a SORT_KEYS["loans"] order, most recent first by default.
+
+        Pass the page_cursor() of the last row already shown, e.g. its
+        (borrow_date, transaction_id), as `after` to fetch the next page.
+        """
+        where, params = self.loan_filter(search, status)
+        order, keyset, keyset_params = self.keyset("loans", sort, descending, after)
+        where += keyset
+        params = params + keyset_params
+
+        tables = self.loan_tables(sort, descending, status)
+
+        # Loan lengths and overdue days are worked out in SQL for the whole page
+        today = date.today().isoformat()
+        query = f'''SELECT {LOAN_COLUMNS},
+                   CAST(julianday(COALESCE(t.return_date, '{today}')) - julianday(t.borrow_date) AS INTEGER),
+                   CASE WHEN t.return_date IS NULL THEN {self.fine_policy.days_late_sql("t.due_date")} END
+                   FROM {tables}
+                   WHERE {where}
+                   ORDER BY {order}'''
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        self.cursor.execute(query, params)
+        return [Loan._make(r) for r in self.cursor.fetchall()]
+
+    def loan_totals(self, search="", status=None):
+        """Return (transactions, active, overdue, fines) for the loans matching the filters"""
+        if not search.strip() and status is None:
+            stats = self.library_stats()
+            overdue = self.overdue_count()
+            return stats["loans"], stats["open_loans"] - overdue, overdue, stats["fines"]
+
+        where, params = self.loan_filter(search, status)
+        overdue = self.fine_policy.overdue_sql("t.due_date")
+        self.cursor.execute(f'''SELECT COUNT(*),
+                                COALESCE(SUM(t.return_date IS NULL AND NOT {overdue}), 0),
+                                COALESCE(SUM(t.return_date IS NULL AND {overdue}), 0),
+                                COALESCE(SUM(t.fine_amount), 0)
+                                FROM transactions t
+                                JOIN members m ON t.member_id = m.member_id
+                                JOIN books b ON t.book_id = b.book_id
+                                WHERE {where}''', params)
+        return self.cursor.fetchone()
+
+    # --- HOLDS ---
+    def get_hold(self, hold_id):
+        self.cursor.execute(f'''SELECT {HOLD_COLUMNS} FROM holds h
+                                JOIN books b ON h.book_id = b.book_id
+                                JOIN members m ON h.member_id = m.member_id
+                                WHERE h.hold_id=?''', (hold_id,))
+        row = self.cursor.fetchone()
+        return Hold._make(row) if row else None
+
+    def place_hold(self, member_id, book_id, priority=0):
+        """Queue a member for a title with no copies left; returns the new Hold or raises LibraryError"""
+        with self.write_transaction():
+            book = self.get_book(book_id)
+            if not book:
+                raise LibraryError("Book not found!")
+            if not self.get_member(member_id):
+                raise LibraryError("Member not found!")
+            if book.available_copies > 0:
+                raise LibraryError("Copies of this book are available; issue it instead!")
+            self.cursor.execute("""SELECT 1 FROM holds WHERE member_id=? AND book_id=? AND status IN ('waiting', 'ready')""",
+                                (member_id, book_id))
+            if self.cursor.fetchone():
+                raise LibraryError("This member already has a hold on this book!")
+            self.cursor.execute("SELECT 1 FROM transactions WHERE member_id=? AND book_id=? AND status='borrowed'",
+                                (member_id, book_id))
+            if self.cursor.fetchone():
+                raise LibraryError("This member already has this book on loan!")
+
+            self.cursor.execute('INSERT INTO holds (book_id, member_id, priority, requested_at) VALUES (?,?,?,?)',
+                                (book_id, member_id, int(priority), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            return self.get_hold(self.cursor.lastrowid)
+
+    def list_holds(self, book_id=None, member_id=None, status=None, limit=None):
+        """List holds for a book and/or member, ready ones first by pickup deadline, then the queue in order.
+
+        status is 'waiting', 'ready', 'closed' or None for every open hold.
+        """
+        where, params = [], []
+        if status == "closed":
+            where.append("h.status IN ('fulfilled', 'cancelled', 'expired')")
+        elif status:
+            where.append("h.status = ?")
+            params.append(status)
+        else:
+            where.append("h.status IN ('waiting', 'ready')")
+        if book_id is not None:
+            where.append("h.book_id = ?")
+            params.append(book_id)
+        if member_id is not None:
+            where.append("h.member_id = ?")
+            params.append(member_id)
+
+        # The hold shelf alone is read in deadline order straight off idx_holds_ready
+        order = ("h.expires_on, h.hold_id" if status == "ready" else
+                 "h.status = 'waiting', h.expires_on, h.book_id, h.priority DESC, h.requested_at, h.hold_id")
+        query = f'''SELECT {HOLD_COLUMNS} FROM holds h
+                    JOIN books b ON h.book_id = b.book_id
+                    JOIN members m ON h.member_id = m.member_id
+                    WHERE {" AND ".join(where)}
+                    ORDER BY {order}'''
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        self.cursor.execute(query, params)
+        return [Hold._make(r) for r in self.cursor.fetchall()]
+
+    def cancel_hold(self, hold_id):
+        """Cancel an open hold; a copy already set aside passes to the next member in the queue.
+
+        Returns the Hold that received the copy, or None.
+        """
+        with self.write_transaction():
+            self.cursor.execute("SELECT book_id, status, item_id FROM holds WHERE hold_id=?", (hold_id,))
+            row = self.cursor.fetchone()
+            if not row:
+                raise LibraryError("Hold not found!")
+            if row[1] not in ("waiting", "ready"):
+                raise LibraryError(f"This hold is already {row[1]}!")
+
+            self.cursor.execute("UPDATE holds SET status='cancelled', closed_date=? WHERE hold_id=?",
+                                (datetime.now().strftime('%Y-%m-%d'), hold_id))
+            ready = self.release_copies({row[0]: [row[2]]}) if row[1] == "ready" else []
+            return self.get_hold(ready[0]) if ready else None
+
+    def expire_holds(self, on=None, pickup_days=HOLD_PICKUP_DAYS):
+        """Expire ready holds not collected by `on` (default today) and pass their copies down each queue.
+
+        Runs as one transaction; returns (expired, passed_on) counts.
+        """
+        on = on or date.today()
+        with self.write_transaction():
+            self.cursor.execute("""SELECT hold_id, book_id, item_id FROM holds INDEXED BY idx_holds_ready
+                                   WHERE status = 'ready' AND expires_on < ?""", (on.isoformat(),))
+            rows = self.cursor.fetchall()
+            self.cursor.executemany("UPDATE holds SET status='expired', closed_date=? WHERE hold_id=?",
+                                    [(on.isoformat(), hold_id) for hold_id, _, _ in rows])
+            copies = {}
+            for _, book_id, item_id in rows:
+                copies.setdefault(book_id, []).append(item_id)
+            ready = self.release_copies(copies, on, pickup_days)
+        return len(rows), len(ready)
+
+    def release_copies(self, copies, on=None, pickup_days=HOLD_PICKUP_DAYS):
+        """Give copies coming back to the shelf to the front of each waiting queue.
+
+        `copies` maps book_id to the ids of the returned items (None for a
+        copy lent without one). Copies nobody is waiting for go back on
+        available_copies. Must run inside write_transaction(); returns the
+        ids of the holds made ready.
+        """
+        on = on or date.today()
+        expires = (on + timedelta(days=pickup_days)).isoformat()
+        ready, items, restocked = [], [], []
+        for book_id, returned in copies.items():
+            self.cursor.execute("""SELECT hold_id FROM holds WHERE book_id=? AND status='waiting'
+                                   ORDER BY priority DESC, requested_at, hold_id LIMIT ?""", (book_id, len(returned)))
+            hold_ids = [r[0] for r in self.cursor.fetchall()]
+            ready.extend(zip(hold_ids, returned))
+            items.extend(("on_hold", item_id) for item_id in returned[:len(hold_ids)] if item_id)
+            items.extend(("available", item_id) for item_id in returned[len(hold_ids):] if item_id)
+            if len(returned) > len(hold_ids):
+                restocked.append((len(returned) - len(hold_ids), book_id))
+
+        self.cursor.executemany("UPDATE holds SET status='ready', ready_date=?, expires_on=?, item_id=? WHERE hold_id=?",
+                                [(on.isoformat(), expires, item_id, hold_id) for hold_id, item_id in ready])
+        self.cursor.executemany('UPDATE items SET status=? WHERE item_id=?', items)
+        self.cursor.executemany('UPDATE books SET available_copies=available_copies+? WHERE book_id=?', restocked)
+        return [hold_id for hold_id, _ in ready]
+
+    def fulfil_holds(self, member_id, book_id):
+        """Close the member's open hold on a book they are borrowing.
+
+        Returns (hold_id, item_id) if its copy was waiting on the hold shelf, otherwise None.
+        """
+        self.cursor.execute("SELECT hold_id, item_id FROM holds WHERE member_id=? AND book_id=? AND status='ready'",
+                            (member_id, book_id))
+        shelf = self.cursor.fetchone()
+        self.cursor.execute("""UPDATE holds SET status='fulfilled', closed_date=?
+                               WHERE member_id=? AND book_id=? AND status IN ('waiting', 'ready')""",
+                            (datetime.now().strftime('%Y-%m-%d'), member_id, book_id))
+        return shelf
+
+    # --- ITEMS ---
+    def take_item(self, book_id):
+        """Mark the lowest-numbered copy of a book on the shelf as on loan and return its item_id.
+
+        Returns None if no item is on the shelf, e.g. for a copy lent before
+        items were catalogued. Runs in the caller's transaction.
+        """
+        self.cursor.execute("SELECT item_id FROM items WHERE book_id=? AND status='available' ORDER BY copy_number LIMIT 1",
+                            (book_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        self.cursor.execute("UPDATE items SET status='on_loan' WHERE item_id=?", (row[0],))
+        return row[0]
+
+    def add_items(self, book_ids):
+        """Catalogue the copies of these books that have no item yet, numbering them after the existing ones.
+
+        Each new item gets a barcode made of the book id and copy number;
+        withdrawn copies keep their numbers. Runs in the caller's transaction.
+        """
+        today = date.today().isoformat()
+        for i in range(0, len(book_ids), MAX_SQL_PARAMS):
+            chunk = book_ids[i:i + MAX_SQL_PARAMS]
+            self.cursor.execute(f'''WITH RECURSIVE copies(book_id, copy_number, last) AS (
+                    SELECT b.book_id, COALESCE(MAX(i.copy_number), 0) + 1,
+                           COALESCE(MAX(i.copy_number), 0) + b.total_copies
+                               - COUNT(i.item_id) FILTER (WHERE i.status <> 'withdrawn')
+                    FROM books b LEFT JOIN items i ON i.book_id = b.book_id
+                    WHERE b.book_id IN ({",".join("?" * len(chunk))}) GROUP BY b.book_id
+                    UNION ALL SELECT book_id, copy_number + 1, last FROM copies WHERE copy_number < last)
+                INSERT INTO items (book_id, copy_number, barcode, added_date)
+                SELECT book_id, copy_number, printf('%07d%03d', book_id, copy_number), ? FROM copies
+                WHERE copy_number <= last''', (*chunk, today))
+
+    def list_items(self, book_id):
+        """Return the Items (physical copies) of a book in copy order"""
+        self.cursor.execute(f'SELECT {ITEM_COLUMNS} FROM items WHERE book_id=? ORDER BY copy_number', (book_id,))
+        return [Item._make(r) for r in self.cursor.fetchall()]
+
+    def scan_item(self, barcode):
+        """Resolve a scanned barcode to a Scan of the copy, its title and its open loan, or None"""
+        self.cursor.execute(SCAN_QUERY, (barcode.strip(),))
+        row = self.cursor.fetchone()
+        return Scan._make(row) if row else None
+
+    def borrow_item(self, member_id, barcode, days=14):
+        """Issue the scanned copy to a member; returns (scan, member, due_date) or raises LibraryError.
+
+        A copy on the hold shelf can only go to the member it is held for.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        due = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
+
+        with self.write_transaction():
+            scan = self.scan_item(barcode)
+            if not scan:
+                raise LibraryError(f"Unknown barcode {barcode.strip()}!")
+            if scan.transaction_id:
+                raise LibraryError(f"This copy is already on loan to {scan.member_name}!")
+            if scan.status == "withdrawn":
+                raise LibraryError(f"Copy {scan.copy_number} of '{scan.title}' has been withdrawn!")
+            member = self.get_member(member_id)
+            if not member:
+                raise LibraryError("Member not found!")
+
+            shelf = self.fulfil_holds(member_id, scan.book_id)
+            if scan.status == "on_hold":
+                if not shelf or shelf[1] != scan.item_id:
+                    self.cursor.execute("""SELECT m.name FROM holds h JOIN members m ON m.member_id = h.member_id
+                                           WHERE h.item_id=? AND h.status='ready'""", (scan.item_id,))
+                    held_for = self.cursor.fetchone()
+                    raise LibraryError(f"This copy is on the hold shelf for {held_for[0] if held_for else 'another member'}!")
+            else:
+                self.cursor.execute('UPDATE books SET available_copies=available_copies-1 WHERE book_id=? AND available_copies > 0',
+                                    (scan.book_id,))
+                if self.cursor.rowcount != 1:
+                    raise LibraryError("No copies of this book are available!")
+                if shelf:
+                    # The member took another copy, so the one set aside for them goes to the next in the queue
+                    self.release_copies({scan.book_id: [shelf[1]]})
+
+            self.cursor.execute(LOAN_INSERT, (member_id, today, due, scan.item_id, scan.book_id))
+            transaction_id = self.cursor.lastrowid
+            self.cursor.execute("UPDATE items SET status='on_loan' WHERE item_id=?", (scan.item_id,))
+        return scan._replace(status="on_loan", transaction_id=transaction_id, member_id=member_id,
+                             member_name=member.name, due_date=due), member, due
+
+    def return_item(self, barcode):
+        """Close the open loan of the scanned copy; returns (scan, fine, days_late, hold) or raises LibraryError"""
+        scan = self.scan_item(barcode)
+        if not scan:
+            raise LibraryError(f"Unknown barcode {barcode.strip()}!")
+        if not scan.transaction_id:
+            raise LibraryError(f"Copy {scan.copy_number} of '{scan.title}' is not on loan!")
+        fine, days_late, hold = self.return_book(scan.transaction_id)
+        return scan, fine, days_late, hold
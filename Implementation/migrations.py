@@ -0,0 +1,440 @@
+"""
+Versioned schema migrations for library.db.
+
+The schema version is stored in PRAGMA user_version. On startup every
+migration newer than that version is applied in order, each in its own
+transaction, so existing database files are upgraded incrementally.
+To change the schema, append a new function to MIGRATIONS; never edit
+one that has already shipped.
+"""
+import sqlite3
+
+BORROWED_TOGETHER_WINDOW = 20   # previous loans a member's new title is paired with (version 12)
+
+
+def create_base_tables(cursor):
+    """Version 1: the original ILMS tables (no-op for databases created before migrations existed)"""
+    cursor.execute('CREATE TABLE IF NOT EXISTS librarians (librarian_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, name TEXT NOT NULL, email TEXT)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS books (book_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, author TEXT NOT NULL, isbn TEXT UNIQUE NOT NULL, publisher TEXT, publication_year INTEGER, total_copies INTEGER DEFAULT 1, available_copies INTEGER DEFAULT 1, category TEXT)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS members (member_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT, phone TEXT, address TEXT, membership_date TEXT NOT NULL, status TEXT DEFAULT "active")')
+    cursor.execute('CREATE TABLE IF NOT EXISTS transactions (transaction_id INTEGER PRIMARY KEY AUTOINCREMENT, member_id INTEGER NOT NULL, book_id INTEGER NOT NULL, borrow_date TEXT NOT NULL, due_date TEXT NOT NULL, return_date TEXT, fine_amount REAL DEFAULT 0, status TEXT DEFAULT "borrowed", FOREIGN KEY(member_id) REFERENCES members(member_id), FOREIGN KEY(book_id) REFERENCES books(book_id))')
+
+
+def create_search_index(cursor):
+    """Version 2: FTS5 catalogue index kept in sync by triggers (skipped if SQLite lacks FTS5)"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='books_fts'")
+    existed = cursor.fetchone() is not None
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, isbn, publisher, category,
+            content='books', content_rowid='book_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    except sqlite3.OperationalError:
+        return
+
+    # Keep the external-content index in sync with the books table
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, isbn, publisher, category)
+        VALUES (new.book_id, new.title, new.author, new.isbn, new.publisher, new.category);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, isbn, publisher, category)
+        VALUES ('delete', old.book_id, old.title, old.author, old.isbn, old.publisher, old.category);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, isbn, publisher, category ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, isbn, publisher, category)
+        VALUES ('delete', old.book_id, old.title, old.author, old.isbn, old.publisher, old.category);
+        INSERT INTO books_fts (rowid, title, author, isbn, publisher, category)
+        VALUES (new.book_id, new.title, new.author, new.isbn, new.publisher, new.category);
+        END''')
+
+    # Index the books that existed before the search index was added
+    if not existed:
+        cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+def create_circulation_indexes(cursor):
+    """Version 3: secondary indexes for the issued-books, overdue and inventory queries"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_due ON transactions (status, due_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_member_status ON transactions (member_id, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_book_status ON transactions (book_id, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_borrow_date ON transactions (borrow_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)')
+    cursor.execute('ANALYZE')
+
+
+def create_catalogue_version(cursor):
+    """Version 4: a counter bumped on every change to books, used to invalidate cached search results"""
+    cursor.execute('CREATE TABLE IF NOT EXISTS catalogue_state (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+    cursor.execute('INSERT OR IGNORE INTO catalogue_state (id, version) VALUES (1, 0)')
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS books_version_{event.lower()} AFTER {event} ON books BEGIN
+            UPDATE catalogue_state SET version = version + 1 WHERE id = 1;
+            END''')
+
+
+def create_circulation_stats(cursor):
+    """Version 5: aggregate counters for the statistics panels, maintained by triggers on books and transactions"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS library_stats (id INTEGER PRIMARY KEY CHECK (id = 1),
+        titles INTEGER NOT NULL, total_copies INTEGER NOT NULL, available_copies INTEGER NOT NULL,
+        loans INTEGER NOT NULL, open_loans INTEGER NOT NULL, fines REAL NOT NULL)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS category_stats (category TEXT PRIMARY KEY,
+        titles INTEGER NOT NULL, total_copies INTEGER NOT NULL, available_copies INTEGER NOT NULL)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS member_stats (member_id INTEGER PRIMARY KEY,
+        loans INTEGER NOT NULL, open_loans INTEGER NOT NULL, fines REAL NOT NULL)''')
+
+    # Backfill from the existing rows
+    cursor.execute('''INSERT OR REPLACE INTO library_stats
+        SELECT 1, b.titles, b.total_copies, b.available_copies, t.loans, t.open_loans, t.fines
+        FROM (SELECT COUNT(*) AS titles, COALESCE(SUM(total_copies), 0) AS total_copies,
+                     COALESCE(SUM(available_copies), 0) AS available_copies FROM books) b,
+             (SELECT COUNT(*) AS loans, COALESCE(SUM(status = 'borrowed'), 0) AS open_loans,
+                     COALESCE(SUM(fine_amount), 0) AS fines FROM transactions) t''')
+    cursor.execute('''INSERT OR REPLACE INTO category_stats
+        SELECT COALESCE(category, ''), COUNT(*), SUM(total_copies), SUM(available_copies)
+        FROM books GROUP BY COALESCE(category, '')''')
+    cursor.execute('''INSERT OR REPLACE INTO member_stats
+        SELECT member_id, COUNT(*), SUM(status = 'borrowed'), COALESCE(SUM(fine_amount), 0)
+        FROM transactions GROUP BY member_id''')
+
+    # Books: each change adds the new row's counts and removes the old row's
+    add_book = '''UPDATE library_stats SET titles = titles + 1, total_copies = total_copies + COALESCE(new.total_copies, 0),
+            available_copies = available_copies + COALESCE(new.available_copies, 0) WHERE id = 1;
+        INSERT INTO category_stats VALUES (COALESCE(new.category, ''), 1, COALESCE(new.total_copies, 0), COALESCE(new.available_copies, 0))
+            ON CONFLICT(category) DO UPDATE SET titles = titles + 1, total_copies = total_copies + excluded.total_copies,
+            available_copies = available_copies + excluded.available_copies;'''
+    remove_book = '''UPDATE library_stats SET titles = titles - 1, total_copies = total_copies - COALESCE(old.total_copies, 0),
+            available_copies = available_copies - COALESCE(old.available_copies, 0) WHERE id = 1;
+        UPDATE category_stats SET titles = titles - 1, total_copies = total_copies - COALESCE(old.total_copies, 0),
+            available_copies = available_copies - COALESCE(old.available_copies, 0) WHERE category = COALESCE(old.category, '');
+        DELETE FROM category_stats WHERE category = COALESCE(old.category, '') AND titles = 0;'''
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS books_stats_insert AFTER INSERT ON books BEGIN {add_book} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS books_stats_delete AFTER DELETE ON books BEGIN {remove_book} END')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS books_stats_update AFTER UPDATE OF total_copies, available_copies, category ON books
+        BEGIN {remove_book} {add_book} END''')
+
+    # Transactions: loans, open loans and fines, globally and per member
+    add_loan = '''UPDATE library_stats SET loans = loans + 1, open_loans = open_loans + (new.status = 'borrowed'),
+            fines = fines + COALESCE(new.fine_amount, 0) WHERE id = 1;
+        INSERT INTO member_stats VALUES (new.member_id, 1, new.status = 'borrowed', COALESCE(new.fine_amount, 0))
+            ON CONFLICT(member_id) DO UPDATE SET loans = loans + 1, open_loans = open_loans + excluded.open_loans,
+            fines = fines + excluded.fines;'''
+    remove_loan = '''UPDATE library_stats SET loans = loans - 1, open_loans = open_loans - (old.status = 'borrowed'),
+            fines = fines - COALESCE(old.fine_amount, 0) WHERE id = 1;
+        UPDATE member_stats SET loans = loans - 1, open_loans = open_loans - (old.status = 'borrowed'),
+            fines = fines - COALESCE(old.fine_amount, 0) WHERE member_id = old.member_id;'''
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS transactions_stats_insert AFTER INSERT ON transactions BEGIN {add_loan} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS transactions_stats_delete AFTER DELETE ON transactions BEGIN {remove_loan} END')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_stats_update AFTER UPDATE OF member_id, status, fine_amount ON transactions
+        BEGIN {remove_loan} {add_loan} END''')
+
+
+def create_overdue_job_tables(cursor):
+    """Version 6: checkpoint state for batch jobs and the overdue events recorded by the nightly run"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS job_state (job TEXT PRIMARY KEY,
+        high_water_date TEXT, high_water_id INTEGER, last_run TEXT, last_count INTEGER)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS overdue_events (event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id INTEGER UNIQUE NOT NULL, member_id INTEGER NOT NULL, book_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL, detected_on TEXT NOT NULL, days_late INTEGER NOT NULL, fine_amount REAL NOT NULL,
+        FOREIGN KEY(transaction_id) REFERENCES transactions(transaction_id))''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_overdue_events_detected ON overdue_events (detected_on)')
+
+
+def create_member_search_indexes(cursor):
+    """Version 7: case-insensitive name and email indexes and a phone index for the member directory search"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_members_name ON members (name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_members_email ON members (email COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_members_phone ON members (phone)')
+
+
+def create_sort_indexes(cursor):
+    """Version 8: an index behind every sortable column of the inventory, member and issued-books listings"""
+    # Nullable columns are indexed through COALESCE so NULLs take part in keyset comparisons
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_author ON books (author)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_publisher ON books (COALESCE(publisher, ''))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_year ON books (COALESCE(publication_year, 0))')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_category ON books (COALESCE(category, ''))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_total_copies ON books (total_copies)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_available_copies ON books (available_copies)')
+
+    # The email and phone search indexes are replaced by COALESCE ones that serve both search and sort
+    cursor.execute('DROP INDEX IF EXISTS idx_members_email')
+    cursor.execute('DROP INDEX IF EXISTS idx_members_phone')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_members_email_sort ON members (COALESCE(email, '') COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_members_phone_sort ON members (COALESCE(phone, ''))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_members_joined ON members (membership_date)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_members_status ON members (COALESCE(status, ''))")
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_due_date ON transactions (due_date)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_return_date ON transactions (COALESCE(return_date, ''))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_fine ON transactions (COALESCE(fine_amount, 0))')
+
+    # Without statistics the planner prefers any equality match, e.g. the status index for
+    # status = 'returned', over walking a sort index; ConnectionManager keeps them current
+    cursor.execute('ANALYZE')
+
+
+def create_holds(cursor):
+    """Version 9: holds on out-of-stock titles, queued per book by priority and request time"""
+    # status: waiting -> ready (a returned copy is held for the member until expires_on)
+    #         -> fulfilled when borrowed, or cancelled / expired
+    cursor.execute('''CREATE TABLE IF NOT EXISTS holds (hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL, member_id INTEGER NOT NULL, priority INTEGER NOT NULL DEFAULT 0,
+        requested_at TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'waiting',
+        ready_date TEXT, expires_on TEXT, closed_date TEXT,
+        FOREIGN KEY(book_id) REFERENCES books(book_id), FOREIGN KEY(member_id) REFERENCES members(member_id))''')
+    # Partial indexes hold only the open holds, so the queue stays small however long the history grows
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (book_id, priority DESC, requested_at)
+                      WHERE status = 'waiting'""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_holds_ready ON holds (expires_on) WHERE status = 'ready'")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_holds_member ON holds (member_id, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_holds_book ON holds (book_id, status)')
+
+
+def create_items(cursor):
+    """Version 10: one item per physical copy, with a unique barcode, linked to its open loan or hold"""
+    # status: available, on_loan or on_hold (set aside on the hold shelf for holds.item_id)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS items (item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL, copy_number INTEGER NOT NULL, barcode TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'available', added_date TEXT,
+        FOREIGN KEY(book_id) REFERENCES books(book_id))''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_items_barcode ON items (barcode)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_items_copy ON items (book_id, copy_number)')
+    cursor.execute('ALTER TABLE transactions ADD COLUMN item_id INTEGER REFERENCES items(item_id)')
+    cursor.execute('ALTER TABLE holds ADD COLUMN item_id INTEGER REFERENCES items(item_id)')
+    # At most one open loan per item, so a scan finds it with one probe
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_item_open ON transactions (item_id) WHERE status = 'borrowed'")
+
+    # Catalogue every existing copy; the barcode is the book id and the copy number
+    cursor.execute('''WITH RECURSIVE copies(book_id, copy_number, last) AS (
+            SELECT book_id, 1, total_copies FROM books WHERE total_copies > 0
+            UNION ALL SELECT book_id, copy_number + 1, last FROM copies WHERE copy_number < last)
+        INSERT INTO items (book_id, copy_number, barcode, added_date)
+        SELECT book_id, copy_number, printf('%07d%03d', book_id, copy_number), date('now', 'localtime')
+        FROM copies ORDER BY book_id, copy_number''')
+
+    # Open loans take each book's first copies and ready holds the copies after them
+    cursor.execute('''WITH open AS (SELECT transaction_id, book_id,
+                          ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY transaction_id) AS n
+                          FROM transactions WHERE status = 'borrowed')
+        UPDATE transactions SET item_id = i.item_id FROM open o JOIN items i ON i.book_id = o.book_id AND i.copy_number = o.n
+        WHERE transactions.transaction_id = o.transaction_id''')
+    cursor.execute('''WITH shelf AS (SELECT hold_id, book_id,
+                           ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY hold_id) AS n
+                           FROM holds WHERE status = 'ready'),
+             lent AS (SELECT book_id, COUNT(*) AS loans FROM transactions WHERE status = 'borrowed' GROUP BY book_id)
+        UPDATE holds SET item_id = i.item_id
+        FROM shelf s LEFT JOIN lent l ON l.book_id = s.book_id
+        JOIN items i ON i.book_id = s.book_id AND i.copy_number = COALESCE(l.loans, 0) + s.n
+        WHERE holds.hold_id = s.hold_id''')
+    cursor.execute("""UPDATE items SET status = 'on_loan'
+                      WHERE item_id IN (SELECT item_id FROM transactions WHERE status = 'borrowed')""")
+    cursor.execute("""UPDATE items SET status = 'on_hold'
+                      WHERE item_id IN (SELECT item_id FROM holds WHERE status = 'ready')""")
+
+
+def create_circulation_rollups(cursor):
+    """Version 11: daily circulation per category and loans per title per period, maintained by triggers"""
+    # Loans count on their borrow date, returns and the fines charged at return on their return
+    # date, and overdue loans on the day the nightly job recorded them
+    cursor.execute('''CREATE TABLE IF NOT EXISTS circulation_daily (day TEXT NOT NULL, category TEXT NOT NULL,
+        loans INTEGER NOT NULL DEFAULT 0, returns INTEGER NOT NULL DEFAULT 0, overdue INTEGER NOT NULL DEFAULT 0,
+        fines REAL NOT NULL DEFAULT 0, PRIMARY KEY (day, category)) WITHOUT ROWID''')
+    # period is a month ('2026-10'), a year ('2026') or '' for all time
+    cursor.execute('''CREATE TABLE IF NOT EXISTS title_loans (period TEXT NOT NULL, book_id INTEGER NOT NULL,
+        loans INTEGER NOT NULL, PRIMARY KEY (period, book_id)) WITHOUT ROWID''')
+
+    # Backfill from the existing rows
+    cursor.execute('''INSERT INTO circulation_daily (day, category, loans, returns, overdue, fines)
+        SELECT day, category, SUM(loans), SUM(returns), SUM(overdue), SUM(fines) FROM (
+            SELECT t.borrow_date AS day, COALESCE(b.category, '') AS category, 1 AS loans, 0 AS returns,
+                   0 AS overdue, 0 AS fines
+            FROM transactions t LEFT JOIN books b ON b.book_id = t.book_id
+            UNION ALL
+            SELECT t.return_date, COALESCE(b.category, ''), 0, 1, 0, COALESCE(t.fine_amount, 0)
+            FROM transactions t LEFT JOIN books b ON b.book_id = t.book_id WHERE t.return_date IS NOT NULL
+            UNION ALL
+            SELECT e.detected_on, COALESCE(b.category, ''), 0, 0, 1, 0
+            FROM overdue_events e LEFT JOIN books b ON b.book_id = e.book_id)
+        GROUP BY day, category''')
+    # Years are summed from the months and all time from the years
+    cursor.execute('''INSERT INTO title_loans (period, book_id, loans)
+        SELECT substr(borrow_date, 1, 7), book_id, COUNT(*) FROM transactions GROUP BY 1, 2''')
+    for period, source in (("substr(period, 1, 4)", 7), ("''", 4)):
+        cursor.execute(f'''INSERT INTO title_loans (period, book_id, loans)
+            SELECT {period}, book_id, SUM(loans) FROM title_loans WHERE length(period) = {source} GROUP BY 1, 2''')
+    # The most borrowed titles of any period are the first entries of its range in this index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_title_loans_top ON title_loans (period, loans DESC, book_id)')
+
+    category = "COALESCE((SELECT category FROM books WHERE book_id = {}.book_id), '')"
+    add_loan = f'''INSERT INTO circulation_daily (day, category, loans) VALUES (new.borrow_date, {category.format("new")}, 1)
+            ON CONFLICT(day, category) DO UPDATE SET loans = loans + 1;
+        INSERT INTO title_loans (period, book_id, loans)
+            VALUES (substr(new.borrow_date, 1, 7), new.book_id, 1), (substr(new.borrow_date, 1, 4), new.book_id, 1),
+                   ('', new.book_id, 1)
+            ON CONFLICT(period, book_id) DO UPDATE SET loans = loans + 1;'''
+    remove_loan = f'''UPDATE circulation_daily SET loans = loans - 1
+            WHERE day = old.borrow_date AND category = {category.format("old")};
+        UPDATE title_loans SET loans = loans - 1 WHERE book_id = old.book_id
+            AND period IN (substr(old.borrow_date, 1, 7), substr(old.borrow_date, 1, 4), '');'''
+    add_return = f'''INSERT INTO circulation_daily (day, category, returns, fines)
+            SELECT new.return_date, {category.format("new")}, 1, COALESCE(new.fine_amount, 0) WHERE new.return_date IS NOT NULL
+            ON CONFLICT(day, category) DO UPDATE SET returns = returns + 1, fines = fines + excluded.fines;'''
+    remove_return = f'''UPDATE circulation_daily SET returns = returns - 1, fines = fines - COALESCE(old.fine_amount, 0)
+            WHERE day = old.return_date AND category = {category.format("old")};'''
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert AFTER INSERT ON transactions BEGIN {add_loan} {add_return} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete AFTER DELETE ON transactions BEGIN {remove_loan} {remove_return} END')
+    # Fines refreshed on open loans every night change neither date, so they skip the trigger
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_rollup_return AFTER UPDATE OF return_date, fine_amount ON transactions
+        WHEN old.return_date IS NOT NULL OR new.return_date IS NOT NULL BEGIN {remove_return} {add_return} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS overdue_events_rollup AFTER INSERT ON overdue_events BEGIN
+        INSERT INTO circulation_daily (day, category, overdue) VALUES (new.detected_on, {category.format("new")}, 1)
+            ON CONFLICT(day, category) DO UPDATE SET overdue = overdue + 1;
+        END''')
+
+
+def create_book_pairs(cursor):
+    """Version 12: how many members borrowed each pair of titles close together, maintained by a trigger"""
+    # A member's first loan of a title pairs it with the titles of their previous
+    # BORROWED_TOGETHER_WINDOW loans, so each member adds at most one to a pair and a
+    # heavy borrower's whole history is not paired with itself. Pairs are stored in both
+    # directions so a title's neighbours are one index range.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_member_book ON transactions (member_id, book_id)')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS book_pairs (book_a INTEGER NOT NULL, book_b INTEGER NOT NULL,
+        together INTEGER NOT NULL, PRIMARY KEY (book_a, book_b)) WITHOUT ROWID''')
+
+    # Backfill from the existing loans, numbering each member's loans in order
+    cursor.execute('''CREATE TEMP TABLE loan_history AS
+        SELECT member_id, book_id, ROW_NUMBER() OVER (PARTITION BY member_id ORDER BY transaction_id) AS seq,
+               ROW_NUMBER() OVER (PARTITION BY member_id, book_id ORDER BY transaction_id) = 1 AS first_loan
+        FROM transactions''')
+    cursor.execute('CREATE INDEX temp.idx_loan_history ON loan_history (member_id, seq)')
+    cursor.execute(f'''CREATE TEMP TABLE loan_pairs AS
+        SELECT DISTINCT f.member_id, f.book_id AS book_a, h.book_id AS book_b
+        FROM loan_history f JOIN loan_history h ON h.member_id = f.member_id
+             AND h.seq BETWEEN f.seq - {BORROWED_TOGETHER_WINDOW} AND f.seq - 1
+        WHERE f.first_loan AND h.book_id <> f.book_id''')
+    cursor.execute('''INSERT INTO book_pairs (book_a, book_b, together)
+        SELECT book_a, book_b, COUNT(*) FROM (SELECT book_a, book_b FROM loan_pairs
+                                              UNION ALL SELECT book_b, book_a FROM loan_pairs)
+        GROUP BY book_a, book_b''')
+    cursor.execute('DROP TABLE temp.loan_pairs')
+    cursor.execute('DROP TABLE temp.loan_history')
+    # A title's most borrowed-with neighbours are the first entries of its range in this index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_book_pairs_top ON book_pairs (book_a, together DESC, book_b)')
+
+    recent = f'''SELECT DISTINCT book_id FROM (SELECT book_id FROM transactions
+            WHERE member_id = new.member_id AND transaction_id < new.transaction_id
+            ORDER BY transaction_id DESC LIMIT {BORROWED_TOGETHER_WINDOW}) WHERE book_id <> new.book_id'''
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_book_pairs AFTER INSERT ON transactions
+        WHEN NOT EXISTS (SELECT 1 FROM transactions WHERE member_id = new.member_id AND book_id = new.book_id
+                         AND transaction_id <> new.transaction_id) BEGIN
+        INSERT INTO book_pairs (book_a, book_b, together) SELECT new.book_id, book_id, 1 FROM ({recent}) WHERE 1
+            ON CONFLICT(book_a, book_b) DO UPDATE SET together = together + 1;
+        INSERT INTO book_pairs (book_a, book_b, together) SELECT book_id, new.book_id, 1 FROM ({recent}) WHERE 1
+            ON CONFLICT(book_a, book_b) DO UPDATE SET together = together + 1;
+        END''')
+
+
+def drop_fts_statistics(cursor):
+    """Version 13: forget the statistics gathered while the full-text shadow tables were empty"""
+    # Once books_fts_* grow, stats saying they hold a row or two lead the planner to scan them;
+    # without stats it uses its defaults until PRAGMA optimize measures the real tables
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl LIKE 'books!_fts!_%' ESCAPE '!'")
+        # Reload the statistics this connection plans with
+        cursor.execute('ANALYZE sqlite_schema')
+
+
+def store_loan_category(cursor):
+    """Version 14: record each loan's category when it is made, so recataloguing a title leaves its rollups alone"""
+    # The version 11 triggers looked the category up in books when a loan was returned or
+    # deleted, so a title moved to another category in between was taken off the wrong row
+    for trigger in ("transactions_rollup_insert", "transactions_rollup_delete", "transactions_rollup_return",
+                    "overdue_events_rollup"):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('ALTER TABLE transactions ADD COLUMN category TEXT')
+    cursor.execute('''UPDATE transactions SET category = COALESCE(b.category, '')
+                      FROM books b WHERE b.book_id = transactions.book_id''')
+    cursor.execute("UPDATE transactions SET category = '' WHERE category IS NULL")
+
+    # LibraryStore fills the column as it issues a loan; rows inserted without it get it here
+    category = "COALESCE(new.category, (SELECT category FROM books WHERE book_id = new.book_id), '')"
+    set_category = f'''UPDATE transactions SET category = {category}
+            WHERE transaction_id = new.transaction_id AND new.category IS NULL;'''
+    add_loan = f'''INSERT INTO circulation_daily (day, category, loans) VALUES (new.borrow_date, {category}, 1)
+            ON CONFLICT(day, category) DO UPDATE SET loans = loans + 1;
+        INSERT INTO title_loans (period, book_id, loans)
+            VALUES (substr(new.borrow_date, 1, 7), new.book_id, 1), (substr(new.borrow_date, 1, 4), new.book_id, 1),
+                   ('', new.book_id, 1)
+            ON CONFLICT(period, book_id) DO UPDATE SET loans = loans + 1;'''
+    remove_loan = '''UPDATE circulation_daily SET loans = loans - 1
+            WHERE day = old.borrow_date AND category = old.category;
+        UPDATE title_loans SET loans = loans - 1 WHERE book_id = old.book_id
+            AND period IN (substr(old.borrow_date, 1, 7), substr(old.borrow_date, 1, 4), '');'''
+    add_return = f'''INSERT INTO circulation_daily (day, category, returns, fines)
+            SELECT new.return_date, {category}, 1, COALESCE(new.fine_amount, 0) WHERE new.return_date IS NOT NULL
+            ON CONFLICT(day, category) DO UPDATE SET returns = returns + 1, fines = fines + excluded.fines;'''
+    remove_return = '''UPDATE circulation_daily SET returns = returns - 1, fines = fines - COALESCE(old.fine_amount, 0)
+            WHERE day = old.return_date AND category = old.category;'''
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert AFTER INSERT ON transactions
+        BEGIN {set_category} {add_loan} {add_return} END''')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete AFTER DELETE ON transactions BEGIN {remove_loan} {remove_return} END')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_rollup_return AFTER UPDATE OF return_date, fine_amount ON transactions
+        WHEN old.return_date IS NOT NULL OR new.return_date IS NOT NULL BEGIN {remove_return} {add_return} END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS overdue_events_rollup AFTER INSERT ON overdue_events BEGIN
+        INSERT INTO circulation_daily (day, category, overdue)
+            VALUES (new.detected_on, COALESCE((SELECT category FROM transactions WHERE transaction_id = new.transaction_id), ''), 1)
+            ON CONFLICT(day, category) DO UPDATE SET overdue = overdue + 1;
+        END''')
+
+
+def index_member_loan_history(cursor):
+    """Version 15: an index on each member's loans in order, for the book_pairs trigger of version 12"""
+    # The trigger reads a member's latest loans newest first; this index makes that a short
+    # backwards range scan instead of sorting their whole history on every loan
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_member_history ON transactions (member_id, transaction_id)')
+
+
+MIGRATIONS = [
+    create_base_tables,
+    create_search_index,
+    create_circulation_indexes,
+    create_catalogue_version,
+    create_circulation_stats,
+    create_overdue_job_tables,
+    create_member_search_indexes,
+    create_sort_indexes,
+    create_holds,
+    create_items,
+    create_circulation_rollups,
+    create_book_pairs,
+    drop_fts_statistics,
+    store_loan_category,
+    index_member_loan_history,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration to the connection and return the resulting schema version"""
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"library.db schema version {version} is newer than this ILMS build ({SCHEMA_VERSION})")
+
+    cursor = conn.cursor()
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        cursor.execute('BEGIN')
+        try:
+            MIGRATIONS[number - 1](cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return SCHEMA_VERSION
@@ -0,0 +1,134 @@
+"""
+Nightly overdue processing for ILMS.
+
+Finds the open loans whose due date has passed since the previous run,
+records an overdue event for each, writes a notice file for the desk to
+send out, refreshes the fines accrued on open loans and expires holds
+whose copy was not collected in time, passing each copy to the next
+member in that book's queue. Progress is checkpointed in job_state as a
+(due_date, transaction_id) high-water mark after every chunk, so each
+run reads only the loans that fell due since the last one, and a run
+that is interrupted resumes where it stopped.
+
+Run from cron, e.g.:
+    30 1 * * *  cd /srv/ilms && python overdue_job.py --db library.db --notices overdue_notices.csv
+"""
+import argparse
+import csv
+import time
+from datetime import date
+
+from fines import recompute_open_fines
+from library_store import LibraryStore
+
+JOB_NAME = "overdue"
+CHUNK_SIZE = 50000
+
+NOTICE_COLUMNS = ["transaction_id", "member_id", "member_name", "email", "phone",
+                  "book_id", "title", "due_date", "days_late", "fine_amount"]
+
+
+class OverdueReport:
+    def __init__(self):
+        self.new_overdue = 0
+        self.chunks = 0
+        self.fines_updated = 0
+        self.holds_expired = 0
+        self.holds_passed_on = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        return (f"{self.new_overdue:,} loans became overdue ({self.chunks} chunks); "
+                f"fines updated on {self.fines_updated:,} open loans; "
+                f"{self.holds_expired:,} holds expired, {self.holds_passed_on:,} copies passed on "
+                f"in {self.seconds:.1f}s")
+
+
+def load_checkpoint(conn):
+    """Return the (due_date, transaction_id) of the last loan processed, or ('', 0) before the first run"""
+    row = conn.execute('SELECT high_water_date, high_water_id FROM job_state WHERE job = ?', (JOB_NAME,)).fetchone()
+    return (row[0] or '', row[1] or 0) if row else ('', 0)
+
+
+def run_overdue_job(store, on=None, notices_path=None, chunk_size=CHUNK_SIZE):
+    """Process loans that are overdue on `on` (default today) and return an OverdueReport"""
+    on = on or date.today()
+    policy = store.fine_policy
+    conn = store.conn
+    report = OverdueReport()
+    started = time.perf_counter()
+
+    notices_file = open(notices_path, 'w', newline='', encoding='utf-8') if notices_path else None
+    notices = csv.writer(notices_file) if notices_file else None
+    if notices:
+        notices.writerow(NOTICE_COLUMNS)
+
+    # Walks idx_transactions_status_due from the checkpoint; loans already processed are never re-read
+    chunk_query = f'''SELECT t.transaction_id, t.member_id, m.name, m.email, m.phone, t.book_id, b.title, t.due_date,
+                             {policy.days_late_sql("t.due_date", on)}, {policy.fine_sql("t.due_date", "b.category", on)}
+                      FROM transactions t
+                      JOIN members m ON t.member_id = m.member_id
+                      JOIN books b ON t.book_id = b.book_id
+                      WHERE t.status = 'borrowed' AND (t.due_date, t.transaction_id) > (?, ?)
+                            AND {policy.overdue_sql("t.due_date", on)}
+                      ORDER BY t.due_date, t.transaction_id
+                      LIMIT ?'''
+    try:
+        checkpoint = load_checkpoint(conn)
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(chunk_query, (*checkpoint, chunk_size)).fetchall()
+                if rows:
+                    conn.executemany('''INSERT OR IGNORE INTO overdue_events
+                                        (transaction_id, member_id, book_id, due_date, detected_on, days_late, fine_amount)
+                                        VALUES (?,?,?,?,?,?,?)''',
+                                     [(r[0], r[1], r[5], r[7], on.isoformat(), r[8], r[9]) for r in rows])
+                    checkpoint = (rows[-1][7], rows[-1][0])
+                conn.execute('''INSERT INTO job_state (job, high_water_date, high_water_id, last_run, last_count)
+                                VALUES (?,?,?,?,?)
+                                ON CONFLICT(job) DO UPDATE SET high_water_date = excluded.high_water_date,
+                                    high_water_id = excluded.high_water_id, last_run = excluded.last_run,
+                                    last_count = excluded.last_count''',
+                             (JOB_NAME, *checkpoint, on.isoformat(), report.new_overdue + len(rows)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            if notices:
+                notices.writerows(rows)
+            report.new_overdue += len(rows)
+            report.chunks += 1
+            if len(rows) < chunk_size:
+                break
+    finally:
+        if notices_file:
+            notices_file.close()
+
+    report.fines_updated = recompute_open_fines(conn, policy, on)
+    report.holds_expired, report.holds_passed_on = store.expire_holds(on)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record newly overdue loans, refresh fines, write overdue notices "
+                                                 "and expire uncollected holds")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--on", type=date.fromisoformat, help="process as of this date (default: today)")
+    parser.add_argument("--notices", help="write notices for newly overdue loans to this CSV file (strftime codes allowed)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="loans per checkpointed transaction")
+    args = parser.parse_args()
+
+    on = args.on or date.today()
+    store = LibraryStore(args.db)
+    try:
+        report = run_overdue_job(store, on, on.strftime(args.notices) if args.notices else None, args.chunk_size)
+    finally:
+        store.close()
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
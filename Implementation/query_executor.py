@@ -0,0 +1,107 @@
+"""
+Background execution of LibraryStore calls.
+
+Queries run on a small pool of worker threads, each with its own SQLite
+connection, and hand back concurrent.futures.Future objects. run_async()
+polls the future from the Tk event loop with root.after so callbacks
+always run on the GUI thread. Calls submitted with a key supersede any
+earlier call with the same key: a pending one is cancelled, a running
+one is interrupted, and its result is never delivered.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 15
+
+
+class QueryExecutor:
+    def __init__(self, store_factory, workers=2):
+        # store_factory() is called once on each worker thread to open its own connection
+        self.store_factory = store_factory
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ilms-db")
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.running = {}   # future -> store executing it
+        self.interrupted = set()    # running futures whose store has been interrupted
+        self.latest = {}    # key -> most recent future submitted with that key
+
+    def thread_store(self):
+        store = getattr(self.local, "store", None)
+        if store is None:
+            store = self.store_factory()
+            self.local.store = store
+        return store
+
+    def submit(self, func, *args, key=None):
+        """Run func(store, *args) on a worker thread and return its Future"""
+        future = None
+
+        def run():
+            store = self.thread_store()
+            with self.lock:
+                self.running[future] = store
+            try:
+                return func(store, *args)
+            finally:
+                # Once the job leaves running no cancel can reach its store, so an
+                # interrupt that landed after func returned is cleared before the next job
+                with self.lock:
+                    del self.running[future]
+                    interrupted = future in self.interrupted
+                    self.interrupted.discard(future)
+                if interrupted:
+                    store.clear_interrupt()
+
+        with self.lock:
+            future = self.pool.submit(run)
+            if key is not None:
+                self.cancel_locked(self.latest.get(key))
+                self.latest[key] = future
+        return future
+
+    def cancel(self, key):
+        """Cancel or interrupt the latest call submitted with this key"""
+        with self.lock:
+            self.cancel_locked(self.latest.pop(key, None))
+
+    def cancel_locked(self, future):
+        if future is None or future.cancel():
+            return
+        # Only interrupt while this job still owns the store, never the worker's next job
+        store = self.running.get(future)
+        if store is not None and future not in self.interrupted:
+            self.interrupted.add(future)
+            store.interrupt()
+
+    def is_stale(self, future, key):
+        with self.lock:
+            return key is not None and self.latest.get(key) is not future
+
+    def run_async(self, root, func, *args, on_done=None, on_error=None, key=None):
+        """Submit func(store, *args) and deliver its result to on_done on the Tk thread"""
+        future = self.submit(func, *args, key=key)
+
+        def poll():
+            if not future.done():
+                root.after(POLL_MS, poll)
+                return
+            if future.cancelled() or self.is_stale(future, key):
+                return
+            if key is not None:
+                with self.lock:
+                    self.latest.pop(key, None)
+
+            error = future.exception()
+            if error is not None:
+                if on_error is None:
+                    raise error
+                on_error(error)
+            elif on_done is not None:
+                on_done(future.result())
+
+        root.after(POLL_MS, poll)
+        return future
+
+    def shutdown(self):
+        # Worker connections are released with their threads
+        self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,279 @@
+"""
+Opt-in query profiling for ILMS.
+
+When enabled, ConnectionManager opens connections whose cursors time
+every statement from execute() until its last row is fetched. Samples
+are grouped by query shape (the SQL with literals and IN lists folded to
+placeholders) into latency histograms with call and row counts. The
+first time a shape runs slower than the threshold its EXPLAIN QUERY PLAN
+is captured and the statement is logged to the "ilms.queries" logger.
+
+Profiling is off unless ilms.ini enables it, and when off connections
+are plain sqlite3 connections, so there is no overhead:
+
+    [profiling]
+    enabled = true
+    slow_query_ms = 50
+    log = slow_queries.log
+    dump = query_profile.json
+
+The profile is written as JSON to `dump` on exit, and can be viewed,
+reset and exported from the diagnostics window.
+"""
+import configparser
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def query_shape(sql):
+    """Fold literals, IN lists and whitespace so every call of the same query has the same key"""
+    shape = LITERALS.sub("?", sql)
+    shape = PLACEHOLDER_LISTS.sub("(?, ...)", shape)
+    return " ".join(shape.split())
+
+
+class QueryStats:
+    def __init__(self, shape):
+        self.shape = shape
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan = None
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        index = 0
+        while index < len(BUCKETS_MS) and elapsed_ms > BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+
+    def percentile(self, pct):
+        """Estimate a latency percentile as the upper bound of the bucket it falls in"""
+        rank = pct / 100 * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        labels = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        return {
+            "shape": self.shape, "calls": self.calls, "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "p50_ms": round(self.percentile(50), 3), "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3), "rows": self.rows, "slow": self.slow, "plan": self.plan,
+            "histogram": {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms=50.0, dump_path=None):
+        self.slow_query_ms = slow_query_ms
+        self.dump_path = dump_path
+        self.stats = {}   # shape -> QueryStats
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+
+    @classmethod
+    def load(cls, path="ilms.ini"):
+        """Return a profiler configured by the [profiling] section of an ini file, or None when it is disabled"""
+        if not os.path.exists(path):
+            return None
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if not parser.has_section("profiling") or not parser["profiling"].getboolean("enabled", False):
+            return None
+
+        section = parser["profiling"]
+        profiler = cls(section.getfloat("slow_query_ms", 50.0), section.get("dump"))
+        # logging and atexit are only imported once profiling is switched on
+        import atexit
+        import logging
+        if section.get("log"):
+            logger = logging.getLogger("ilms.queries")
+            handler = logging.FileHandler(section.get("log"), encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        if profiler.dump_path:
+            atexit.register(profiler.dump, profiler.dump_path)
+        return profiler
+
+    def record(self, connection, sql, params, elapsed_ms, rows):
+        shape = query_shape(sql)
+        with self.lock:
+            stats = self.stats.get(shape)
+            if stats is None:
+                stats = self.stats[shape] = QueryStats(shape)
+            stats.add(elapsed_ms, rows)
+            slow = elapsed_ms >= self.slow_query_ms
+            if slow:
+                stats.slow += 1
+            explain = slow and stats.plan is None
+            if explain:
+                stats.plan = []   # claimed, so concurrent slow calls do not explain it again
+
+        if explain:
+            import logging
+            stats.plan = self.explain(connection, sql, params)
+            logging.getLogger("ilms.queries").warning("slow query %.1f ms, %d rows: %s\n%s", elapsed_ms, rows, " ".join(sql.split()),
+                           "\n".join(stats.plan))
+
+    @staticmethod
+    def explain(connection, sql, params):
+        """Return the EXPLAIN QUERY PLAN lines of a read, or a note for statements that are not explained"""
+        if params is None or not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            return ["(plan not captured for writes and batch statements)"]
+        try:
+            rows = sqlite3.Connection.execute(connection, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return [f"(plan unavailable: {e})"]
+        depth = {0: 0}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, 0) + 1
+            lines.append("  " * (depth[node] - 1) + detail)
+        return lines
+
+    def snapshot(self):
+        """Return the collected statistics as dicts, most total time first"""
+        with self.lock:
+            stats = [s.as_dict() for s in self.stats.values()]
+        return sorted(stats, key=lambda s: -s["total_ms"])
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.started = datetime.now()
+
+    def dump(self, path):
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"since": self.started.isoformat(timespec="seconds"),
+                       "written": datetime.now().isoformat(timespec="seconds"),
+                       "slow_query_ms": self.slow_query_ms, "queries": self.snapshot()}, f, indent=2)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times each statement from execute() until its last row is fetched"""
+    pending = None   # [sql, params, elapsed_ms, rows] of the statement still being read
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self.begin(sql, parameters, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self.begin(sql, None, started)
+        return self
+
+    def begin(self, sql, params, started):
+        self.pending = [sql, params, (time.perf_counter() - started) * 1000, 0]
+        if self.description is None:
+            # Writes have no rows to fetch
+            self.pending[3] = max(self.rowcount, 0)
+            self.finish()
+
+    def timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self.pending is not None:
+            self.pending[2] += (time.perf_counter() - started) * 1000
+        return result
+
+    def fetchone(self):
+        row = self.timed_fetch(super().fetchone)
+        if self.pending is not None:
+            if row is None:
+                self.finish()
+            else:
+                self.pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self.timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+        if self.pending is not None:
+            self.pending[3] += len(rows)
+            if len(rows) < (self.arraysize if size is None else size):
+                self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self.timed_fetch(super().fetchall)
+        if self.pending is not None:
+            self.pending[3] += len(rows)
+            self.finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        # Statements abandoned before their last row are recorded with the rows read so far
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+    def finish(self):
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            self.connection.profiler.record(self.connection, *pending)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), report to a QueryProfiler"""
+    profiler = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_profiler():
+    """Return the process-wide profiler configured in ilms.ini, or None when profiling is disabled"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = QueryProfiler.load() or False
+    return _default or None
@@ -0,0 +1,247 @@
+"""
+Client for the ILMS HTTP API (see server.py).
+
+RemoteStore offers the LibraryStore methods the GUI uses and turns each
+call into a request to the server, rebuilding Book, Member, Loan,
+BatchResult, Hold, Item, Scan and report rows from the JSON. Errors come back as the exceptions the
+GUI already handles: LibraryError for refused operations and
+sqlite3.IntegrityError for duplicate ISBNs or usernames. Each instance
+keeps one HTTP connection alive, so give every thread its own store, as
+QueryExecutor does.
+"""
+import http.client
+import json
+import select
+import sqlite3
+from urllib.parse import quote, urlencode, urlsplit
+
+from library_store import (LibraryStore, LibraryError, Book, Member, Loan, BatchResult, Hold, Item, Scan,
+                           TrendRow, CategoryUsage, TitleLoans, Recommendation)
+
+
+class RemoteStore:
+    # Pure helpers shared with the local store
+    member_filter = LibraryStore.member_filter
+    text_matches = LibraryStore.text_matches
+    page_cursor = LibraryStore.page_cursor
+
+    def __init__(self, url, token=None, timeout=30):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 8750
+        self.token = token
+        self.timeout = timeout
+        self.conn = None     # no local database connection
+        self.http = None
+        info = self.request("GET", "/info")
+        self.fts_enabled = info["fts_enabled"]
+        self.schema_version = info["schema_version"]
+
+    def close(self):
+        if self.http:
+            self.http.close()
+            self.http = None
+
+    def interrupt(self):
+        """A request already sent runs to completion on the server; the executor discards its result"""
+
+    def clear_interrupt(self):
+        """Nothing is left running locally after an interrupt"""
+
+    def request(self, method, path, query=None, body=None):
+        """Send one request and return the decoded JSON result, raising the store's exceptions on errors"""
+        if query:
+            query = {k: v for k, v in query.items() if v is not None}
+            path = f"{path}?{urlencode(query)}" if query else path
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        data = json.dumps(body).encode() if body is not None else None
+
+        # A kept-alive connection the server has since closed reads as ready (EOF); reconnect
+        # before sending anything so no request is ever sent down a dead socket
+        if self.http is not None and self.http.sock is not None and select.select([self.http.sock], [], [], 0)[0]:
+            self.close()
+
+        for attempt in (1, 2):
+            reused = self.http is not None
+            if self.http is None:
+                self.http = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.http.request(method, path, body=data, headers=headers)
+                response = self.http.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                # The server may have acted on the request before the connection dropped, so only
+                # a read on a connection that had been idle is sent again; a write is never repeated
+                if attempt == 2 or method != "GET" or not reused:
+                    raise
+
+        if response.status >= 400:
+            message = payload.get("error", response.reason) if isinstance(payload, dict) else response.reason
+            if isinstance(payload, dict) and payload.get("integrity"):
+                raise sqlite3.IntegrityError(message)
+            raise LibraryError(message)
+        return payload
+
+    @staticmethod
+    def cursor(after):
+        return json.dumps(list(after)) if after is not None else None
+
+    # --- LIBRARIANS ---
+    def authenticate(self, username, password):
+        try:
+            result = self.request("POST", "/auth", body={"username": username, "password": password})
+        except LibraryError:
+            return None
+        return result["librarian_id"], result["username"]
+
+    def create_librarian(self, username, password, name):
+        return self.request("POST", "/librarians", body={"username": username, "password": password,
+                                                         "name": name})["librarian_id"]
+
+    # --- BOOKS ---
+    def add_book(self, title, author, isbn, publisher=None, publication_year=None, category=None, copies=1):
+        return self.request("POST", "/books", body={
+            "title": title, "author": author, "isbn": isbn, "publisher": publisher,
+            "publication_year": publication_year, "category": category, "copies": copies})["book_id"]
+
+    def get_book(self, book_id):
+        row = self.request("GET", f"/books/{int(book_id)}")
+        return Book(**row) if row else None
+
+    def get_book_by_isbn(self, isbn):
+        row = self.request("GET", f"/books/isbn/{quote(str(isbn), safe='')}")
+        return Book(**row) if row else None
+
+    def update_book(self, book_id, title, author, isbn, publisher, publication_year, category, total_copies):
+        self.request("PUT", f"/books/{int(book_id)}", body={
+            "title": title, "author": author, "isbn": isbn, "publisher": publisher,
+            "publication_year": publication_year, "category": category, "total_copies": total_copies})
+
+    def delete_book(self, book_id):
+        self.request("DELETE", f"/books/{int(book_id)}")
+
+    def list_books(self, search="", status=None, fields=("title", "author", "isbn"), after=None, limit=None,
+                   sort="title", descending=False):
+        rows = self.request("GET", "/books", {"search": search, "status": status, "fields": ",".join(fields),
+                                              "sort": sort, "descending": int(descending),
+                                              "after": self.cursor(after), "limit": limit})
+        return [Book(**r) for r in rows]
+
+    def book_totals(self, search="", status=None):
+        return tuple(self.request("GET", "/books/totals", {"search": search, "status": status}))
+
+    def catalogue_version(self):
+        return self.request("GET", "/books/version")["version"]
+
+    def search_books(self, term, field="title", limit=None):
+        rows = self.request("GET", "/books/search", {"term": term, "field": field, "limit": limit})
+        return [Book(**r) for r in rows]
+
+    # --- MEMBERS ---
+    def add_member(self, name, email, phone, address):
+        return self.request("POST", "/members", body={"name": name, "email": email, "phone": phone,
+                                                      "address": address})["member_id"]
+
+    def get_member(self, member_id):
+        row = self.request("GET", f"/members/{int(member_id)}")
+        return Member(**row) if row else None
+
+    def list_members(self, search="", after=None, limit=None, sort=None, descending=False):
+        rows = self.request("GET", "/members", {"search": search, "sort": sort, "descending": int(descending),
+                                                "after": self.cursor(after), "limit": limit})
+        return [Member(**r) for r in rows]
+
+    # --- STATISTICS ---
+    def library_stats(self):
+        return self.request("GET", "/stats")
+
+    # --- ANALYTICS ---
+    def circulation_trend(self, start=None, end=None, by="month", category=None):
+        rows = self.request("GET", "/analytics/trend", {"start": start and str(start), "end": end and str(end),
+                                                        "by": by, "category": category})
+        return [TrendRow(**r) for r in rows]
+
+    def category_utilisation(self, start=None, end=None):
+        rows = self.request("GET", "/analytics/categories", {"start": start and str(start), "end": end and str(end)})
+        return [CategoryUsage(**r) for r in rows]
+
+    def most_borrowed(self, period="", limit=20):
+        return [TitleLoans(**r) for r in self.request("GET", "/analytics/top", {"period": period, "limit": limit})]
+
+    # --- RECOMMENDATIONS ---
+    def similar_books(self, book_id, limit=10):
+        return [Recommendation(**r) for r in self.request("GET", f"/books/{int(book_id)}/similar", {"limit": limit})]
+
+    def suggest_for_member(self, member_id, limit=10):
+        rows = self.request("GET", f"/members/{int(member_id)}/suggestions", {"limit": limit})
+        return [Recommendation(**r) for r in rows]
+
+    # --- TRANSACTIONS ---
+    def borrow_book(self, member_id, book_id, days=14):
+        result = self.request("POST", "/loans", body={"member_id": member_id, "book_id": book_id, "days": days})
+        return Book(**result["book"]), Member(**result["member"]), result["due_date"]
+
+    def return_book(self, transaction_id):
+        result = self.request("POST", f"/loans/{int(transaction_id)}/return", body={})
+        hold = result["hold"]
+        return result["fine"], result["days_late"], Hold(**hold) if hold else None
+
+    def borrow_books(self, member_id, book_ids, days=14):
+        result = self.request("POST", "/loans/batch", body={"member_id": member_id, "book_ids": book_ids,
+                                                            "days": days})
+        return Member(**result["member"]), result["due_date"], [BatchResult(**r) for r in result["results"]]
+
+    def return_loans(self, transaction_ids, member_id=None):
+        results = self.request("POST", "/returns/batch", body={"transaction_ids": transaction_ids,
+                                                               "member_id": member_id})
+        return [BatchResult(**r) for r in results]
+
+    def list_loans(self, search="", status=None, after=None, limit=None, sort="borrow_date", descending=True):
+        rows = self.request("GET", "/loans", {"search": search, "status": status, "sort": sort,
+                                              "descending": int(descending), "after": self.cursor(after),
+                                              "limit": limit})
+        return [Loan(**r) for r in rows]
+
+    def loan_totals(self, search="", status=None):
+        return tuple(self.request("GET", "/loans/totals", {"search": search, "status": status}))
+
+    # --- HOLDS ---
+    def get_hold(self, hold_id):
+        row = self.request("GET", f"/holds/{int(hold_id)}")
+        return Hold(**row) if row else None
+
+    def place_hold(self, member_id, book_id, priority=0):
+        return Hold(**self.request("POST", "/holds", body={"member_id": member_id, "book_id": book_id,
+                                                           "priority": priority}))
+
+    def list_holds(self, book_id=None, member_id=None, status=None, limit=None):
+        rows = self.request("GET", "/holds", {"book_id": book_id, "member_id": member_id, "status": status,
+                                              "limit": limit})
+        return [Hold(**r) for r in rows]
+
+    def cancel_hold(self, hold_id):
+        hold = self.request("POST", f"/holds/{int(hold_id)}/cancel", body={})["passed_to"]
+        return Hold(**hold) if hold else None
+
+    # --- ITEMS ---
+    def list_items(self, book_id):
+        return [Item(**r) for r in self.request("GET", f"/books/{int(book_id)}/items")]
+
+    def scan_item(self, barcode):
+        row = self.request("GET", f"/items/{quote(barcode.strip(), safe='')}")
+        return Scan(**row) if row else None
+
+    def borrow_item(self, member_id, barcode, days=14):
+        result = self.request("POST", f"/items/{quote(barcode.strip(), safe='')}/borrow",
+                              body={"member_id": member_id, "days": days})
+        return Scan(**result["scan"]), Member(**result["member"]), result["due_date"]
+
+    def return_item(self, barcode):
+        result = self.request("POST", f"/items/{quote(barcode.strip(), safe='')}/return", body={})
+        hold = result["hold"]
+        return Scan(**result["scan"]), result["fine"], result["days_late"], Hold(**hold) if hold else None
@@ -0,0 +1,70 @@
+"""
+LRU cache for catalogue search results.
+
+Entries are keyed by (field, term, filter) and tagged with the catalogue
+version they were read at; any change to books bumps the version and
+empties the cache. A query that extends a cached term (typing "harr"
+after "har") is answered by filtering the cached rows in memory, as long
+as the cached result was not cut off by the row limit.
+"""
+import threading
+from collections import OrderedDict
+
+
+class SearchCache:
+    def __init__(self, capacity=128, limit=500):
+        self.capacity = capacity
+        self.limit = limit            # rows fetched per query; results this long may be truncated
+        self.entries = OrderedDict()  # (field, term, filter) -> list of Books
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+
+    def search(self, store, field, term, filter_key=None):
+        """Return up to `limit` Books matching the term, served from the cache when possible"""
+        key = (field, term.strip().lower(), filter_key)
+        version = store.catalogue_version()
+
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+            results = self.entries.get(key)
+            if results is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return results
+
+            base = self.find_prefix_entry(key)
+
+        if base is not None:
+            results = [b for b in base if store.text_matches(getattr(b, field), term)]
+            self.refinements += 1
+        else:
+            results = store.search_books(term, field, limit=self.limit)
+            self.misses += 1
+
+        with self.lock:
+            if version == self.version:
+                self.entries[key] = results
+                if len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+        return results
+
+    def find_prefix_entry(self, key):
+        """Return the complete cached result for the longest cached term that this term extends"""
+        field, term, filter_key = key
+        best, best_len = None, -1
+        for (f, cached_term, cached_filter_key), results in self.entries.items():
+            if (f == field and cached_filter_key == filter_key and cached_term and term.startswith(cached_term)
+                    and len(cached_term) > best_len and len(results) < self.limit):
+                best, best_len = results, len(cached_term)
+        return best
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.version = None
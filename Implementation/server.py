@@ -0,0 +1,465 @@
+"""
+JSON HTTP API for ILMS, so desks in several branches can share one catalogue.
+
+The server owns library.db. Requests are parsed on an asyncio event
+loop and each database call runs on a QueryExecutor worker thread, whose
+threads each keep their own SQLite connection: the executor is the
+connection pool. Connections are kept alive between requests. Desks
+connect with `python ILMS.py --server http://host:8750`, which uses
+RemoteStore in place of LibraryStore.
+
+Settings are read from an optional [server] section of ilms.ini; when a
+token is set every request must send it as `Authorization: Bearer <token>`:
+
+    [server]
+    host = 0.0.0.0
+    port = 8750
+    workers = 4
+    token = change-me
+
+Endpoints (bodies and responses are JSON; rows are objects keyed by column):
+    GET  /info                          schema version and search capabilities
+    POST /auth                          {username, password}
+    POST /librarians                    {username, password, name}
+    GET  /books                         ?search, status, fields, sort, descending, after, limit
+    GET  /books/totals                  ?search, status
+    GET  /books/search                  ?term, field, limit
+    GET  /books/version
+    GET  /books/isbn/<isbn>
+    GET|PUT|DELETE /books/<id>
+    GET  /books/<id>/items
+    GET  /books/<id>/similar            ?limit
+    POST /books
+    GET  /members                       ?search, sort, descending, after, limit
+    GET  /members/<id>
+    GET  /members/<id>/suggestions      ?limit
+    POST /members
+    GET  /loans                         ?search, status, sort, descending, after, limit
+    GET  /loans/totals                  ?search, status
+    POST /loans                         {member_id, book_id, days}
+    POST /loans/<id>/return
+    POST /loans/batch                   {member_id, book_ids, days}
+    POST /returns/batch                 {transaction_ids, member_id}
+    GET  /holds                         ?book_id, member_id, status, limit
+    GET  /holds/<id>
+    POST /holds                         {member_id, book_id, priority}
+    POST /holds/<id>/cancel
+    GET  /items/<barcode>               the copy, its title and its open loan
+    POST /items/<barcode>/borrow        {member_id, days}
+    POST /items/<barcode>/return
+    GET  /stats
+    GET  /analytics/trend               ?start, end, by, category
+    GET  /analytics/top                 ?period, limit
+    GET  /analytics/categories          ?start, end
+
+`sort` is a key of library_store.SORT_KEYS and `descending` 1 or 0.
+`after` is the JSON keyset cursor of the last row already shown, as
+passed to the matching LibraryStore list method.
+
+Usage:
+    python server.py --db library.db --port 8750
+"""
+import argparse
+import asyncio
+import configparser
+import hmac
+import json
+import os
+import re
+import sqlite3
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from database import ConnectionManager
+from library_store import LibraryStore, LibraryError
+from migrations import SCHEMA_VERSION
+from query_executor import QueryExecutor
+
+MAX_BODY = 1 << 20
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ServerConfig:
+    def __init__(self, host="127.0.0.1", port=8750, workers=4, token=None):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.token = token
+
+    @classmethod
+    def load(cls, path="ilms.ini"):
+        """Read the [server] section of an ini file, falling back to the defaults"""
+        config = cls()
+        if not os.path.exists(path):
+            return config
+
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if parser.has_section("server"):
+            section = parser["server"]
+            config.host = section.get("host", config.host)
+            config.port = section.getint("port", config.port)
+            config.workers = section.getint("workers", config.workers)
+            config.token = section.get("token", config.token) or None
+        return config
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode(value):
+    """Turn store results (namedtuples, tuples, lists) into JSON-ready values"""
+    if hasattr(value, "_asdict"):
+        return {k: encode(v) for k, v in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    return value
+
+
+def cursor_param(query):
+    """Decode the JSON keyset cursor of a list request"""
+    return json.loads(query["after"]) if query.get("after") else None
+
+
+def sort_params(query):
+    """Decode the optional sort order of a list request into LibraryStore keyword arguments"""
+    params = {}
+    if query.get("sort"):
+        params["sort"] = query["sort"]
+    if query.get("descending"):
+        params["descending"] = query["descending"] == "1"
+    return params
+
+
+def limit_param(query):
+    return int(query["limit"]) if query.get("limit") else None
+
+
+# --- HANDLERS ---
+# Each runs on a worker thread as handler(store, match, query, body) and returns (status, result)
+def get_info(store, match, query, body):
+    return 200, {"schema_version": SCHEMA_VERSION, "fts_enabled": store.fts_enabled}
+
+
+def authenticate(store, match, query, body):
+    result = store.authenticate(body["username"], body["password"])
+    if not result:
+        raise HTTPError(401, "Invalid Credentials")
+    return 200, {"librarian_id": result[0], "username": result[1]}
+
+
+def create_librarian(store, match, query, body):
+    return 201, {"librarian_id": store.create_librarian(body["username"], body["password"], body["name"])}
+
+
+def list_books(store, match, query, body):
+    fields = tuple(query["fields"].split(",")) if query.get("fields") else ("title", "author", "isbn")
+    return 200, store.list_books(query.get("search", ""), query.get("status"), fields,
+                                 cursor_param(query), limit_param(query), **sort_params(query))
+
+
+def book_totals(store, match, query, body):
+    return 200, store.book_totals(query.get("search", ""), query.get("status"))
+
+
+def search_books(store, match, query, body):
+    return 200, store.search_books(query.get("term", ""), query.get("field", "title"), limit_param(query))
+
+
+def catalogue_version(store, match, query, body):
+    return 200, {"version": store.catalogue_version()}
+
+
+def get_book(store, match, query, body):
+    return 200, store.get_book(int(match.group(1)))
+
+
+def get_book_by_isbn(store, match, query, body):
+    return 200, store.get_book_by_isbn(match.group(1))
+
+
+def add_book(store, match, query, body):
+    book_id = store.add_book(body["title"], body["author"], body["isbn"], body.get("publisher"),
+                             body.get("publication_year"), body.get("category"), body.get("copies", 1))
+    return 201, {"book_id": book_id}
+
+
+def update_book(store, match, query, body):
+    store.update_book(int(match.group(1)), body["title"], body["author"], body["isbn"], body.get("publisher"),
+                      body.get("publication_year"), body.get("category"), body["total_copies"])
+    return 200, None
+
+
+def similar_books(store, match, query, body):
+    return 200, store.similar_books(int(match.group(1)), int(query.get("limit", 10)))
+
+
+def delete_book(store, match, query, body):
+    store.delete_book(int(match.group(1)))
+    return 200, None
+
+
+def list_members(store, match, query, body):
+    return 200, store.list_members(query.get("search", ""), cursor_param(query), limit_param(query),
+                                   **sort_params(query))
+
+
+def get_member(store, match, query, body):
+    return 200, store.get_member(int(match.group(1)))
+
+
+def suggest_for_member(store, match, query, body):
+    return 200, store.suggest_for_member(int(match.group(1)), int(query.get("limit", 10)))
+
+
+def add_member(store, match, query, body):
+    return 201, {"member_id": store.add_member(body["name"], body.get("email"), body.get("phone"), body.get("address"))}
+
+
+def list_loans(store, match, query, body):
+    return 200, store.list_loans(query.get("search", ""), query.get("status"), cursor_param(query), limit_param(query),
+                                 **sort_params(query))
+
+
+def loan_totals(store, match, query, body):
+    return 200, store.loan_totals(query.get("search", ""), query.get("status"))
+
+
+def borrow_book(store, match, query, body):
+    book, member, due = store.borrow_book(int(body["member_id"]), int(body["book_id"]), int(body.get("days", 14)))
+    return 201, {"book": book, "member": member, "due_date": due}
+
+
+def return_book(store, match, query, body):
+    fine, days_late, hold = store.return_book(int(match.group(1)))
+    return 200, {"fine": fine, "days_late": days_late, "hold": hold}
+
+
+def borrow_books(store, match, query, body):
+    member, due, results = store.borrow_books(int(body["member_id"]), [int(i) for i in body["book_ids"]],
+                                              int(body.get("days", 14)))
+    return 201, {"member": member, "due_date": due, "results": results}
+
+
+def return_loans(store, match, query, body):
+    member_id = body.get("member_id")
+    return 200, store.return_loans([int(i) for i in body["transaction_ids"]],
+                                   int(member_id) if member_id is not None else None)
+
+
+def list_holds(store, match, query, body):
+    book_id, member_id = query.get("book_id"), query.get("member_id")
+    return 200, store.list_holds(int(book_id) if book_id else None, int(member_id) if member_id else None,
+                                 query.get("status"), limit_param(query))
+
+
+def get_hold(store, match, query, body):
+    return 200, store.get_hold(int(match.group(1)))
+
+
+def place_hold(store, match, query, body):
+    return 201, store.place_hold(int(body["member_id"]), int(body["book_id"]), int(body.get("priority", 0)))
+
+
+def cancel_hold(store, match, query, body):
+    return 200, {"passed_to": store.cancel_hold(int(match.group(1)))}
+
+
+def list_items(store, match, query, body):
+    return 200, store.list_items(int(match.group(1)))
+
+
+def scan_item(store, match, query, body):
+    return 200, store.scan_item(match.group(1))
+
+
+def borrow_item(store, match, query, body):
+    scan, member, due = store.borrow_item(int(body["member_id"]), match.group(1), int(body.get("days", 14)))
+    return 201, {"scan": scan, "member": member, "due_date": due}
+
+
+def return_item(store, match, query, body):
+    scan, fine, days_late, hold = store.return_item(match.group(1))
+    return 200, {"scan": scan, "fine": fine, "days_late": days_late, "hold": hold}
+
+
+def library_stats(store, match, query, body):
+    return 200, store.library_stats()
+
+
+def circulation_trend(store, match, query, body):
+    return 200, store.circulation_trend(query.get("start"), query.get("end"), query.get("by", "month"),
+                                        query.get("category"))
+
+
+def most_borrowed(store, match, query, body):
+    return 200, store.most_borrowed(query.get("period", ""), int(query.get("limit", 20)))
+
+
+def category_utilisation(store, match, query, body):
+    return 200, store.category_utilisation(query.get("start"), query.get("end"))
+
+
+ROUTES = [(method, re.compile(pattern + r"$"), handler) for method, pattern, handler in [
+    ("GET", r"/info", get_info),
+    ("POST", r"/auth", authenticate),
+    ("POST", r"/librarians", create_librarian),
+    ("GET", r"/books", list_books),
+    ("GET", r"/books/totals", book_totals),
+    ("GET", r"/books/search", search_books),
+    ("GET", r"/books/version", catalogue_version),
+    ("GET", r"/books/isbn/([^/]+)", get_book_by_isbn),
+    ("GET", r"/books/(\d+)", get_book),
+    ("GET", r"/books/(\d+)/items", list_items),
+    ("GET", r"/books/(\d+)/similar", similar_books),
+    ("PUT", r"/books/(\d+)", update_book),
+    ("DELETE", r"/books/(\d+)", delete_book),
+    ("POST", r"/books", add_book),
+    ("GET", r"/members", list_members),
+    ("GET", r"/members/(\d+)", get_member),
+    ("GET", r"/members/(\d+)/suggestions", suggest_for_member),
+    ("POST", r"/members", add_member),
+    ("GET", r"/loans", list_loans),
+    ("GET", r"/loans/totals", loan_totals),
+    ("POST", r"/loans", borrow_book),
+    ("POST", r"/loans/(\d+)/return", return_book),
+    ("POST", r"/loans/batch", borrow_books),
+    ("POST", r"/returns/batch", return_loans),
+    ("GET", r"/holds", list_holds),
+    ("GET", r"/holds/(\d+)", get_hold),
+    ("POST", r"/holds", place_hold),
+    ("POST", r"/holds/(\d+)/cancel", cancel_hold),
+    ("GET", r"/items/([^/]+)", scan_item),
+    ("POST", r"/items/([^/]+)/borrow", borrow_item),
+    ("POST", r"/items/([^/]+)/return", return_item),
+    ("GET", r"/stats", library_stats),
+    ("GET", r"/analytics/trend", circulation_trend),
+    ("GET", r"/analytics/top", most_borrowed),
+    ("GET", r"/analytics/categories", category_utilisation),
+]]
+
+
+def route(method, path):
+    """Return (handler, match) for a request, or raise HTTPError"""
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, match
+            allowed = True
+    raise HTTPError(405 if allowed else 404, f"{method} {path} is not supported")
+
+
+# --- SERVER ---
+class LibraryServer:
+    def __init__(self, db_name="library.db", config=None):
+        self.config = config or ServerConfig.load()
+        self.manager = ConnectionManager(db_name)
+        # Migrates the schema once before the workers open their connections
+        LibraryStore(manager=self.manager)
+        self.executor = QueryExecutor(lambda: LibraryStore(manager=self.manager), workers=self.config.workers)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                keep_alive = await self.handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: a malformed request line; the connection cannot be resynchronised
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request_line, reader, writer):
+        """Answer one request and return whether the connection stays open"""
+        method, target, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        try:
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY:
+                raise HTTPError(413, "Request body too large")
+            body = await reader.readexactly(length) if length else b""
+
+            if self.config.token and not hmac.compare_digest(headers.get("authorization", "").encode(),
+                                                             f"Bearer {self.config.token}".encode()):
+                raise HTTPError(401, "Missing or invalid API token")
+
+            url = urlsplit(target)
+            handler, match = route(method, unquote(url.path))
+            payload = json.loads(body) if body else {}
+            future = self.executor.submit(handler, match, dict(parse_qsl(url.query)), payload)
+            status, result = await asyncio.wrap_future(future)
+            response = encode(result)
+        except HTTPError as e:
+            status, response = e.status, {"error": str(e)}
+        except LibraryError as e:
+            status, response = 409, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            status, response = 409, {"error": str(e), "integrity": True}
+        except (KeyError, ValueError, TypeError) as e:
+            status, response = 400, {"error": f"Bad request: {e}"}
+        except Exception as e:
+            status, response = 500, {"error": str(e)}
+
+        data = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+        return keep_alive
+
+    async def serve(self, ready=None):
+        server = await asyncio.start_server(self.handle_connection, self.config.host, self.config.port)
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the ILMS library over a JSON HTTP API")
+    parser.add_argument("--db", default="library.db", help="library database (default: library.db)")
+    parser.add_argument("--host", help="address to listen on (default: from ilms.ini, else 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="port to listen on (default: from ilms.ini, else 8750)")
+    parser.add_argument("--workers", type=int, help="database worker threads (default: from ilms.ini, else 4)")
+    args = parser.parse_args()
+
+    config = ServerConfig.load()
+    config.host = args.host or config.host
+    config.port = args.port or config.port
+    config.workers = args.workers or config.workers
+
+    server = LibraryServer(args.db, config)
+    print(f"ILMS server for {args.db} listening on http://{config.host}:{config.port}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Concurrency stress test for ILMS circulation.
+
+Many desk threads, each with its own LibraryStore and connection, try to
+borrow the same title at the same moment while it has only a few copies,
+using borrow_book, borrow_books and borrow_item in turn. Then all the
+desks return the open loans at once, several desks to each loan. After
+each phase the run checks:
+
+    - exactly as many loans were issued as there were copies
+    - available_copies never dropped below zero (a monitor thread polls it)
+    - each loan was returned exactly once
+    - available_copies, the items, library_stats and member_stats all
+      agree with the open loans in the transactions table
+
+Runs against a scratch database in a temporary directory; the exit status
+is 1 if any check failed.
+
+Usage:
+    python stress_test.py
+    python stress_test.py --desks 64 --copies 3 --rounds 20
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import ConnectionManager
+from library_store import LibraryStore, LibraryError
+
+DESKS = 32
+COPIES = 3
+ROUNDS = 10
+
+
+class StressReport:
+    def __init__(self):
+        self.borrowed = 0
+        self.refused = 0
+        self.returned = 0
+        self.busy = 0
+        self.min_available = None
+        self.failures = []
+
+    def check(self, ok, message):
+        if not ok:
+            self.failures.append(message)
+
+    def summary(self):
+        lines = [f"Loans issued: {self.borrowed}, refused: {self.refused}, returned: {self.returned}, "
+                 f"timed out: {self.busy}",
+                 f"Lowest available_copies seen: {self.min_available}"]
+        if self.failures:
+            lines.append(f"FAILED {len(self.failures)} checks:")
+            lines.extend(f"  {failure}" for failure in self.failures)
+        else:
+            lines.append("All checks passed")
+        return "\n".join(lines)
+
+
+def open_loans(store, book_id):
+    store.cursor.execute("SELECT transaction_id, member_id FROM transactions WHERE book_id=? AND status='borrowed'",
+                         (book_id,))
+    return store.cursor.fetchall()
+
+
+def check_counters(store, book_id, copies, report, phase):
+    """Compare every counter kept for the title with its open loans"""
+    loans = open_loans(store, book_id)
+    book = store.get_book(book_id)
+    report.check(book.available_copies == copies - len(loans),
+                 f"{phase}: available_copies is {book.available_copies}, expected {copies - len(loans)}")
+
+    store.cursor.execute("SELECT COUNT(*) FROM items WHERE book_id=? AND status='on_loan'", (book_id,))
+    on_loan = store.cursor.fetchone()[0]
+    report.check(on_loan == len(loans), f"{phase}: {on_loan} items on loan for {len(loans)} open loans")
+
+    store.cursor.execute("SELECT COUNT(*) FROM transactions WHERE status='borrowed'")
+    actual = store.cursor.fetchone()[0]
+    stats = store.library_stats()
+    report.check(stats["open_loans"] == actual, f"{phase}: library_stats has {stats['open_loans']} open loans, "
+                                                f"transactions have {actual}")
+    report.check(stats["available_copies"] == book.available_copies,
+                 f"{phase}: library_stats has {stats['available_copies']} copies available, "
+                 f"books has {book.available_copies}")
+
+    store.cursor.execute('''SELECT s.member_id, s.open_loans, COUNT(t.transaction_id) FROM member_stats s
+                            LEFT JOIN transactions t ON t.member_id = s.member_id AND t.status = 'borrowed'
+                            GROUP BY s.member_id HAVING s.open_loans <> COUNT(t.transaction_id)''')
+    for member_id, counted, actual in store.cursor.fetchall():
+        report.failures.append(f"{phase}: member_stats has {counted} open loans for member {member_id}, "
+                               f"transactions have {actual}")
+
+
+def run_stress_test(path, desks=DESKS, copies=COPIES, rounds=ROUNDS, progress=None):
+    """Run the borrow and return races `rounds` times on a new database at path and return a StressReport"""
+    report = StressReport()
+    manager = ConnectionManager(path)
+    store = LibraryStore(manager=manager)
+    book_id = store.add_book("Stress Test", "ILMS", "0000000000", category="Test", copies=copies)
+    members = [store.add_member(f"Desk {n}", f"desk{n}@example.org", None, None) for n in range(desks)]
+    barcodes = [item.barcode for item in store.list_items(book_id)]
+
+    local = threading.local()
+    start = threading.Barrier(desks)
+    done = threading.Event()
+
+    def desk_store():
+        if getattr(local, "store", None) is None:
+            local.store = LibraryStore(manager=manager)   # one connection per desk thread
+        return local.store
+
+    def borrow(n):
+        desk = desk_store()
+        start.wait()
+        try:
+            # Each of the three ways the desk issues a copy takes part in the race
+            if n % 3 == 0:
+                desk.borrow_book(members[n], book_id)
+            elif n % 3 == 1:
+                result = desk.borrow_books(members[n], [book_id])[2][0]
+                if not result.ok:
+                    raise LibraryError(result.message)
+            else:
+                desk.borrow_item(members[n], barcodes[n % len(barcodes)])
+            return "borrowed"
+        except LibraryError:
+            return "refused"
+        except sqlite3.OperationalError:
+            return "busy"
+
+    def give_back(transaction_id):
+        desk = desk_store()
+        start.wait()
+        try:
+            desk.return_book(transaction_id)
+            return "returned"
+        except LibraryError:
+            return "refused"
+        except sqlite3.OperationalError:
+            return "busy"
+
+    def monitor():
+        watcher = LibraryStore(manager=manager)
+        try:
+            while not done.is_set():
+                available = watcher.get_book(book_id).available_copies
+                if report.min_available is None or available < report.min_available:
+                    report.min_available = available
+        finally:
+            watcher.close()
+
+    def close():
+        start.wait()
+        if getattr(local, "store", None) is not None:
+            local.store.close()
+
+    watcher = threading.Thread(target=monitor, name="stress-monitor")
+    watcher.start()
+    pool = ThreadPoolExecutor(max_workers=desks, thread_name_prefix="stress-desk")
+    try:
+        for round_number in range(1, rounds + 1):
+            outcomes = list(pool.map(borrow, range(desks)))
+            report.borrowed += outcomes.count("borrowed")
+            report.refused += outcomes.count("refused")
+            report.busy += outcomes.count("busy")
+            report.check(outcomes.count("borrowed") == copies,
+                         f"round {round_number}: {outcomes.count('borrowed')} loans issued for {copies} copies")
+            check_counters(store, book_id, copies, report, f"round {round_number} after borrowing")
+
+            # Every desk returns one of the loans, so several race for each and only one may close it;
+            # every desk must get a call, as each waits at the start barrier for the others
+            loans = [transaction_id for transaction_id, _ in open_loans(store, book_id)]
+            returns = [loans[n % len(loans)] for n in range(desks)] if loans else []
+            outcomes = list(pool.map(give_back, returns))
+            report.returned += outcomes.count("returned")
+            report.busy += outcomes.count("busy")
+            report.check(outcomes.count("returned") == len(loans),
+                         f"round {round_number}: {outcomes.count('returned')} returns for {len(loans)} loans")
+            check_counters(store, book_id, copies, report, f"round {round_number} after returning")
+            if progress:
+                progress(round_number, report)
+    finally:
+        done.set()
+        watcher.join()
+        list(pool.map(lambda _: close(), range(desks)))
+        pool.shutdown()
+        store.close()
+
+    report.check(report.min_available is not None and report.min_available >= 0,
+                 f"available_copies dropped to {report.min_available}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Race many desks for a title with few copies and check the counters")
+    parser.add_argument("--desks", type=int, default=DESKS, help=f"concurrent desk threads (default: {DESKS})")
+    parser.add_argument("--copies", type=int, default=COPIES, help=f"copies of the contested title (default: {COPIES})")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help=f"borrow and return races (default: {ROUNDS})")
+    args = parser.parse_args()
+    if args.copies >= args.desks:
+        parser.error("--copies must be fewer than --desks for the desks to compete")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        report = run_stress_test(os.path.join(scratch, "stress.db"), args.desks, args.copies, args.rounds,
+                                 progress=lambda n, r: print(f"\rround {n}/{args.rounds}", end=""))
+    print()
+    print(report.summary())
+    if report.failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()